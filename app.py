@@ -1,20 +1,373 @@
 
 import streamlit as st
+import hashlib
 import json
 import os
+from itertools import islice
+import pandas as pd
 from dotenv import load_dotenv
 from utils.risk_mapper import generate_risk_profile
-from utils.red_flag_engine import apply_red_flag_rules
+from utils.red_flag_engine import apply_red_flag_rules, apply_red_flag_rules_batch, compile_rules, RuleSyntaxError
 from utils.llm_extractor import extract_risk_profile_from_text
+from utils.async_extractor import estimate_tokens
+from utils.chunked_extractor import LONG_DOCUMENT_TOKENS, extract_risk_profile_chunked
 from utils.pdf_reader import extract_text_from_pdf
+from utils.json_stream import iter_json_records, open_record_writer
+from utils.profile_store import ProfileStore
+from utils.accumulation import ExposureAccumulator
+from utils.instrumentation import start_capture, stop_capture, summarize
 
 load_dotenv()
 
+SCORING_CHUNK_SIZE = 5000
+# Portfolio runs kept in the profile store; older ones are pruned after each Generate
+STORE_KEEP_RUNS = 10
+PAGE_SIZES = (25, 50, 100, 250)
+TIV_BANDS = [0, 1_000_000, 5_000_000, 10_000_000, 25_000_000, 50_000_000, float("inf")]
+TIV_BAND_LABELS = ["< $1M", "$1M–5M", "$5M–10M", "$10M–25M", "$25M–50M", "$50M+"]
+EXPOSURE_PATH = "output/exposure_accumulation.csv"
+TABLE_COLUMNS = ["Property", "State", "Construction", "Total TIV", "Sprinklers", "Fire Alarm", "Hazardous", "Flags", "Red Flags"]
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def load_schema(fingerprint, _data):
+    # Keyed on the content hash, so reruns and re-uploads of the same file reuse the parsed
+    # schema; the returned dict is shared between runs and must not be modified
+    return json.loads(_data)
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def load_rules(fingerprint, _data):
+    return compile_rules(json.loads(_data))
+
+
+def upload_fingerprint(upload):
+    return hashlib.sha256(upload.getvalue()).hexdigest() if upload is not None else None
+
+
+def score_text(text, pdf_file, schema, rules):
+    if pdf_file:
+        text = extract_text_from_pdf(pdf_file)
+
+    # Long documents are split into token-budgeted chunks so they fit the context window
+    if estimate_tokens(text) > LONG_DOCUMENT_TOKENS:
+        extracted_data = extract_risk_profile_chunked(text, schema)
+    else:
+        extracted_data = extract_risk_profile_from_text(text, schema)
+    risk_profile = generate_risk_profile(extracted_data, schema)
+    profile_with_flags = apply_red_flag_rules(risk_profile, rules)
+
+    # Save to output
+    os.makedirs("output", exist_ok=True)
+    with open("output/risk_profiles.json", "w") as f:
+        json.dump([profile_with_flags.to_dict()], f, indent=2)
+    return profile_with_flags
+
+
+def score_submissions(submissions_file, schema, rules):
+    # Read, score and save submissions in chunks so the upload is never parsed
+    # or written out in one piece, and a failed run keeps what was already scored.
+    # Each chunk is also one transaction into the profile store, which keeps the
+    # latest STORE_KEEP_RUNS runs and precomputes a run's flag aggregates when it finishes. TIV
+    # accumulation is built up per chunk while the submissions' Location blocks are at hand.
+    # Only the summary table is kept; detail views read single profiles back from the store
+    submissions_file.seek(0)
+    submissions = iter_json_records(submissions_file)
+    summaries = []
+    scored = 0
+    exposure = ExposureAccumulator()
+    with ProfileStore() as store, store.start_run(rules, source=submissions_file.name) as run, \
+            open_record_writer("output/risk_profiles.json", indent=2) as writer:
+        while True:
+            batch = list(islice(submissions, SCORING_CHUNK_SIZE))
+            if not batch:
+                break
+            chunk = [generate_risk_profile(submission, schema) for submission in batch]
+            apply_red_flag_rules_batch(chunk, rules)
+            writer.write_many(chunk)
+            run.write_many(chunk)
+            exposure.add_many(chunk, batch)
+            summaries.append(build_summary(chunk, start=scored + 1))
+            scored += len(chunk)
+    with ProfileStore() as store:
+        store.prune(keep=STORE_KEEP_RUNS)
+    exposure.export(EXPOSURE_PATH)
+    summary = pd.concat(summaries) if summaries else build_summary([])
+    return summary, run.run_id, exposure
+
+
+def load_run_aggregates(run_id):
+    """The stored run's totals and per-flag counts / TIV at risk, read from its precomputed aggregates."""
+    with ProfileStore() as store:
+        totals = store.run_summary(run_id)
+        counts = store.flag_counts(run_id)
+        tiv = store.tiv_at_risk(run_id)
+        by_category = store.flag_counts(run_id, by="category")
+    breakdown = pd.DataFrame({
+        "Category": {flag: category for (category, flag) in by_category},
+        "Occurrences": counts,
+        "TIV at Risk": tiv,
+    }).rename_axis("Flag").sort_values("Occurrences", ascending=False)
+    return totals, breakdown
+
+
+def show_profile(profile):
+    # Display summary with red flags highlighted
+    st.markdown("### 🔍 Risk Profile Summary")
+    
+    # Create columns for better layout
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.markdown("#### 📋 Property Information")
+        if profile.get("Property Name"):
+            st.write(f"**Property:** {profile['Property Name']}")
+        if profile.get("Property Address"):
+            st.write(f"**Address:** {profile['Property Address']}")
+        if profile.get("State"):
+            st.write(f"**State:** {profile['State']}")
+        if profile.get("Year Built"):
+            st.write(f"**Year Built:** {profile['Year Built']}")
+        if profile.get("Construction Type"):
+            st.write(f"**Construction:** {profile['Construction Type']}")
+        if profile.get("Total TIV"):
+            st.write(f"**Total TIV:** {profile['Total TIV']}")
+    
+    with col2:
+        st.markdown("#### 🛡️ Safety & Protection")
+        sprinkler = profile.get("Sprinkler System (Y/N)", "Unknown")
+        fire_alarm = profile.get("Fire Alarm (Y/N)", "Unknown")
+        hazardous = profile.get("Hazardous Materials (Y/N)", "Unknown")
+        
+        # Color code the safety indicators
+        sprinkler_color = "🔴" if sprinkler == "No" else "🟢"
+        fire_alarm_color = "🔴" if fire_alarm == "No" else "🟢"
+        hazardous_color = "🔴" if hazardous == "Yes" else "🟢"
+        
+        st.write(f"**Sprinkler System:** {sprinkler_color} {sprinkler}")
+        st.write(f"**Fire Alarm:** {fire_alarm_color} {fire_alarm}")
+        st.write(f"**Hazardous Materials:** {hazardous_color} {hazardous}")
+        
+        if profile.get("Flood Zone (e.g., Zone X, AE)"):
+            flood_zone = profile["Flood Zone (e.g., Zone X, AE)"]
+            flood_color = "🔴" if flood_zone in ["AE", "VE", "A"] else "🟢"
+            st.write(f"**Flood Zone:** {flood_color} {flood_zone}")
+        
+        if profile.get("Earthquake Exposure (Low/Moderate/High or ShakeMap Zone)"):
+            earthquake = profile["Earthquake Exposure (Low/Moderate/High or ShakeMap Zone)"]
+            earthquake_color = "🔴" if earthquake == "High" else "🟢"
+            st.write(f"**Earthquake Exposure:** {earthquake_color} {earthquake}")
+
+    # Display red flags prominently
+    red_flags = profile.get("Red Flags", [])
+    if red_flags:
+        st.markdown("### 🔴 Risk Flags Identified")
+        for i, flag in enumerate(red_flags, 1):
+            st.markdown(f"**{i}.** {flag}")
+        
+        st.markdown(f"**Total Risk Flags:** {len(red_flags)}")
+    else:
+        st.markdown("### ✅ No Risk Flags Identified")
+        st.success("This property appears to have no significant risk flags based on the current assessment.")
+
+    # Show detailed JSON in expander
+    with st.expander("📄 View Detailed Risk Profile (JSON)"):
+        st.json(profile.to_dict())
+
+
+def load_profile(run_id, position):
+    with ProfileStore() as store:
+        return store.profile(position, run_id)
+
+
+def build_summary(profiles, start=1):
+    """One row per property with the columns the results table shows, filters and sorts on, numbered from `start`."""
+    summary = pd.DataFrame({
+        "Property": [profile.get("Property Name") or "Unknown" for profile in profiles],
+        "State": [profile.get("State") or "" for profile in profiles],
+        "Construction": [profile.get("Construction Type") or "" for profile in profiles],
+        "Total TIV": pd.to_numeric([profile.get("Total TIV") for profile in profiles], errors="coerce"),
+        "Sprinklers": [profile.get("Sprinkler System (Y/N)", "Unknown") for profile in profiles],
+        "Fire Alarm": [profile.get("Fire Alarm (Y/N)", "Unknown") for profile in profiles],
+        "Hazardous": [profile.get("Hazardous Materials (Y/N)", "Unknown") for profile in profiles],
+        "Red Flags": [profile.get("Red Flags", []) for profile in profiles],
+    })
+    summary.index = pd.RangeIndex(start, start + len(summary), name="#")
+    summary["Flags"] = summary["Red Flags"].map(len)
+    summary["TIV Band"] = pd.cut(summary["Total TIV"], TIV_BANDS, labels=TIV_BAND_LABELS, right=False)
+    return summary
+
+
+def show_property_details(profile):
+    # Create columns for property info
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.markdown("**Property Details:**")
+        if profile.get("State"):
+            st.write(f"• Location: {profile['State']}")
+        if profile.get("Construction Type"):
+            st.write(f"• Construction: {profile['Construction Type']}")
+        if profile.get("Total TIV"):
+            st.write(f"• Total TIV: {profile['Total TIV']}")
+    
+    with col2:
+        st.markdown("**Safety Status:**")
+        sprinkler = profile.get("Sprinkler System (Y/N)", "Unknown")
+        fire_alarm = profile.get("Fire Alarm (Y/N)", "Unknown")
+        hazardous = profile.get("Hazardous Materials (Y/N)", "Unknown")
+        
+        sprinkler_color = "🔴" if sprinkler == "No" else "🟢"
+        fire_alarm_color = "🔴" if fire_alarm == "No" else "🟢"
+        hazardous_color = "🔴" if hazardous == "Yes" else "🟢"
+        
+        st.write(f"• Sprinklers: {sprinkler_color} {sprinkler}")
+        st.write(f"• Fire Alarm: {fire_alarm_color} {fire_alarm}")
+        st.write(f"• Hazardous: {hazardous_color} {hazardous}")
+    
+    # Display red flags for this property
+    red_flags = profile.get("Red Flags", [])
+    if red_flags:
+        st.markdown("**🔴 Risk Flags:**")
+        for flag in red_flags:
+            st.markdown(f"• {flag}")
+    else:
+        st.markdown("**✅ No Risk Flags**")
+
+    with st.expander("📄 View Detailed Risk Profile (JSON)"):
+        st.json(profile.to_dict())
+
+
+def show_exposure(exposure):
+    st.markdown("---")
+    st.markdown("### 🌊 Exposure Concentration")
+    st.caption(f"Total TIV by hazard zone and location across {exposure.locations:,} locations")
+
+    exposure_cols = st.columns(2)
+    with exposure_cols[0]:
+        dimension = st.selectbox("Concentration by", list(exposure.dimensions))
+    with exposure_cols[1]:
+        top_n = st.number_input("Top", min_value=1, max_value=1000, value=10)
+    st.dataframe(
+        pd.DataFrame(exposure.top(dimension, top_n)).drop(columns="Dimension").set_index("Value"),
+        use_container_width=True,
+        column_config={
+            "Total TIV": st.column_config.NumberColumn(format="$%d"),
+            "Share of TIV": st.column_config.ProgressColumn(min_value=0.0, max_value=1.0, format="%.3f"),
+        },
+    )
+    with open(EXPOSURE_PATH, "rb") as f:
+        st.download_button("Download all concentrations (CSV)", f.read(), file_name="exposure_accumulation.csv",
+                           mime="text/csv")
+
+
+def show_portfolio(summary, run_id):
+    st.markdown("### 📊 Multiple Property Risk Assessment")
+
+    # Flag membership as one long Series (row label repeated per flag), so the
+    # flag filter doesn't loop over profiles in Python
+    flags = summary["Red Flags"].explode().dropna()
+
+    # Filters and sorting run on the summary table; only the current page is rendered
+    filter_cols = st.columns(3)
+    with filter_cols[0]:
+        selected_flags = st.multiselect("Flag", sorted(flags.unique()))
+    with filter_cols[1]:
+        selected_states = st.multiselect("State", sorted(summary["State"].unique()))
+    with filter_cols[2]:
+        selected_bands = st.multiselect("TIV band", TIV_BAND_LABELS)
+
+    view = summary
+    if selected_flags:
+        view = view.loc[view.index.isin(flags.index[flags.isin(selected_flags)])]
+    if selected_states:
+        view = view[view["State"].isin(selected_states)]
+    if selected_bands:
+        view = view[view["TIV Band"].isin(selected_bands)]
+
+    sort_cols = st.columns(4)
+    with sort_cols[0]:
+        sort_by = st.selectbox("Sort by", ["#", "Property", "State", "Total TIV", "Flags"])
+    with sort_cols[1]:
+        descending = st.toggle("Descending", value=False)
+    with sort_cols[2]:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES)
+    page_count = max(1, -(-len(view) // page_size))
+    with sort_cols[3]:
+        page = st.number_input(f"Page (of {page_count:,})", min_value=1, max_value=page_count, value=1)
+
+    if sort_by == "#":
+        view = view.sort_index(ascending=not descending)
+    else:
+        view = view.sort_values(sort_by, ascending=not descending, kind="stable", na_position="last")
+    page_rows = view.iloc[(page - 1) * page_size:page * page_size]
+
+    st.caption(f"{len(view):,} of {len(summary):,} properties match")
+    st.dataframe(
+        page_rows[TABLE_COLUMNS],
+        use_container_width=True,
+        column_config={"Total TIV": st.column_config.NumberColumn(format="$%d")},
+    )
+
+    # Details are only built for the one property picked from the current page
+    selected = st.selectbox(
+        "Show details for",
+        page_rows.index,
+        index=None,
+        format_func=lambda row: f"{row}: {summary.at[row, 'Property']}",
+        placeholder="Choose a property on this page",
+    )
+    if selected is not None:
+        st.markdown(f"#### 🏢 Property {selected}: {summary.at[selected, 'Property']}")
+        profile = load_profile(run_id, selected - 1)
+        if profile is None:
+            st.warning("This run has been pruned from the profile store; generate it again to see details.")
+        else:
+            show_property_details(profile)
+
+    # Overall summary, straight from the aggregates the profile store computed for this run
+    st.markdown("---")
+    st.markdown("### 📈 Overall Assessment Summary")
+    
+    totals, breakdown = load_run_aggregates(run_id)
+    total_flags = int(totals["total_flags"])
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Properties Assessed", totals["profiles"])
+    with col2:
+        st.metric("Properties with Risk Flags", totals["flagged_profiles"])
+    with col3:
+        st.metric("Total Risk Flags", total_flags)
+    with col4:
+        st.metric("Total TIV", f"${totals['total_tiv']:,.0f}")
+    
+    # Flag breakdown
+    if total_flags > 0:
+        st.markdown("**Risk Flag Breakdown:**")
+        st.dataframe(
+            breakdown,
+            use_container_width=True,
+            column_config={"TIV at Risk": st.column_config.NumberColumn(format="$%d")},
+        )
+
+
+def show_diagnostics_panel(stage_rows, rule_rows):
+    with st.expander("⏱️ Pipeline Diagnostics", expanded=True):
+        if stage_rows:
+            st.dataframe(stage_rows, use_container_width=True)
+        else:
+            st.write("No pipeline stages ran.")
+        if rule_rows:
+            st.markdown("**Per-rule evaluation cost:**")
+            st.dataframe(rule_rows, use_container_width=True)
+
+
 st.set_page_config(layout="wide")
 st.title("🏢 CoPRIA - Commercial Property Risk Intelligence Assistant")
 
 st.markdown("### Upload Input Files")
-submissions_file = st.file_uploader("Upload Submissions JSON", type="json")
+submissions_file = st.file_uploader("Upload Submissions JSON", type=["json", "jsonl"])
 schema_file = st.file_uploader("Upload Risk Profile Schema JSON", type="json")
 rules_file = st.file_uploader("Upload Red Flag Rules JSON", type="json")
 
@@ -25,173 +378,50 @@ pdf_file = st.file_uploader("Or Upload Submission PDF", type=["pdf"])
 
 st.markdown("---")
 st.markdown("### Generate Risk Profiles")
+show_diagnostics = st.sidebar.checkbox("Show pipeline diagnostics", value=False)
 
 if st.button("Generate"):
-    if not schema_file or not rules_file:
-        st.error("Please upload both schema and red flag rules files.")
-    else:
-        schema = json.load(schema_file)
-        rules = json.load(rules_file)
-
-        if submission_text or pdf_file:
-            text = submission_text
-            if pdf_file:
-                text = extract_text_from_pdf(pdf_file)
-
-            extracted_data = extract_risk_profile_from_text(text, schema)
-            risk_profile = generate_risk_profile(extracted_data, schema)
-            profile_with_flags = apply_red_flag_rules(risk_profile, rules)
-
-            # Display summary with red flags highlighted
-            st.markdown("### 🔍 Risk Profile Summary")
-            
-            # Create columns for better layout
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.markdown("#### 📋 Property Information")
-                if profile_with_flags.get("Property Name"):
-                    st.write(f"**Property:** {profile_with_flags['Property Name']}")
-                if profile_with_flags.get("Property Address"):
-                    st.write(f"**Address:** {profile_with_flags['Property Address']}")
-                if profile_with_flags.get("State"):
-                    st.write(f"**State:** {profile_with_flags['State']}")
-                if profile_with_flags.get("Year Built"):
-                    st.write(f"**Year Built:** {profile_with_flags['Year Built']}")
-                if profile_with_flags.get("Construction Type"):
-                    st.write(f"**Construction:** {profile_with_flags['Construction Type']}")
-                if profile_with_flags.get("Total TIV"):
-                    st.write(f"**Total TIV:** {profile_with_flags['Total TIV']}")
-            
-            with col2:
-                st.markdown("#### 🛡️ Safety & Protection")
-                sprinkler = profile_with_flags.get("Sprinkler System (Y/N)", "Unknown")
-                fire_alarm = profile_with_flags.get("Fire Alarm (Y/N)", "Unknown")
-                hazardous = profile_with_flags.get("Hazardous Materials (Y/N)", "Unknown")
-                
-                # Color code the safety indicators
-                sprinkler_color = "🔴" if sprinkler == "No" else "🟢"
-                fire_alarm_color = "🔴" if fire_alarm == "No" else "🟢"
-                hazardous_color = "🔴" if hazardous == "Yes" else "🟢"
-                
-                st.write(f"**Sprinkler System:** {sprinkler_color} {sprinkler}")
-                st.write(f"**Fire Alarm:** {fire_alarm_color} {fire_alarm}")
-                st.write(f"**Hazardous Materials:** {hazardous_color} {hazardous}")
-                
-                if profile_with_flags.get("Flood Zone (e.g., Zone X, AE)"):
-                    flood_zone = profile_with_flags["Flood Zone (e.g., Zone X, AE)"]
-                    flood_color = "🔴" if flood_zone in ["AE", "VE", "A"] else "🟢"
-                    st.write(f"**Flood Zone:** {flood_color} {flood_zone}")
-                
-                if profile_with_flags.get("Earthquake Exposure (Low/Moderate/High or ShakeMap Zone)"):
-                    earthquake = profile_with_flags["Earthquake Exposure (Low/Moderate/High or ShakeMap Zone)"]
-                    earthquake_color = "🔴" if earthquake == "High" else "🟢"
-                    st.write(f"**Earthquake Exposure:** {earthquake_color} {earthquake}")
-
-            # Display red flags prominently
-            red_flags = profile_with_flags.get("Red Flags", [])
-            if red_flags:
-                st.markdown("### 🔴 Risk Flags Identified")
-                for i, flag in enumerate(red_flags, 1):
-                    st.markdown(f"**{i}.** {flag}")
-                
-                st.markdown(f"**Total Risk Flags:** {len(red_flags)}")
-            else:
-                st.markdown("### ✅ No Risk Flags Identified")
-                st.success("This property appears to have no significant risk flags based on the current assessment.")
-
-            # Show detailed JSON in expander
-            with st.expander("📄 View Detailed Risk Profile (JSON)"):
-                st.json(profile_with_flags)
-
-            # Save to output
-            os.makedirs("output", exist_ok=True)
-            with open("output/risk_profiles.json", "w") as f:
-                json.dump([profile_with_flags], f, indent=2)
-
-        elif submissions_file:
-            submissions = json.load(submissions_file)
-            profiles = []
-
-            st.markdown("### 📊 Multiple Property Risk Assessment")
-            
-            # Process all submissions
-            for i, submission in enumerate(submissions):
-                risk_profile = generate_risk_profile(submission, schema)
-                profile_with_flags = apply_red_flag_rules(risk_profile, rules)
-                profiles.append(profile_with_flags)
-
-            # Display summary for each property
-            for i, profile in enumerate(profiles):
-                st.markdown(f"---")
-                st.markdown(f"#### 🏢 Property {i+1}: {profile.get('Property Name', 'Unknown')}")
-                
-                # Create columns for property info
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.markdown("**Property Details:**")
-                    if profile.get("State"):
-                        st.write(f"• Location: {profile['State']}")
-                    if profile.get("Construction Type"):
-                        st.write(f"• Construction: {profile['Construction Type']}")
-                    if profile.get("Total TIV"):
-                        st.write(f"• Total TIV: {profile['Total TIV']}")
-                
-                with col2:
-                    st.markdown("**Safety Status:**")
-                    sprinkler = profile.get("Sprinkler System (Y/N)", "Unknown")
-                    fire_alarm = profile.get("Fire Alarm (Y/N)", "Unknown")
-                    hazardous = profile.get("Hazardous Materials (Y/N)", "Unknown")
-                    
-                    sprinkler_color = "🔴" if sprinkler == "No" else "🟢"
-                    fire_alarm_color = "🔴" if fire_alarm == "No" else "🟢"
-                    hazardous_color = "🔴" if hazardous == "Yes" else "🟢"
-                    
-                    st.write(f"• Sprinklers: {sprinkler_color} {sprinkler}")
-                    st.write(f"• Fire Alarm: {fire_alarm_color} {fire_alarm}")
-                    st.write(f"• Hazardous: {hazardous_color} {hazardous}")
-                
-                # Display red flags for this property
-                red_flags = profile.get("Red Flags", [])
-                if red_flags:
-                    st.markdown("**🔴 Risk Flags:**")
-                    for flag in red_flags:
-                        st.markdown(f"• {flag}")
-                else:
-                    st.markdown("**✅ No Risk Flags**")
-
-            # Overall summary
-            st.markdown("---")
-            st.markdown("### 📈 Overall Assessment Summary")
-            
-            total_properties = len(profiles)
-            total_flags = sum(len(profile.get("Red Flags", [])) for profile in profiles)
-            properties_with_flags = sum(1 for profile in profiles if profile.get("Red Flags"))
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("Properties Assessed", total_properties)
-            with col2:
-                st.metric("Properties with Risk Flags", properties_with_flags)
-            with col3:
-                st.metric("Total Risk Flags", total_flags)
-            
-            # Flag breakdown
-            if total_flags > 0:
-                st.markdown("**Risk Flag Breakdown:**")
-                flag_counts = {}
-                for profile in profiles:
-                    for flag in profile.get("Red Flags", []):
-                        flag_counts[flag] = flag_counts.get(flag, 0) + 1
-                
-                for flag, count in flag_counts.items():
-                    st.write(f"• {flag}: {count} occurrence(s)")
-
-            # Save to output
-            os.makedirs("output", exist_ok=True)
-            with open("output/risk_profiles.json", "w") as f:
-                json.dump(profiles, f, indent=2)
+    # Stage timings are only recorded when the diagnostics panel is switched on
+    diagnostics_sink = start_capture() if show_diagnostics else None
 
+    try:
+        if not schema_file or not rules_file:
+            st.error("Please upload both schema and red flag rules files.")
         else:
-            st.warning("Please upload a submission file or paste/upload text.")
+            schema_key = upload_fingerprint(schema_file)
+            rules_key = upload_fingerprint(rules_file)
+            schema = load_schema(schema_key, schema_file.getvalue())
+            try:
+                rules = load_rules(rules_key, rules_file.getvalue())
+            except RuleSyntaxError as e:
+                st.error(f"Invalid red flag rules: {e}")
+                st.stop()
+
+            # Results live in session state, so reruns (widget changes, display options) redraw
+            # them without scoring again; a Generate click always scores afresh, so a failed
+            # extraction can be retried and the diagnostics panel shows the run just made
+            if submission_text or pdf_file:
+                profile = score_text(submission_text, pdf_file, schema, rules)
+                st.session_state["results"] = {"profile": profile}
+            elif submissions_file:
+                summary, run_id, exposure = score_submissions(submissions_file, schema, rules)
+                st.session_state["results"] = {"summary": summary, "run_id": run_id, "exposure": exposure}
+            else:
+                st.session_state.pop("results", None)
+                st.warning("Please upload a submission file or paste/upload text.")
+    finally:
+        # Always detach the sink, even when st.stop() ends the run early
+        if diagnostics_sink is not None:
+            stop_capture(diagnostics_sink)
+            st.session_state["diagnostics"] = summarize(diagnostics_sink.records)
+
+results = st.session_state.get("results")
+if results is not None:
+    if "profile" in results:
+        show_profile(results["profile"])
+    else:
+        show_portfolio(results["summary"], results["run_id"])
+        show_exposure(results["exposure"])
+
+if show_diagnostics and "diagnostics" in st.session_state:
+    show_diagnostics_panel(*st.session_state["diagnostics"])
@@ -0,0 +1,85 @@
+"""Compare recursive nested lookups with the one-pass field index.
+
+    python -m benchmarks.bench_field_index --records 100000
+"""
+import argparse
+import copy
+import json
+import time
+
+from utils.risk_mapper import build_field_index, generate_risk_profile
+
+# Keys generate_risk_profile looks up on top of the schema fields
+EXTRA_LOOKUPS = [
+    "Total Insured Value (USD)",
+    "Fire Protection", "Protection",
+    "Fire Protection", "Protection",
+    "Natural Hazard Exposure", "Natural Hazard Exposure", "Natural Hazard Exposure",
+    "Construction",
+    "Occupancy",
+]
+
+
+def recursive_lookup(data, key_path):
+    # The search generate_risk_profile ran for every lookup before the index existed
+    if key_path in data:
+        return data[key_path]
+    for value in data.values():
+        if isinstance(value, dict):
+            if key_path in value:
+                return value[key_path]
+            nested_result = recursive_lookup(value, key_path)
+            if nested_result is not None:
+                return nested_result
+    return None
+
+
+def replicate(submissions, records):
+    return [copy.deepcopy(submissions[i % len(submissions)]) for i in range(records)]
+
+
+def timed(label, func, records):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed:8.3f}s  {records / elapsed:12,.0f} records/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--submissions", default="data/usa_property_submissions.json")
+    parser.add_argument("--schema", default="data/mvp_risk_profile_schema.json")
+    args = parser.parse_args()
+
+    with open(args.submissions) as f:
+        submissions = replicate(json.load(f), args.records)
+    with open(args.schema) as f:
+        schema = json.load(f)
+    keys = [field for section in schema.values() for field in section] + EXTRA_LOOKUPS
+
+    def run_recursive():
+        for submission in submissions:
+            for key in keys:
+                recursive_lookup(submission, key)
+
+    def run_indexed():
+        for submission in submissions:
+            lookup = build_field_index(submission).get
+            for key in keys:
+                lookup(key)
+
+    def run_mapper():
+        for submission in submissions:
+            generate_risk_profile(submission, schema)
+
+    print(f"{args.records:,} submissions, {len(keys)} lookups each")
+    recursive = timed("recursive lookups", run_recursive, args.records)
+    indexed = timed("field index lookups", run_indexed, args.records)
+    timed("generate_risk_profile", run_mapper, args.records)
+    print(f"lookup speedup: {recursive / indexed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Time and memory-profile each pipeline stage on synthetic data.
+
+    python -m benchmarks.run --sizes 1000 10000 100000 --out bench.json
+    python -m benchmarks.run --compare bench.json        # fails on regressions
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic import generate_pdf, generate_submissions
+from utils.pdf_reader import extract_text_from_pdf
+from utils.red_flag_engine import apply_red_flag_rules, apply_red_flag_rules_batch, compile_rules, rule_fields
+from utils.risk_mapper import generate_risk_profile
+
+SCHEMA_PATH = "data/mvp_risk_profile_schema.json"
+RULES_PATH = "data/red_flag_rules.json"
+
+
+def _map(context):
+    schema = context["schema"]
+    return [generate_risk_profile(submission, schema) for submission in context["submissions"]]
+
+
+def _map_rules_only(context):
+    schema = context["schema"]
+    fields = rule_fields(context["rules"])
+    return [generate_risk_profile(submission, schema, fields) for submission in context["submissions"]]
+
+
+def _rules_scalar(context):
+    rules = context["rules"]
+    for profile in context["profiles"]:
+        apply_red_flag_rules(profile, rules)
+
+
+def _rules_batch(context):
+    apply_red_flag_rules_batch(context["profiles"], context["rules"])
+
+
+def _pdf_text(context):
+    extract_text_from_pdf(context["pdf_path"], cache_dir=None)
+
+
+# name -> (stage function, what one "record" is)
+SCENARIOS = {
+    "map": (_map, "submission"),
+    "map_rules_only": (_map_rules_only, "submission"),
+    "rules_scalar": (_rules_scalar, "profile"),
+    "rules_batch": (_rules_batch, "profile"),
+    "pdf_text": (_pdf_text, "page"),
+}
+
+
+def measure(func, context, records, repeat, track_memory):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(context)
+        timings.append(time.perf_counter() - start)
+    seconds = min(timings)
+    result = {"seconds": seconds, "records_per_second": records / seconds if seconds else None}
+    if track_memory:
+        # Separate pass, since tracemalloc itself slows the stage down
+        tracemalloc.start()
+        func(context)
+        result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def run(args):
+    with open(SCHEMA_PATH) as f:
+        schema = json.load(f)
+    with open(RULES_PATH) as f:
+        rules = compile_rules(json.load(f))
+
+    results = []
+    for size in args.sizes:
+        submissions = list(generate_submissions(size, args.seed, args.nesting, args.coverage))
+        context = {"schema": schema, "rules": rules, "submissions": submissions}
+        context["profiles"] = _map(context)
+        for name in args.scenarios:
+            if name == "pdf_text":
+                continue
+            func, unit = SCENARIOS[name]
+            if name == "rules_scalar" and size > args.scalar_limit:
+                continue
+            result = measure(func, context, size, args.repeat, not args.no_memory)
+            results.append(dict(scenario=name, size=size, unit=unit, **result))
+            _print_result(results[-1])
+
+    if "pdf_text" in args.scenarios:
+        with tempfile.TemporaryDirectory() as directory:
+            for pages in args.pdf_pages:
+                path = os.path.join(directory, f"synthetic_{pages}.pdf")
+                generate_pdf(path, pages, args.seed)
+                result = measure(_pdf_text, {"pdf_path": path}, pages, args.repeat, not args.no_memory)
+                results.append(dict(scenario="pdf_text", size=pages, unit="page", **result))
+                _print_result(results[-1])
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "nesting": args.nesting,
+            "coverage": args.coverage,
+        },
+        "results": results,
+    }
+
+
+def _print_result(result):
+    memory = result.get("peak_memory_bytes")
+    memory = f"{memory / 1e6:9.1f} MB" if memory is not None else ""
+    print(f"{result['scenario']:<14} {result['size']:>9,} {result['unit']}s  {result['seconds']:9.3f}s  "
+          f"{result['records_per_second']:>12,.0f}/s  {memory}")
+
+
+def compare(current, baseline, threshold):
+    """Return the (scenario, size, old seconds, new seconds) entries that got slower than `threshold` allows."""
+    previous = {(r["scenario"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get((result["scenario"], result["size"]))
+        if old and result["seconds"] > old["seconds"] * (1 + threshold):
+            regressions.append((result["scenario"], result["size"], old["seconds"], result["seconds"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--pdf-pages", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--nesting", type=int, default=0, help="extra wrapper levels around nested blocks")
+    parser.add_argument("--coverage", type=float, default=1.0, help="chance each optional field is present")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per scenario; the fastest is kept")
+    parser.add_argument("--scalar-limit", type=int, default=100_000, help="largest size for rules_scalar")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before a regression (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    current = run(args)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(current, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(current, json.load(f), args.threshold)
+        for scenario, size, old, new in regressions:
+            print(f"REGRESSION {scenario} @ {size:,}: {old:.3f}s -> {new:.3f}s ({new / old - 1:+.0%})")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
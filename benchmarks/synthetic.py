@@ -0,0 +1,116 @@
+"""Seeded synthetic submissions and PDFs modeled on data/usa_property_submissions.json."""
+import json
+import random
+
+STATES = ["TX", "CA", "FL", "NY", "CO", "IL", "WA", "LA", "GA", "AZ"]
+CITIES = ["Houston", "Los Angeles", "Miami", "Buffalo", "Denver", "Chicago", "Seattle", "New Orleans", "Atlanta", "Phoenix"]
+CONSTRUCTION = [
+    "Metal Frame with concrete walls", "Steel frame with curtain wall system", "Wood frame",
+    "Joisted masonry", "Reinforced concrete", "Tilt-up concrete panels",
+]
+OCCUPANCY = ["Logistics and storage", "Professional offices", "Retail", "Light manufacturing", "Cold storage", "Hotel"]
+PROTECTION = [
+    "Full sprinkler coverage, dual alarm systems, fire-rated stairwells.",
+    "Partial sprinkler coverage and central station fire alarm.",
+    "Basic fire alarms only.",
+    "Fire extinguishers on each floor.",
+    "",
+]
+HAZARDS = [
+    "Located in Zone AE flood plain; moderate wildfire exposure.",
+    "Zone X; seismic risk low, snow and ice exposure in winter months.",
+    "High earthquake exposure near fault line.",
+    "Moderate wildfire and hail exposure.",
+    "Hurricane-prone coastal area, Zone VE.",
+]
+RISK_FACTORS = [
+    "Stores lithium batteries and flammable liquids.",
+    "High foot traffic, underground parking, elevators and HVAC centralized systems.",
+    "Hazardous chemicals stored in rear warehouse.",
+    "24/7 operations with forklift charging stations.",
+]
+LOSS_HISTORY = [
+    "No claims in the last 10 years.",
+    "One water damage claim in 2019 totaling $85,000.",
+    "Two fire claims in the last 5 years totaling $420,000.",
+]
+
+
+def _wrap(value, depth):
+    # Push a block further down the tree to exercise nested lookups
+    for level in range(depth):
+        value = {f"Level {level}": value}
+    return value
+
+
+def make_submission(rng, index, nesting=0, coverage=1.0):
+    """Build one submission; `nesting` adds wrapper levels and `coverage` is the chance each optional block is present."""
+    state = rng.randrange(len(STATES))
+    submission = {
+        "Property Name": f"Synthetic Property {index}",
+        "Location": _wrap({
+            "Address": f"{rng.randint(1, 9999)} Main St",
+            "City": CITIES[state],
+            "State": STATES[state],
+            "ZIP": f"{rng.randint(10000, 99999)}",
+        }, nesting),
+        "Total Insured Value (USD)": rng.randrange(500_000, 50_000_000, 50_000),
+    }
+    optional = {
+        "Property Description": lambda: f"{rng.randint(1, 40)}-story building. Built in {rng.randint(1950, 2022)}.",
+        "Occupancy Details": lambda: rng.choice(OCCUPANCY),
+        "COPE": lambda: _wrap({
+            "Construction": rng.choice(CONSTRUCTION),
+            "Occupancy": rng.choice(OCCUPANCY),
+            "Protection": rng.choice(PROTECTION),
+            "Exposure": "Adjacent to mixed-use buildings",
+        }, nesting),
+        "Loss History": lambda: rng.choice(LOSS_HISTORY),
+        "Risk Factors": lambda: rng.choice(RISK_FACTORS),
+        "Fire Protection": lambda: rng.choice(PROTECTION),
+        "Natural Hazard Exposure": lambda: rng.choice(HAZARDS),
+        "Number of Stories": lambda: str(rng.randint(1, 40)),
+        "Year Built": lambda: rng.randint(1950, 2022),
+    }
+    for field, make in optional.items():
+        if rng.random() < coverage:
+            submission[field] = make()
+    return submission
+
+
+def generate_submissions(count, seed=0, nesting=0, coverage=1.0):
+    rng = random.Random(seed)
+    for index in range(count):
+        yield make_submission(rng, index, nesting, coverage)
+
+
+def write_submissions(path, count, seed=0, nesting=0, coverage=1.0):
+    with open(path, "w", encoding="utf-8") as f:
+        for submission in generate_submissions(count, seed, nesting, coverage):
+            f.write(json.dumps(submission) + "\n")
+
+
+def generate_pdf(path, pages, seed=0):
+    """Write a multi-page submission PDF with reportlab, one synthetic property summary per page."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    rng = random.Random(seed)
+    pdf = canvas.Canvas(path, pagesize=letter)
+    for index in range(pages):
+        submission = make_submission(rng, index)
+        y = 740
+        for line in _pdf_lines(submission):
+            pdf.drawString(54, y, line[:110])
+            y -= 16
+        pdf.showPage()
+    pdf.save()
+
+
+def _pdf_lines(submission, prefix=""):
+    for key, value in submission.items():
+        if isinstance(value, dict):
+            yield f"{prefix}{key}:"
+            yield from _pdf_lines(value, prefix + "    ")
+        else:
+            yield f"{prefix}{key}: {value}"
@@ -0,0 +1,274 @@
+"""Headless CoPRIA commands.
+
+    python -m copria score data/usa_property_submissions.json --workers 8
+    python -m copria rescore data/usa_property_submissions.json --state output/scoring_state.sqlite
+    python -m copria query --state TX --occupancy warehouse --min-tiv 10000000 --flag "No sprinkler protection"
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from utils.accumulation import ExposureAccumulator
+from utils.json_stream import JsonlWriter, iter_json_file, iter_json_records
+from utils.profile_store import DEFAULT_STORE_PATH, ProfileStore, store_rows
+from utils.red_flag_engine import RuleSyntaxError, apply_red_flag_rules_batch, compile_rules, rule_fields
+from utils.risk_mapper import generate_risk_profile
+from utils.risk_profile import RED_FLAGS
+from utils.scoring_state import DEFAULT_STATE_PATH, ScoringState
+
+DEFAULT_SCHEMA = "data/mvp_risk_profile_schema.json"
+DEFAULT_RULES = "data/red_flag_rules.json"
+# Written alongside the rule fields in --rules-only output so each record can be traced back
+SCREENING_FIELDS = ["Property Name", "Property Address", "State"]
+
+
+def iter_submissions(path):
+    # JSONL lines are handed on unparsed so decoding happens in the workers;
+    # a JSON array is parsed incrementally, one submission at a time
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield line
+        else:
+            yield from iter_json_records(f)
+
+
+def iter_chunks(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+_worker_schema = None
+_worker_rules = None
+_worker_exposure = False
+_worker_rules_only = False
+_worker_store = False
+
+
+def _init_worker(schema, rules, exposure=False, rules_only=False, store=False):
+    global _worker_schema, _worker_rules, _worker_exposure, _worker_rules_only, _worker_store
+    _worker_schema = schema
+    _worker_rules = compile_rules(rules)
+    _worker_exposure = exposure
+    _worker_rules_only = rules_only
+    _worker_store = store
+
+
+def score_chunk(submissions, schema=None, rules=None, exposure=None, rules_only=None, store=None):
+    """Score a list of submissions (dicts or raw JSON lines) into JSONL text ready to append to the output.
+
+    Returns (text, count, accumulator, rows); with `exposure` the chunk's TIV
+    accumulation is built here, while the submissions are still at hand, for
+    the caller to merge, otherwise accumulator is None. With `store` rows holds
+    the chunk's profile store rows, so the parent only inserts them, otherwise
+    None. With `rules_only` only the fields the rules read (plus
+    SCREENING_FIELDS) are mapped and written.
+    """
+    schema = schema if schema is not None else _worker_schema
+    rules = rules if rules is not None else _worker_rules
+    exposure = exposure if exposure is not None else _worker_exposure
+    rules_only = rules_only if rules_only is not None else _worker_rules_only
+    store = store if store is not None else _worker_store
+    fields = SCREENING_FIELDS + rule_fields(rules) if rules_only else None
+    submissions = [json.loads(submission) if isinstance(submission, str) else submission for submission in submissions]
+    profiles = [generate_risk_profile(submission, schema, fields) for submission in submissions]
+    apply_red_flag_rules_batch(profiles, rules)
+    accumulator = None
+    if exposure:
+        accumulator = ExposureAccumulator()
+        accumulator.add_many(profiles, submissions)
+    output_fields = fields + [RED_FLAGS] if rules_only else None
+    documents = [profile.to_json(output_fields) for profile in profiles]
+    rows = store_rows(profiles, documents) if store else None
+    return "".join(document + "\n" for document in documents), len(profiles), accumulator, rows
+
+
+def _score_serial(chunks, schema, rules, exposure=False, rules_only=False, store=False):
+    for chunk in chunks:
+        yield score_chunk(chunk, schema, rules, exposure, rules_only, store)
+
+
+def _score_parallel(chunks, schema, rules, workers, exposure=False, rules_only=False, store=False):
+    # Keep a bounded number of chunks in flight so memory stays flat on huge inputs
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(schema, rules, exposure, rules_only, store)) as pool:
+        pending = []
+        for chunk in chunks:
+            pending.append(pool.submit(score_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def score(args):
+    with open(args.schema) as f:
+        schema = json.load(f)
+    with open(args.rules) as f:
+        rules = json.load(f)
+    try:
+        compile_rules(rules)
+    except RuleSyntaxError as e:
+        print(f"Invalid red flag rules: {e}", file=sys.stderr)
+        return 2
+
+    output = args.output or os.path.join("output", time.strftime("risk_profiles_%Y%m%d_%H%M%S.jsonl"))
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    workers = args.workers or os.cpu_count() or 1
+    chunks = iter_chunks(iter_submissions(args.input), args.chunk_size)
+    exposure = ExposureAccumulator() if args.exposure else None
+    build_rows = bool(args.store)
+    if workers > 1:
+        results = _score_parallel(chunks, schema, rules, workers, exposure is not None, args.rules_only, build_rows)
+    else:
+        results = _score_serial(chunks, schema, rules, exposure is not None, args.rules_only, build_rows)
+
+    # Each chunk's rows (built by the worker) also go into the profile store in
+    # one transaction; the run's aggregates are computed once everything is written
+    store = ProfileStore(args.store) if args.store else None
+    run = store.start_run(rules, source=args.input) if store else None
+
+    start = time.perf_counter()
+    scored = 0
+    next_report = args.report_every
+    with open(output, "w", encoding="utf-8") as out:
+        for lines, count, accumulator, rows in results:
+            out.write(lines)
+            out.flush()
+            if exposure is not None:
+                exposure.merge(accumulator)
+            if run is not None:
+                run.write_rows(rows)
+            scored += count
+            if args.report_every and scored >= next_report:
+                elapsed = time.perf_counter() - start
+                print(f"{scored:,} scored  {scored / elapsed:,.0f} records/s", file=sys.stderr)
+                next_report = scored + args.report_every
+
+    if run is not None:
+        run.finish()
+        store.close()
+    elapsed = time.perf_counter() - start
+    rate = scored / elapsed if elapsed else 0.0
+    print(f"Scored {scored:,} submissions in {elapsed:.1f}s ({rate:,.0f} records/s, {workers} workers) -> {output}",
+          file=sys.stderr)
+    if run is not None:
+        print(f"Stored as run {run.run_id} in {args.store}", file=sys.stderr)
+    if exposure is not None:
+        exposure.export(args.exposure)
+        print(f"TIV accumulation for {exposure.locations:,} locations -> {args.exposure}", file=sys.stderr)
+        for dimension in exposure.dimensions:
+            top = ", ".join(f"{row['Value']} ${row['Total TIV']:,.0f}" for row in exposure.top(dimension, args.top))
+            print(f"  {dimension}: {top}", file=sys.stderr)
+    return 0
+
+
+def rescore(args):
+    with open(args.schema) as f:
+        schema = json.load(f)
+    with open(args.rules) as f:
+        rules = json.load(f)
+    try:
+        compile_rules(rules)
+    except RuleSyntaxError as e:
+        print(f"Invalid red flag rules: {e}", file=sys.stderr)
+        return 2
+
+    submissions = iter_json_file(args.input) if args.input else None
+    state = ScoringState(args.state)
+    start = time.perf_counter()
+    try:
+        if args.output:
+            with JsonlWriter(args.output) as writer:
+                report = state.rescore(submissions, schema, rules, writer=writer)
+        else:
+            report = state.rescore(submissions, schema, rules)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    finally:
+        state.close()
+
+    print(report.summary(), file=sys.stderr)
+    for key, (added, removed) in list(report.flag_changes.items())[:args.show_changes]:
+        print(f"  {key}: +{added} -{removed}", file=sys.stderr)
+    print(f"Rescored in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return 0
+
+
+def query(args):
+    filters = dict(run_id=args.run, state=args.state, construction=args.construction, occupancy=args.occupancy,
+                   min_tiv=args.min_tiv, max_tiv=args.max_tiv, flag=args.flag)
+    with ProfileStore(args.store) as store:
+        if store.latest_run() is None:
+            print(f"No finished runs in {args.store}", file=sys.stderr)
+            return 2
+        count, tiv = store.count(**filters)
+        for profile in store.query(**filters, order_by="total_tiv", descending=True, limit=args.limit):
+            print(profile.to_json())
+    print(f"{count:,} matching profiles, ${tiv:,.0f} Total TIV", file=sys.stderr)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="copria", description="CoPRIA risk profiling from the command line")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    score_parser = commands.add_parser("score", help="score a submissions JSON/JSONL file into risk profiles")
+    score_parser.add_argument("input", help="submissions as a JSON array or JSONL (.jsonl) file")
+    score_parser.add_argument("--schema", default=DEFAULT_SCHEMA)
+    score_parser.add_argument("--rules", default=DEFAULT_RULES)
+    score_parser.add_argument("--output", help="JSONL output path (default: output/risk_profiles_<timestamp>.jsonl)")
+    score_parser.add_argument("--workers", type=int, default=0, help="worker processes (default: all cores)")
+    score_parser.add_argument("--chunk-size", type=int, default=2000, help="submissions per worker task")
+    score_parser.add_argument("--report-every", type=int, default=100_000, help="progress interval in records (0 = off)")
+    score_parser.add_argument("--store", nargs="?", const=DEFAULT_STORE_PATH,
+                              help=f"also record the run in this profile store (default path: {DEFAULT_STORE_PATH})")
+    score_parser.add_argument("--rules-only", action="store_true",
+                              help="screening run: map and write only the fields the rules read")
+    score_parser.add_argument("--exposure", help="also write TIV accumulation by hazard zone, state and ZIP "
+                                                "to this .csv/.json/.jsonl file")
+    score_parser.add_argument("--top", type=int, default=5, help="largest concentrations to print per exposure dimension")
+    score_parser.set_defaults(func=score)
+
+    rescore_parser = commands.add_parser(
+        "rescore", help="re-evaluate only the submissions and rules that changed since the last rescore")
+    rescore_parser.add_argument("input", nargs="?",
+                                help="submissions JSON/JSONL; omit to re-apply edited rules to the stored profiles")
+    rescore_parser.add_argument("--schema", default=DEFAULT_SCHEMA)
+    rescore_parser.add_argument("--rules", default=DEFAULT_RULES)
+    rescore_parser.add_argument("--state", default=DEFAULT_STATE_PATH, help="scoring state database")
+    rescore_parser.add_argument("--output", help="also write every scored profile to this JSONL file")
+    rescore_parser.add_argument("--show-changes", type=int, default=20, help="flag changes to list")
+    rescore_parser.set_defaults(func=rescore)
+
+    query_parser = commands.add_parser("query", help="list stored profiles matching filters, highest TIV first")
+    query_parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="profile store database")
+    query_parser.add_argument("--run", type=int, help="run id (default: the latest finished run)")
+    query_parser.add_argument("--state")
+    query_parser.add_argument("--construction")
+    query_parser.add_argument("--occupancy", help="substring of the occupancy type")
+    query_parser.add_argument("--min-tiv", type=float)
+    query_parser.add_argument("--max-tiv", type=float)
+    query_parser.add_argument("--flag", help="red flag message the profile must carry")
+    query_parser.add_argument("--limit", type=int, default=20, help="profiles to print")
+    query_parser.set_defaults(func=query)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import json
+
+import pandas as pd
+import pytest
+
+from utils import accumulation
+from utils.accumulation import DIMENSIONS, UNKNOWN, ExposureAccumulator
+from utils.risk_profile import RiskProfile
+
+FLOOD = DIMENSIONS["Flood Zone"]
+QUAKE = DIMENSIONS["Earthquake"]
+WILDFIRE = DIMENSIONS["Wildfire"]
+
+
+def profile(state, zip_code, tiv, flood="Zone X", quake="Low", wildfire="Low"):
+    return {"State": state, "Zip Code": zip_code, "Total TIV": tiv, FLOOD: flood, QUAKE: quake, WILDFIRE: wildfire}
+
+
+PROFILES = [
+    profile("TX", "75220", 12_500_000, flood="Zone AE"),
+    profile("TX", "75220", 3_000_000, flood="Zone AE", wildfire="Moderate"),
+    profile("CA", "94607", 17_500_000, quake="High", wildfire="High"),
+    profile("CA", "94607", None, quake="High"),  # missing Total TIV
+    profile("CO", "80202", "unknown", flood=""),  # unparseable Total TIV
+    {"State": "FL", "Zip Code": "33101", FLOOD: "Zone VE"},  # no Total TIV at all
+    profile("", None, 2_000_000, flood=None, quake=" Moderate "),
+    RiskProfile(profile("TX", "77002", 8_000_000, flood="Zone AE", quake="Low")),
+]
+# The Location block wins over the profile's State and Zip Code where it has them
+SUBMISSIONS = [
+    {"Location": {"State": "TX", "ZIP": "75220"}},
+    {"Location": {"State": "OK", "Zip Code": "73102"}},
+    {},
+    {"Location": "not a block"},
+    {"Location": {"City": "Denver"}},
+    {"Location": {"Address": {"State": "GA", "Postal Code": "30303"}}},
+    {"Location": {"ZIP": ""}},
+    None,
+]
+
+
+def expected_table(dimension, profiles, submissions):
+    # The same exposure table from a plain pandas groupby
+    field = DIMENSIONS[dimension]
+    values = []
+    for item, submission in zip(profiles, submissions):
+        value = item.get(field)
+        location = (submission or {}).get("Location")
+        if dimension in ("State", "ZIP") and isinstance(location, dict):
+            address = location.get("Address") if isinstance(location.get("Address"), dict) else location
+            keys = ("State",) if dimension == "State" else ("ZIP", "Zip Code", "Zip", "Postal Code")
+            value = next((address[key] for key in keys if address.get(key) not in (None, "")), value)
+        value = str(value).strip() if value is not None else ""
+        values.append(value or UNKNOWN)
+    frame = pd.DataFrame({
+        "Value": values,
+        "Total TIV": pd.to_numeric([item.get("Total TIV") for item in profiles], errors="coerce"),
+    }).fillna({"Total TIV": 0.0})
+    grouped = frame.groupby("Value")["Total TIV"].agg(["size", "sum"])
+    return {value: (int(row["size"]), float(row["sum"])) for value, row in grouped.iterrows()}
+
+
+def as_dict(rows):
+    return {row["Value"]: (row["Locations"], row["Total TIV"]) for row in rows}
+
+
+@pytest.mark.parametrize("dimension", list(DIMENSIONS))
+def test_tables_match_a_groupby(dimension):
+    exposure = ExposureAccumulator()
+    exposure.add_many(PROFILES, SUBMISSIONS)
+    assert as_dict(exposure.table(dimension)) == pytest.approx(expected_table(dimension, PROFILES, SUBMISSIONS))
+
+
+def test_missing_total_tiv_counts_as_a_location_with_no_value():
+    exposure = ExposureAccumulator()
+    exposure.add_many(PROFILES, SUBMISSIONS)
+    assert exposure.locations == len(PROFILES)
+    assert exposure.total_tiv == 43_000_000
+    assert as_dict(exposure.table("Earthquake"))["High"] == (2, 17_500_000)
+    assert sum(row["Share of TIV"] for row in exposure.table("State")) == pytest.approx(1.0)
+
+
+def test_without_submissions_state_and_zip_come_from_the_profile():
+    exposure = ExposureAccumulator()
+    exposure.add_many(PROFILES)
+    assert as_dict(exposure.table("State")) == pytest.approx(expected_table("State", PROFILES, [None] * len(PROFILES)))
+
+
+def test_chunks_compaction_and_merge_match_a_single_pass(monkeypatch):
+    monkeypatch.setattr(accumulation, "COMPACT_EVERY", 2)
+    whole = ExposureAccumulator()
+    whole.add_many(PROFILES, SUBMISSIONS)
+    left, right = ExposureAccumulator(), ExposureAccumulator()
+    for start in range(0, len(PROFILES), 2):
+        part = left if start < 4 else right
+        part.add_many(PROFILES[start:start + 2], SUBMISSIONS[start:start + 2])
+    left.merge(right)
+    assert left.locations == whole.locations
+    assert left.total_tiv == whole.total_tiv
+    for dimension in DIMENSIONS:
+        assert left.table(dimension) == whole.table(dimension)
+
+
+def test_top_returns_the_largest_concentrations_in_order():
+    exposure = ExposureAccumulator()
+    exposure.add_many(PROFILES, SUBMISSIONS)
+    table = exposure.table("ZIP")
+    assert [row["Total TIV"] for row in table] == sorted((row["Total TIV"] for row in table), reverse=True)
+    assert exposure.top("ZIP", 2) == table[:2]
+    assert exposure.top("ZIP", 100) == table
+
+
+def test_unknown_dimension_and_mismatched_merge_are_rejected():
+    exposure = ExposureAccumulator()
+    with pytest.raises(ValueError):
+        exposure.table("County")
+    with pytest.raises(ValueError):
+        exposure.merge(ExposureAccumulator({"State": "State"}))
+
+
+def test_export_writes_every_dimension(tmp_path):
+    exposure = ExposureAccumulator()
+    exposure.add_many(PROFILES, SUBMISSIONS)
+    path = tmp_path / "exposure.json"
+    exposure.export(str(path))
+    assert json.loads(path.read_text()) == list(exposure.rows())
+    csv_path = tmp_path / "exposure.csv"
+    exposure.export(str(csv_path))
+    assert len(csv_path.read_text().splitlines()) == len(list(exposure.rows())) + 1
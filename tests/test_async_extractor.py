@@ -0,0 +1,181 @@
+import asyncio
+import json
+import re
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from utils import async_extractor
+from utils.async_extractor import TokenBucket, _parse_batch_reply, extract_risk_profiles_from_texts, pack_batches
+
+SCHEMA = {"Property Information": ["Property Name", "Year Built"]}
+_BATCH_ITEM_RE = re.compile(r"=== SUBMISSION (\d+) ===\n(.*?)\n=== END SUBMISSION \1 ===", re.DOTALL)
+
+
+class FakeCompletions:
+    """Stands in for client.chat.completions; `reply(prompt)` returns the content or an exception to raise."""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.prompts = []
+
+    async def create(self, model, messages, temperature, max_tokens):
+        prompt = messages[0]["content"]
+        self.prompts.append(prompt)
+        content = self.reply(prompt)
+        if asyncio.iscoroutine(content):
+            content = await content
+        if isinstance(content, Exception):
+            raise content
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+def fake_client(reply):
+    return SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(reply)))
+
+
+def submission_text(prompt):
+    return prompt.rsplit("### Submission Text:\n", 1)[1].strip()
+
+
+def answer(text):
+    return json.dumps({"Property Name": text, "Year Built": ""})
+
+
+def extract(texts, client, **options):
+    options = {"cache": False, "fast_path": False, "requests_per_minute": None, "tokens_per_minute": None, **options}
+    return extract_risk_profiles_from_texts(texts, SCHEMA, client=client, **options)
+
+
+@pytest.fixture
+def openai(monkeypatch):
+    # The retryable error types come from the openai package
+    openai = pytest.importorskip("openai")
+    monkeypatch.setattr(async_extractor, "backoff_delay", lambda attempt, retry_after=None: 0)
+    return openai
+
+
+def api_error(error_type, status):
+    # Only the attributes the error and the retry loop read from the HTTP response
+    response = SimpleNamespace(request=None, status_code=status, headers={"retry-after": "0"})
+    return error_type("error", response=response, body=None)
+
+
+def test_rate_limit_and_server_errors_are_retried(openai):
+    errors = [api_error(openai.RateLimitError, 429), api_error(openai.InternalServerError, 500)]
+    client = fake_client(lambda prompt: errors.pop(0) if errors else answer(submission_text(prompt)))
+    assert extract(["Warehouse"], client) == [{"Property Name": "Warehouse", "Year Built": ""}]
+    assert len(client.chat.completions.prompts) == 3
+
+
+def test_retries_give_up_after_max_retries(openai):
+    client = fake_client(lambda prompt: api_error(openai.InternalServerError, 503))
+    [result] = extract(["Warehouse"], client, max_retries=2)
+    assert "error" in result
+    assert len(client.chat.completions.prompts) == 3
+
+
+def test_other_errors_are_not_retried(openai):
+    client = fake_client(lambda prompt: ValueError("bad request"))
+    [result] = extract(["Warehouse"], client)
+    assert "error" in result
+    assert len(client.chat.completions.prompts) == 1
+
+
+def test_results_follow_input_order(openai):
+    texts = [f"Property {number}" for number in range(5)]
+
+    async def reply(prompt):
+        # Later documents finish first
+        text = submission_text(prompt)
+        await asyncio.sleep(0.01 * (5 - int(text.split()[-1])))
+        return answer(text)
+
+    results = extract(texts, fake_client(reply), concurrency=5)
+    assert [result["Property Name"] for result in results] == texts
+
+
+def test_token_bucket_paces_requests_once_drained():
+    async def drain_then_acquire():
+        bucket = TokenBucket(6000)  # 100 tokens a second
+        await bucket.acquire(6000)
+        start = time.monotonic()
+        await bucket.acquire(10)
+        return time.monotonic() - start
+
+    assert 0.08 <= asyncio.run(drain_then_acquire()) < 1
+
+
+def test_token_bucket_does_not_wait_while_tokens_remain():
+    async def acquire_twice():
+        bucket = TokenBucket(6000)
+        start = time.monotonic()
+        await bucket.acquire(100)
+        await bucket.acquire(100)
+        return time.monotonic() - start
+
+    assert asyncio.run(acquire_twice()) < 0.05
+
+
+def test_pack_batches_leaves_long_documents_and_a_lone_remainder_single():
+    long_text = "x" * (async_extractor.BATCH_ITEM_TOKENS * 4 + 4)
+    texts = ["a", "b", long_text, "c", "d", "e"]
+    assert pack_batches(texts, 2) == ([[0, 1], [3, 4]], [2, 5])
+    assert pack_batches(texts, 3) == ([[0, 1, 3], [4, 5]], [2])
+
+
+@pytest.mark.parametrize("content", [
+    '[{"id": "1", "Property Name": "A"}, {"id": "2", "Property Name": "B"}]',
+    '{"results": [{"id": "1", "Property Name": "A"}, {"id": "2", "Property Name": "B"}]}',
+    '{"1": {"Property Name": "A"}, "2": {"Property Name": "B"}}',
+])
+def test_parse_batch_reply_shapes(content):
+    answers = _parse_batch_reply(content, {"1": None, "2": None})
+    assert {item_id: item["Property Name"] for item_id, item in answers.items()} == {"1": "A", "2": "B"}
+
+
+def test_parse_batch_reply_drops_malformed_items():
+    content = json.dumps([
+        {"id": "1", "Property Name": {"nested": "A"}},
+        {"id": "2", "Property Name": "B"},
+        {"id": "2", "Property Name": "duplicate"},
+        {"id": "9", "Property Name": "unknown"},
+        "not an object",
+    ])
+    assert _parse_batch_reply(content, {"1": None, "2": None}) == {"2": {"id": "2", "Property Name": "B"}}
+    assert _parse_batch_reply("not json", {"1": None}) == {}
+
+
+@pytest.mark.parametrize("content", [None, "null", "42", '"text"', "true"])
+def test_parse_batch_reply_ignores_replies_that_are_not_objects_or_arrays(content):
+    assert _parse_batch_reply(content, {"1": None}) == {}
+
+
+def test_batch_items_missing_from_the_reply_are_retried_alone(openai):
+    def reply(prompt):
+        items = _BATCH_ITEM_RE.findall(prompt)
+        if not items:
+            return answer(submission_text(prompt))
+        # The model only answers the first submission of the batch
+        item_id, text = items[0]
+        return json.dumps([{"id": item_id, "Property Name": text, "Year Built": ""}])
+
+    client = fake_client(reply)
+    results = extract(["Warehouse", "Office"], client, batch_size=2)
+    assert [result["Property Name"] for result in results] == ["Warehouse", "Office"]
+    prompts = client.chat.completions.prompts
+    assert len(prompts) == 2
+    assert len(_BATCH_ITEM_RE.findall(prompts[0])) == 2
+    assert submission_text(prompts[1]) == "Office"
+
+
+def test_batch_reply_without_content_falls_back_to_single_extraction(openai):
+    def reply(prompt):
+        # The batch comes back with null content; single prompts are answered
+        return None if _BATCH_ITEM_RE.search(prompt) else answer(submission_text(prompt))
+
+    client = fake_client(reply)
+    results = extract(["Warehouse", "Office", "Depot"], client, batch_size=3)
+    assert [result["Property Name"] for result in results] == ["Warehouse", "Office", "Depot"]
+    assert len(client.chat.completions.prompts) == 4
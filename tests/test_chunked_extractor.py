@@ -0,0 +1,58 @@
+import pytest
+
+from utils.chunked_extractor import build_chunks, is_relevant, merge_extractions, split_pages
+
+
+@pytest.mark.parametrize("page", [
+    "Table of Contents\n1. Introduction\n2. Scope",
+    "A brief history of the site and its ownership.",
+    "Statement of limitations: this report reflects conditions on the date of inspection.",
+])
+def test_boilerplate_pages_are_skipped(page):
+    assert not is_relevant(page)
+
+
+@pytest.mark.parametrize("page", [
+    "Two-story masonry warehouse, built 1985.",
+    "Contents value: $2,000,000",
+    "Located in Zone AE flood plain.",
+    "Full sprinkler coverage throughout.",
+    "No claims in the past 5 years.",
+])
+def test_submission_pages_are_kept(page):
+    assert is_relevant(page)
+
+
+def test_prefilter_keeps_only_relevant_pages():
+    text = "\f".join([
+        "Table of Contents",
+        "Construction: Joisted masonry, 3 stories.",
+        "A brief history of the site.",
+        "Total TIV: $12,500,000",
+    ])
+    pages = [page for page in split_pages(text) if is_relevant(page)]
+    assert pages == ["Construction: Joisted masonry, 3 stories.", "Total TIV: $12,500,000"]
+    assert build_chunks(pages) == ["Construction: Joisted masonry, 3 stories.\n\nTotal TIV: $12,500,000"]
+
+
+@pytest.mark.parametrize("field, expected", [
+    ("Sprinkler System (Y/N)", "No"),
+    ("Fire Alarm (Y/N)", "No"),
+    ("Hazardous Materials (Y/N)", "Yes"),
+])
+def test_disagreeing_chunks_resolve_to_the_risk_bearing_answer(field, expected):
+    results = [{field: "Yes"}, {field: ""}, {field: "No"}]
+    assert merge_extractions(results, [field]) == {field: expected}
+    assert merge_extractions(list(reversed(results)), [field]) == {field: expected}
+
+
+def test_chunks_that_do_not_mention_a_field_do_not_outvote_one_that_does():
+    field = "Sprinkler System (Y/N)"
+    assert merge_extractions([{field: ""}, {field: "yes"}, {field: ""}], [field]) == {field: "Yes"}
+    assert merge_extractions([{field: "No"}, {field: ""}], [field]) == {field: "No"}
+
+
+def test_other_fields_take_the_most_common_value():
+    field = "Construction Type"
+    results = [{field: "Masonry"}, {field: "Steel frame"}, {field: " masonry "}]
+    assert merge_extractions(results, [field]) == {field: "Masonry"}
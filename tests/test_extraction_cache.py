@@ -0,0 +1,53 @@
+from itertools import count
+from types import SimpleNamespace
+
+import pytest
+
+from utils import extraction_cache
+from utils.extraction_cache import ExtractionCache
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # One tick per call, so access times never tie
+    ticks = count(1000)
+    monkeypatch.setattr(extraction_cache, "time", SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+def disk_keys(cache):
+    return {key for key, in cache._db.execute("SELECT key FROM extractions")}
+
+
+def test_evictions_are_counted_per_tier(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache.sqlite"), max_memory_entries=1, max_disk_entries=2)
+    for key in "abc":
+        cache.put(key, {"value": key})
+    assert cache.stats["memory_evictions"] == 2
+    assert cache.stats["disk_evictions"] == 1
+    assert cache.evictions == 3
+    cache.close()
+
+
+def test_memory_hits_keep_the_disk_entry_recent(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache.sqlite"), max_memory_entries=2, max_disk_entries=2)
+    cache.put("a", {"value": "a"})
+    cache.put("b", {"value": "b"})
+    assert cache.get("a") == {"value": "a"}
+    assert cache.stats["memory_hits"] == 1
+    # "b" is now the least recently used entry on disk as well as in memory
+    cache.put("c", {"value": "c"})
+    assert disk_keys(cache) == {"a", "c"}
+    cache.close()
+
+
+def test_pending_access_times_are_written_on_close(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ExtractionCache(path)
+    cache.put("a", {"value": "a"})
+    cache.get("a")
+    cache.close()
+    reopened = ExtractionCache(path)
+    created_at, accessed_at = reopened._db.execute(
+        "SELECT created_at, accessed_at FROM extractions WHERE key = 'a'").fetchone()
+    assert accessed_at > created_at
+    reopened.close()
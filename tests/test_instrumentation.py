@@ -0,0 +1,125 @@
+import json
+
+import pytest
+
+from utils import instrumentation
+from utils.instrumentation import JsonlSink, PrometheusSink, annotate, span, summarize
+
+
+@pytest.fixture
+def capture():
+    sink = instrumentation.start_capture()
+    yield sink
+    instrumentation.stop_capture(sink)
+
+
+def test_spans_are_free_when_nothing_listens():
+    assert not instrumentation.enabled()
+    with span("stage", size=1) as stage:
+        stage.set(more=2)
+        annotate(ignored=True)
+    assert span("other") is span("stage")
+
+
+def test_nested_spans_record_inner_first_with_their_own_attributes(capture):
+    with span("outer", items=2) as outer:
+        annotate(before=True)
+        with span("inner") as inner:
+            annotate(prompt_tokens=10)
+            inner.set(cache_hit=True)
+        annotate(after=True)
+        outer.set(done=True)
+    annotate(outside=True)
+
+    inner_record, outer_record = capture.records
+    assert inner_record["name"] == "inner"
+    assert inner_record["prompt_tokens"] == 10 and inner_record["cache_hit"] is True
+    assert "before" not in inner_record and "after" not in inner_record
+    assert outer_record["name"] == "outer"
+    assert {"items": 2, "before": True, "after": True, "done": True}.items() <= outer_record.items()
+    assert "prompt_tokens" not in outer_record and "outside" not in outer_record
+    assert outer_record["started_at"] <= inner_record["started_at"]
+    assert outer_record["seconds"] >= inner_record["seconds"] >= 0
+
+
+def test_failing_span_records_the_error_and_restores_the_parent(capture):
+    with span("outer"):
+        with pytest.raises(KeyError):
+            with span("inner"):
+                raise KeyError("missing")
+        annotate(recovered=True)
+    inner_record, outer_record = capture.records
+    assert inner_record["error"] == "KeyError"
+    assert outer_record["recovered"] is True and "error" not in outer_record
+
+
+def test_stopped_capture_receives_nothing():
+    sink = instrumentation.start_capture()
+    instrumentation.stop_capture(sink)
+    with span("stage"):
+        pass
+    assert sink.records == []
+    assert not instrumentation.enabled()
+
+
+def test_jsonl_sink_writes_one_record_per_line(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    sink = JsonlSink(str(path))
+    instrumentation.add_sink(sink)
+    try:
+        with span("outer", source=tmp_path):
+            with span("inner", rule_seconds={"State == 'TX'": 0.5}):
+                pass
+    finally:
+        instrumentation.remove_sink(sink)
+        sink.close()
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record["name"] for record in records] == ["inner", "outer"]
+    assert records[0]["rule_seconds"] == {"State == 'TX'": 0.5}
+    # Values JSON can't hold are written as strings
+    assert records[1]["source"] == str(tmp_path)
+    assert not instrumentation.enabled()
+
+
+def record(name, seconds, **attributes):
+    return {"name": name, "started_at": 0.0, "seconds": seconds, **attributes}
+
+
+RECORDS = [
+    record("extract", 1.5, prompt_tokens=100, completion_tokens=20, cache_hit=False),
+    record("extract", 0.5, prompt_tokens=50, cache_hit=True),
+    record("rules", 0.25, rule_seconds={'Flood "AE"\\zone': 0.25}),
+]
+
+
+def test_prometheus_sink_renders_counters():
+    sink = PrometheusSink(prefix="test")
+    for item in RECORDS:
+        sink.emit(item)
+    lines = sink.render().splitlines()
+    assert "# TYPE test_stage_calls_total counter" in lines
+    assert 'test_stage_calls_total{stage="extract"} 2' in lines
+    assert 'test_stage_calls_total{stage="rules"} 1' in lines
+    assert 'test_stage_seconds_total{stage="extract"} 2.0' in lines
+    assert 'test_llm_tokens_total{stage="extract",kind="prompt"} 150' in lines
+    assert 'test_llm_tokens_total{stage="extract",kind="completion"} 20' in lines
+    assert 'test_cache_hits_total{stage="extract"} 1' in lines
+    # Quotes and backslashes in label values are escaped
+    assert 'test_rule_seconds_total{rule="Flood \\"AE\\"\\\\zone"} 0.25' in lines
+    assert not any(line.startswith("test_cache_hits_total{stage=\"rules\"") for line in lines)
+
+
+def test_prometheus_sink_writes_its_rendering(tmp_path):
+    sink = PrometheusSink()
+    sink.emit(RECORDS[0])
+    path = tmp_path / "copria.prom"
+    sink.write(str(path))
+    assert path.read_text() == sink.render()
+
+
+def test_summarize_totals_stages_and_rules():
+    stages, rules = summarize(RECORDS)
+    extract = next(row for row in stages if row["stage"] == "extract")
+    assert extract["calls"] == 2 and extract["total_seconds"] == 2.0 and extract["mean_ms"] == 1000.0
+    assert (extract["prompt_tokens"], extract["completion_tokens"], extract["cache_hits"]) == (150, 20, 1)
+    assert rules == [{"rule": 'Flood "AE"\\zone', "total_seconds": 0.25}]
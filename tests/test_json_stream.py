@@ -0,0 +1,32 @@
+import io
+
+import pytest
+
+from utils.json_stream import iter_json_records
+
+BLOCK_SIZES = [1, 2, 3, 5, 7, 64]
+
+
+@pytest.mark.parametrize("block_size", BLOCK_SIZES)
+@pytest.mark.parametrize("text, expected", [
+    ("[1.5e10, 2]", [1.5e10, 2]),
+    ("[-0.25, 1E-3, 12345]", [-0.25, 1e-3, 12345]),
+    ("1.5e-10\n-2.25E+3\n", [1.5e-10, -2.25e3]),
+    ('[{"Total TIV": 12500000.5}, true, null]', [{"Total TIV": 12500000.5}, True, None]),
+])
+def test_numbers_split_across_blocks(text, expected, block_size):
+    assert list(iter_json_records(io.StringIO(text), block_size=block_size)) == expected
+
+
+@pytest.mark.parametrize("block_size", BLOCK_SIZES)
+def test_bytes_input_with_multibyte_characters(block_size):
+    data = '[{"Property Name": "Café Münster"}, 7]'.encode("utf-8")
+    assert list(iter_json_records(io.BytesIO(data), block_size=block_size)) == [{"Property Name": "Café Münster"}, 7]
+
+
+@pytest.mark.parametrize("block_size", BLOCK_SIZES)
+def test_truncated_array(block_size):
+    text = '[{"a": 1}, {"a": 2}, {"a"'
+    assert list(iter_json_records(io.StringIO(text), block_size=block_size, allow_truncated=True)) == [{"a": 1}, {"a": 2}]
+    with pytest.raises(ValueError):
+        list(iter_json_records(io.StringIO(text), block_size=block_size))
@@ -0,0 +1,119 @@
+import pytest
+
+from utils.pattern_extractor import extract_fields_with_patterns, split_confident
+
+SPRINKLERS = "Sprinkler System (Y/N)"
+FIRE_ALARM = "Fire Alarm (Y/N)"
+HAZARDOUS = "Hazardous Materials (Y/N)"
+PRIOR_CLAIMS = "Prior Claims (Y/N)"
+CLAIM_COUNT = "Number of Claims"
+FLOOD_ZONE = "Flood Zone (e.g., Zone X, AE)"
+
+
+def value(text, field):
+    found = extract_fields_with_patterns(text, [field]).get(field)
+    return found[0] if found else None
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("There is no fire alarm, but sprinklers are installed.", "Yes"),
+    ("No basement and sprinklers throughout.", "Yes"),
+    ("Full sprinkler coverage, dual alarm systems.", "Yes"),
+    ("No sprinkler system. Basic fire alarms only.", "No"),
+    ("The building is unsprinklered.", "No"),
+    ("Sprinklers: none", "No"),
+    ("Sprinkler system not installed.", "No"),
+])
+def test_sprinklers(text, expected):
+    assert value(text, SPRINKLERS) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("There is no fire alarm, but sprinklers are installed.", "No"),
+    ("Fire alarm: none", "No"),
+    ("Alarm system not installed.", "No"),
+    ("Basic fire alarms only.", "Yes"),
+    ("24/7 monitored alarm system.", "Yes"),
+])
+def test_fire_alarm(text, expected):
+    assert value(text, FIRE_ALARM) == expected
+
+
+def test_non_flammable_is_not_hazardous():
+    assert value("Stores non-flammable materials only.", HAZARDOUS) is None
+    assert value("Stores lithium batteries and flammable liquids.", HAZARDOUS) == "Yes"
+
+
+def test_zero_claims():
+    text = "Zero claims in the past 10 years."
+    assert value(text, PRIOR_CLAIMS) == "No"
+    assert value(text, CLAIM_COUNT) == "0"
+
+
+def test_conflicting_claim_statements_go_to_the_llm():
+    text = "Two fire claims in 2019; no claims since."
+    values, missing = split_confident(text, [PRIOR_CLAIMS, CLAIM_COUNT])
+    assert values == {}
+    assert missing == [PRIOR_CLAIMS, CLAIM_COUNT]
+
+
+def test_claim_count():
+    assert value("Two prior insurance claims in the last 5 years.", PRIOR_CLAIMS) == "Yes"
+    assert value("Two prior insurance claims in the last 5 years.", CLAIM_COUNT) == "2"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Located in Zone AE flood plain.", "Zone AE"),
+    ("Flood zone: X", "Zone X"),
+    ("The warehouse is in zone a short drive from the river.", None),
+])
+def test_flood_zone(text, expected):
+    assert value(text, FLOOD_ZONE) == expected
+
+
+def test_unmentioned_subject_is_confidently_empty():
+    values, missing = split_confident("Three-story office building.", [SPRINKLERS])
+    assert values == {SPRINKLERS: ""}
+    assert missing == []
+
+
+def confident(text, field):
+    values, _ = split_confident(text, [field])
+    return values.get(field)
+
+
+@pytest.mark.parametrize("text, field, expected", [
+    ("Sprinkler System (Y/N): No", SPRINKLERS, "No"),
+    ("Sprinkler system: N", SPRINKLERS, "No"),
+    ("Sprinklers: Y", SPRINKLERS, "Yes"),
+    ("Sprinklers: none", SPRINKLERS, "No"),
+    ("The sprinkler system was removed in 2019.", SPRINKLERS, "No"),
+    ("Fire alarm: N", FIRE_ALARM, "No"),
+    ("Fire Alarm (Y/N): Yes", FIRE_ALARM, "Yes"),
+    ("Hazardous materials: none stored on site", HAZARDOUS, "No"),
+    ("Hazardous Materials (Y/N): N/A", HAZARDOUS, "No"),
+])
+def test_labelled_answers(text, field, expected):
+    assert confident(text, field) == expected
+
+
+@pytest.mark.parametrize("text, field", [
+    ("The sprinkler system was inspected in 2021.", SPRINKLERS),
+    ("The fire alarm panel is in the lobby.", FIRE_ALARM),
+    ("A hazardous materials survey is pending.", HAZARDOUS),
+    ("Office building with a 2-story parking garage.", "Number of Stories"),
+])
+def test_bare_mentions_go_to_the_llm(text, field):
+    assert confident(text, field) is None
+
+
+def test_mentions_do_not_contradict_a_labelled_answer():
+    assert confident("Sprinkler System (Y/N): No\nThe sprinkler system riser was capped.", SPRINKLERS) == "No"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Number of stories: 3", "3"),
+    ("Stories: two", "2"),
+])
+def test_labelled_story_count(text, expected):
+    assert confident(text, "Number of Stories") == expected
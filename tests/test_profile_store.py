@@ -0,0 +1,117 @@
+import pytest
+
+from utils.profile_store import ProfileStore, store_rows
+from utils.risk_profile import RiskProfile
+
+RULES = [
+    {"category": "Fire Protection", "field": "Sprinkler System (Y/N)", "condition": "== 'No'",
+     "description": "No sprinkler protection"},
+    {"category": "Natural Catastrophe", "field": "Flood Zone (e.g., Zone X, AE)", "condition": "contains 'AE'",
+     "description": "High flood risk"},
+]
+SPRINKLERS = "No sprinkler protection"
+FLOOD = "High flood risk"
+
+
+def profile(name, state, tiv, flags, construction="Masonry", occupancy="Warehouse"):
+    return RiskProfile({"Property Name": name, "State": state, "Total TIV": tiv, "Construction Type": construction,
+                        "Occupancy Type": occupancy, "Red Flags": flags})
+
+
+PROFILES = [
+    profile("A", "TX", 20_000_000, [SPRINKLERS, FLOOD]),
+    profile("B", "TX", 5_000_000, [SPRINKLERS]),
+    profile("C", "CA", 12_000_000, [], construction="Steel Frame", occupancy="Office"),
+    profile("D", "CA", None, [FLOOD], occupancy="Cold storage warehouse"),
+    {"Property Name": "E", "State": "FL", "Total TIV": "unknown", "Red Flags": [FLOOD]},
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    with ProfileStore(str(tmp_path / "store.sqlite")) as store:
+        yield store
+
+
+def write_run(store, profiles=PROFILES, chunks=2):
+    with store.start_run(RULES, source="book.json") as run:
+        for start in range(0, len(profiles), chunks):
+            run.write_many(profiles[start:start + chunks])
+    return run.run_id
+
+
+def names(profiles):
+    return [profile["Property Name"] for profile in profiles]
+
+
+def test_run_summary_totals(store):
+    run_id = write_run(store)
+    summary = store.run_summary()
+    assert summary["run_id"] == run_id == store.latest_run()
+    assert summary["source"] == "book.json"
+    assert (summary["profiles"], summary["flagged_profiles"], summary["total_flags"]) == (5, 4, 5)
+    assert summary["total_tiv"] == 37_000_000
+    assert summary["finished_at"] is not None
+
+
+def test_flag_aggregates_match_the_profiles(store):
+    write_run(store)
+    assert store.flag_counts() == {FLOOD: 3, SPRINKLERS: 2}
+    assert store.flag_counts(by="state") == {("TX", SPRINKLERS): 2, ("TX", FLOOD): 1, ("CA", FLOOD): 1,
+                                             ("FL", FLOOD): 1}
+    assert store.flag_counts(by="category") == {("Natural Catastrophe", FLOOD): 3, ("Fire Protection", SPRINKLERS): 2}
+    assert store.tiv_at_risk() == {SPRINKLERS: 25_000_000, FLOOD: 20_000_000}
+    with pytest.raises(ValueError):
+        store.flag_counts(by="zip")
+
+
+def test_query_filters(store):
+    write_run(store)
+    assert names(store.query()) == ["A", "B", "C", "D", "E"]
+    assert names(store.query(state="TX")) == ["A", "B"]
+    assert names(store.query(min_tiv=5_000_000, max_tiv=20_000_000)) == ["B", "C"]
+    assert names(store.query(flag=FLOOD, order_by="property_name", descending=True)) == ["E", "D", "A"]
+    assert names(store.query(occupancy="warehouse")) == ["A", "B", "D"]
+    assert names(store.query(construction="Steel Frame")) == ["C"]
+    assert names(store.query(order_by="total_tiv", descending=True, limit=2)) == ["A", "C"]
+    assert names(store.query(limit=2, offset=2)) == ["C", "D"]
+    assert store.count(state="TX") == (2, 25_000_000)
+    assert store.query(state="TX")[0]["Red Flags"] == [SPRINKLERS, FLOOD]
+    with pytest.raises(ValueError):
+        store.query(order_by="profile")
+
+
+def test_single_profiles_by_position(store):
+    run_id = write_run(store)
+    assert store.profile(2, run_id)["Property Name"] == "C"
+    assert store.profile(99, run_id) is None
+
+
+def test_runs_are_kept_separately_and_pruned(store):
+    first = write_run(store)
+    second = write_run(store, PROFILES[:2])
+    assert store.latest_run() == second
+    assert store.count() == (2, 25_000_000)
+    assert store.count(run_id=first) == (5, 37_000_000)
+    assert store.prune(keep=1) == 1
+    assert [run["run_id"] for run in store.runs()] == [second]
+    assert store.count(run_id=first) == (0, 0)
+    assert store.flag_counts(first) == {}
+
+
+def test_unfinished_runs_are_not_the_latest(store):
+    finished = write_run(store)
+    with pytest.raises(RuntimeError):
+        with store.start_run(RULES) as run:
+            run.write_many(PROFILES)
+            raise RuntimeError("interrupted")
+    assert store.latest_run() == finished
+
+
+def test_rows_built_elsewhere_store_like_profiles(store):
+    run = store.start_run(RULES)
+    run.write_rows(store_rows(PROFILES[:2]))
+    run.write_many(PROFILES[2:])
+    run.finish()
+    assert names(store.query()) == ["A", "B", "C", "D", "E"]
+    assert store.flag_counts() == {FLOOD: 3, SPRINKLERS: 2}
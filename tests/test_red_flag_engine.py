@@ -0,0 +1,176 @@
+import copy
+import json
+import os
+import random
+
+import pytest
+
+from utils.red_flag_engine import (
+    AllOf, AnyOf, Compare, Contains, RuleSyntaxError, apply_red_flag_rules, apply_red_flag_rules_batch,
+    compile_rule, compile_rules,
+)
+from utils.risk_profile import RiskProfile
+
+with open(os.path.join(os.path.dirname(__file__), "..", "data", "red_flag_rules.json")) as f:
+    RULES = json.load(f)
+# Extra conditions the shipped rules don't use: !=, <=, multi-word fields and numbers stored as text
+EXTRA_RULES = [
+    {"category": "Test", "field": "State", "condition": "!= 'TX' and Total TIV <= 5000000", "description": "Small non-TX"},
+    {"category": "Test", "field": "Year Built", "condition": "< 1980 or Construction Type contains 'frame'",
+     "description": "Old or frame"},
+]
+MISSING = object()
+VALUES = {
+    "Sprinkler System (Y/N)": ["Yes", "No", " no ", "", None, "Unknown", MISSING],
+    "Fire Alarm (Y/N)": ["Yes", "No", "NO", "", MISSING],
+    "Flood Zone (e.g., Zone X, AE)": ["Zone AE", "Zone X", "VE", "a", "", None, MISSING],
+    "Wildfire Risk (Low/Moderate/High or ISO Class)": ["High", "high", "Low", "ISO 3", "", MISSING],
+    "Earthquake Exposure (Low/Moderate/High or ShakeMap Zone)": ["High", "Moderate", None, MISSING],
+    "Roof > 20 yrs": ["Yes", "No", "", MISSING],
+    "Number of Stories": [1, 4, 3.5, "5", "Two-story", "Single-story", "12 floors", "many", "", None, MISSING],
+    "Hazardous Materials (Y/N)": ["Yes", "No", "", MISSING],
+    "Prior Claims": ["Yes", "No", "", MISSING],
+    "Total Loss Amount": [0, 250000, "150000", "$2M", "", None, MISSING],
+    "Sprinkler System": ["No", "Yes", "", MISSING],
+    "Total TIV": [1_000_000, 25_000_000, "12000000", "12,000,000", "unknown", "", None, MISSING],
+    "State": ["TX", "CA", "", None, MISSING],
+    "Year Built": [1950, 2005, "1975", "unknown", "", MISSING],
+    "Construction Type": ["Steel Frame", "Masonry", "", None, MISSING],
+}
+
+
+def predicate(condition, field="Total TIV"):
+    return compile_rule({"field": field, "condition": condition}).predicate
+
+
+def matches(condition, profile, field="Total TIV"):
+    return predicate(condition, field).evaluate(profile)
+
+
+def test_and_binds_tighter_than_or():
+    node = predicate("State == 'TX' or Total TIV > 10 and Sprinkler System (Y/N) == 'No'")
+    assert isinstance(node, AnyOf)
+    first, second = node.terms
+    assert isinstance(first, Compare) and first.field == "State"
+    assert isinstance(second, AllOf) and [term.field for term in second.terms] == [
+        "Total TIV", "Sprinkler System (Y/N)"]
+    assert node.evaluate({"State": "TX", "Total TIV": 1, "Sprinkler System (Y/N)": "Yes"})
+    assert not node.evaluate({"State": "CA", "Total TIV": 100, "Sprinkler System (Y/N)": "Yes"})
+    assert node.evaluate({"State": "CA", "Total TIV": 100, "Sprinkler System (Y/N)": "No"})
+
+
+def test_a_factor_without_a_field_uses_the_rules_field():
+    assert matches("> 10 and < 20", {"Total TIV": 15})
+    assert not matches("> 10 and < 20", {"Total TIV": 25})
+
+
+def test_contains_alternatives_are_not_new_factors():
+    node = predicate("contains 'AE' or 'VE' or State == 'FL'", field="Flood Zone (e.g., Zone X, AE)")
+    assert isinstance(node, AnyOf)
+    assert isinstance(node.terms[0], Contains) and node.terms[0].needles == ("ae", "ve")
+    assert node.evaluate({"Flood Zone (e.g., Zone X, AE)": "Zone ve"})
+    assert node.evaluate({"Flood Zone (e.g., Zone X, AE)": "Zone X", "State": "FL"})
+    assert not node.evaluate({"Flood Zone (e.g., Zone X, AE)": "Zone X", "State": "TX"})
+
+
+@pytest.mark.parametrize("condition, profile, expected", [
+    ("== 'No'", {"Total TIV": " no "}, True),
+    ("!= 'No'", {"Total TIV": "No"}, False),
+    ("!= 'No'", {}, True),
+    ("> 5", {"Total TIV": "not a number"}, False),
+    ("> 5", {"Total TIV": None}, False),
+    ("> 5", {}, False),
+    ("<= 5", {}, True),
+])
+def test_comparisons(condition, profile, expected):
+    assert matches(condition, profile) is expected
+
+
+def test_keywords_are_case_insensitive():
+    assert matches("State == 'TX' AND Total TIV >= 10", {"State": "tx", "Total TIV": 10})
+
+
+@pytest.mark.parametrize("condition", [
+    "",
+    "   ",
+    "> 'ten'",
+    "> ten",
+    "== ",
+    "State 'TX'",
+    "State == 'TX' and",
+    "(State == 'TX')",
+    "not State == 'TX'",
+    "contains AE",
+    "Total TIV = 5",
+])
+def test_malformed_conditions_are_rejected(condition):
+    with pytest.raises(RuleSyntaxError):
+        compile_rule({"field": "Total TIV", "condition": condition})
+
+
+@pytest.mark.parametrize("rules", [
+    {"field": "Total TIV", "condition": "> 5"},
+    [{"field": "Total TIV"}],
+    [{"condition": "> 5"}],
+    ["> 5"],
+])
+def test_malformed_rule_sets_are_rejected(rules):
+    with pytest.raises(RuleSyntaxError):
+        compile_rules(rules)
+
+
+def test_errors_name_the_rule():
+    with pytest.raises(RuleSyntaxError, match="rule 1"):
+        compile_rules([{"field": "Total TIV", "condition": "> 5"}, {"field": "Total TIV", "condition": "> x"}])
+
+
+def test_rules_edited_in_place_are_recompiled():
+    rules = [{"field": "Total TIV", "condition": "> 5", "description": "Big"}]
+    assert compile_rules(rules)[0].matches({"Total TIV": 6})
+    rules[0]["condition"] = "> 10"
+    assert not compile_rules(rules)[0].matches({"Total TIV": 6})
+    rules.append({"field": "State", "condition": "== 'TX'", "description": "Texas"})
+    assert [rule.message for rule in compile_rules(rules)] == ["Big", "Texas"]
+
+
+def test_equal_rule_lists_share_a_compilation():
+    rules = [{"field": "Total TIV", "condition": "> 5"}]
+    assert compile_rules(rules) is compile_rules([dict(rule) for rule in rules])
+    compiled = compile_rules(rules)
+    assert compile_rules(compiled) is compiled
+
+
+def test_rules_with_nested_values_still_compile():
+    rules = [{"field": "Total TIV", "condition": "> 5", "tags": ["size"]}]
+    assert compile_rules(rules)[0].matches({"Total TIV": 6})
+
+
+def mixed_profiles(count, seed=7):
+    rng = random.Random(seed)
+    profiles = []
+    for index in range(count):
+        values = {}
+        for field, choices in VALUES.items():
+            value = rng.choice(choices)
+            if value is not MISSING:
+                values[field] = value
+        # Raw dict profiles and normalized RiskProfiles go through the engine alike
+        profiles.append(RiskProfile(values) if index % 2 else values)
+    return profiles
+
+
+@pytest.mark.parametrize("rules", [RULES, RULES + EXTRA_RULES], ids=["shipped", "extra"])
+def test_batch_matches_scalar_engine(rules):
+    profiles = mixed_profiles(500)
+    scalar = [apply_red_flag_rules(copy.deepcopy(profile), rules)["Red Flags"] for profile in profiles]
+    flag_lists, flag_counts = apply_red_flag_rules_batch(profiles, rules)
+    assert flag_lists == scalar
+    assert [profile["Red Flags"] for profile in profiles] == scalar
+    expected_counts = {}
+    for flags in scalar:
+        for flag in flags:
+            expected_counts[flag] = expected_counts.get(flag, 0) + 1
+    assert flag_counts == expected_counts
+    # The fixture exercises every rule both ways
+    assert 0 < min(expected_counts.get(rule["description"], 0) for rule in rules)
+    assert max(expected_counts.values()) < len(profiles)
@@ -0,0 +1,121 @@
+import json
+import os
+import pickle
+
+import pytest
+
+from utils.risk_mapper import generate_risk_profile
+from utils.risk_profile import RiskProfile, _amount, _count, _level, _percent, _yes_no
+
+DATA = os.path.join(os.path.dirname(__file__), "..", "data")
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("$18,000,000", 18_000_000),
+    ("18000000", 18_000_000),
+    ("2.1 million", 2_100_000),
+    ("$5M", 5_000_000),
+    ("750k", 750_000),
+    (12.5, 12.5),
+    (12.0, 12),
+    ("", None),
+    (None, None),
+    ("  ", None),
+    ("about five million", "about five million"),
+])
+def test_amount(value, expected):
+    assert _amount(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    (3, 3),
+    (3.0, 3),
+    ("3 stories", 3),
+    ("Single-story", 1),
+    ("Two-story", 2),
+    ("five-story", 5),
+    ("12 floors, two basements", 12),
+    ("many", "many"),
+    (" unknown ", "unknown"),
+    ("", None),
+    (None, None),
+])
+def test_count_reads_digits_then_spelled_out_numbers(value, expected):
+    assert _count(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("yes", "Yes"), (" Y ", "Yes"), (True, "Yes"), ("NO", "No"), ("n", "No"), (False, "No"),
+    ("Partial", "Partial"), ("", ""),
+])
+def test_yes_no(value, expected):
+    assert _yes_no(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("medium", "Moderate"), ("HIGH", "High"), ("ISO 3", "ISO 3"),
+])
+def test_level(value, expected):
+    assert _level(value) == expected
+
+
+def test_percent():
+    assert _percent("85%") == 85
+    assert _percent("85.5 %") == 85.5
+
+
+def test_values_are_normalized_and_unknown_fields_kept():
+    profile = RiskProfile({"Total TIV": "$5M", "State": " TX ", "Number of Stories": "Five-story", "Notes": "x"})
+    assert profile["Total TIV"] == 5_000_000
+    assert profile["State"] == "TX"
+    assert profile["Number of Stories"] == 5
+    assert profile["Notes"] == "x"
+    assert profile.get("Year Built") is None
+    assert "Year Built" not in profile
+    assert profile.to_dict() == {"State": "TX", "Number of Stories": 5, "Total TIV": 5_000_000, "Notes": "x"}
+
+
+def test_pending_fields_are_resolved_once_on_first_read():
+    calls = []
+
+    def resolve(field):
+        calls.append(field)
+        return {"Total TIV": "$2M", "State": "CA", "Notes": "extra"}.get(field, "")
+
+    profile = RiskProfile({"Property Name": "Depot"}, pending=["Total TIV", "State", "Notes"], resolve=resolve)
+    # Extra (non-schema) fields are resolved straight away; schema fields wait
+    assert calls == ["Notes"]
+    assert profile["Total TIV"] == 2_000_000
+    assert profile["Total TIV"] == 2_000_000
+    assert calls == ["Notes", "Total TIV"]
+    assert profile.to_dict() == {"State": "CA", "Property Name": "Depot", "Total TIV": 2_000_000, "Notes": "extra"}
+    assert calls == ["Notes", "Total TIV", "State"]
+
+
+def test_fields_outside_pending_stay_absent():
+    profile = RiskProfile(pending=["State"], resolve=lambda field: "TX")
+    assert profile.get("Total TIV") is None
+    with pytest.raises(KeyError):
+        profile["Total TIV"]
+    with pytest.raises(AttributeError):
+        profile.total_tiv
+
+
+def test_profiles_are_slotted():
+    profile = RiskProfile({"State": "TX"})
+    assert not hasattr(profile, "__dict__")
+    with pytest.raises(AttributeError):
+        profile.some_new_attribute = 1
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_pickle_round_trip(lazy):
+    with open(os.path.join(DATA, "mvp_risk_profile_schema.json")) as f:
+        schema = json.load(f)
+    with open(os.path.join(DATA, "usa_property_submissions.json")) as f:
+        submission = json.load(f)[0]
+    profile = generate_risk_profile(submission, schema, lazy=lazy)
+    profile["Red Flags"] = ["No sprinkler protection"]
+    restored = pickle.loads(pickle.dumps(profile))
+    expected = {**generate_risk_profile(submission, schema).to_dict(), "Red Flags": ["No sprinkler protection"]}
+    assert restored.to_dict() == expected
@@ -0,0 +1,103 @@
+import json
+import os
+
+import pytest
+
+from utils import scoring_state
+from utils.scoring_state import ScoringState
+
+DATA = os.path.join(os.path.dirname(__file__), "..", "data")
+
+with open(os.path.join(DATA, "mvp_risk_profile_schema.json")) as f:
+    SCHEMA = json.load(f)
+with open(os.path.join(DATA, "usa_property_submissions.json")) as f:
+    SUBMISSIONS = json.load(f)
+with open(os.path.join(DATA, "red_flag_rules.json")) as f:
+    RULES = json.load(f)
+
+# An edited rule set: one condition reworded to match different profiles, one rule dropped, one added
+EDITED_RULES = [dict(rule) for rule in RULES if rule["field"] != "Hazardous Materials (Y/N)"]
+EDITED_RULES[1] = {**EDITED_RULES[1], "condition": "== 'Yes'", "description": "Fire alarm installed"}
+EDITED_RULES.append({"category": "Exposure", "field": "Total TIV", "condition": "> 15000000",
+                     "description": "High total insured value"})
+
+
+class Collect:
+    def __init__(self):
+        self.profiles = []
+
+    def write_many(self, profiles):
+        self.profiles.extend(profiles)
+
+
+def rescore(state, rules, submissions=SUBMISSIONS):
+    writer = Collect()
+    report = state.rescore(submissions, SCHEMA, rules, writer=writer)
+    return report, [(profile["Property Name"], profile["Red Flags"]) for profile in writer.profiles]
+
+
+@pytest.fixture
+def state(tmp_path):
+    state = ScoringState(str(tmp_path / "state.sqlite"))
+    yield state
+    state.close()
+
+
+@pytest.fixture
+def fresh_state(tmp_path):
+    state = ScoringState(str(tmp_path / "fresh.sqlite"))
+    yield state
+    state.close()
+
+
+@pytest.mark.parametrize("submissions", [SUBMISSIONS, None])
+def test_incremental_rescore_after_a_rule_change_matches_a_full_rescore(state, fresh_state, submissions):
+    rescore(state, RULES)
+    report, incremental = rescore(state, EDITED_RULES, submissions)
+    _, full = rescore(fresh_state, EDITED_RULES)
+    assert incremental == full
+    assert report.unchanged_submissions == len(SUBMISSIONS)
+    assert report.rules_changed == ["Fire Alarm (Y/N)"]
+    assert report.pairs_evaluated < report.pairs_total
+
+
+def test_unchanged_state_is_reused(state):
+    rescore(state, RULES)
+    report, _ = rescore(state, RULES)
+    assert report.unchanged_submissions == len(SUBMISSIONS)
+    assert report.pairs_evaluated == 0
+
+
+def test_code_change_rescores_everything(state, fresh_state, monkeypatch):
+    rescore(state, RULES)
+    # A mapper change alongside the new code fingerprint
+    generate = scoring_state.generate_risk_profile
+
+    def changed_mapper(submission, schema):
+        profile = generate(submission, schema)
+        profile["Fire Alarm (Y/N)"] = "No"
+        return profile
+
+    monkeypatch.setattr(scoring_state, "generate_risk_profile", changed_mapper)
+    monkeypatch.setattr(scoring_state, "code_fingerprint", lambda: "changed")
+    report, incremental = rescore(state, RULES)
+    _, full = rescore(fresh_state, RULES)
+    assert incremental == full
+    assert all("No fire alarm installed" in flags for _, flags in incremental)
+    assert report.changed_submissions == len(SUBMISSIONS)
+    assert report.pairs_evaluated == report.pairs_total
+
+
+def test_rules_only_pass_after_a_code_change_needs_the_submissions(state, monkeypatch):
+    rescore(state, RULES)
+    monkeypatch.setattr(scoring_state, "code_fingerprint", lambda: "changed")
+    with pytest.raises(ValueError, match="re-mapped"):
+        state.rescore(None, SCHEMA, EDITED_RULES)
+
+
+def test_state_without_a_code_fingerprint_is_rescored(state):
+    rescore(state, RULES)
+    with state._db:
+        state._db.execute("DELETE FROM meta WHERE key = 'code_hash'")
+    report, _ = rescore(state, RULES)
+    assert report.changed_submissions == len(SUBMISSIONS)
@@ -0,0 +1,195 @@
+import csv
+
+import numpy as np
+
+from utils.json_stream import open_record_writer
+from utils.red_flag_engine import numeric_column
+from utils.risk_mapper import build_field_index
+
+UNKNOWN = "Unknown"
+# Exposure dimension -> profile field it's read from
+DIMENSIONS = {
+    "Flood Zone": "Flood Zone (e.g., Zone X, AE)",
+    "Earthquake": "Earthquake Exposure (Low/Moderate/High or ShakeMap Zone)",
+    "Wildfire": "Wildfire Risk (Low/Moderate/High or ISO Class)",
+    "State": "State",
+    "ZIP": "Zip Code",
+}
+# Keys a submission's Location block may use, checked in order; they win over the profile fields
+LOCATION_KEYS = {
+    "State": ("State",),
+    "ZIP": ("ZIP", "Zip Code", "Zip", "Postal Code"),
+}
+# Chunk tallies are folded into the running table after this many chunks
+COMPACT_EVERY = 32
+
+
+def _key(value):
+    if value is None:
+        return UNKNOWN
+    value = str(value).strip()
+    return value or UNKNOWN
+
+
+def _find_location(lookup):
+    found = {}
+    for dimension, keys in LOCATION_KEYS.items():
+        for key in keys:
+            value = lookup(key)
+            if value not in (None, ""):
+                found[dimension] = value
+                break
+    return found
+
+
+def _location(submission):
+    location = submission.get("Location") if submission is not None else None
+    if not isinstance(location, dict):
+        return {}
+    found = _find_location(location.get)
+    if len(found) < len(LOCATION_KEYS):
+        # Only blocks nested under wrapper keys need the flattened index
+        found = {**_find_location(build_field_index(location).get), **found}
+    return found
+
+
+class _Tally:
+    """TIV and location counts per key of one dimension, as sorted parallel arrays.
+
+    Each chunk is reduced with np.bincount into its own small tally; those are
+    merged into the running arrays with np.unique/np.bincount every
+    COMPACT_EVERY chunks or when the table is read.
+    """
+
+    __slots__ = ("keys", "locations", "tiv", "_parts")
+
+    def __init__(self):
+        self.keys = np.array([], dtype=str)
+        self.locations = np.zeros(0, dtype=np.int64)
+        self.tiv = np.zeros(0)
+        self._parts = []
+
+    def add(self, values, tiv):
+        # One code per row against the chunk's distinct raw values; only those
+        # distinct values are turned into keys (merging None, "" and "Unknown")
+        lookup = {}
+        codes = np.fromiter((lookup.setdefault(value, len(lookup)) for value in values), dtype=np.intp, count=len(values))
+        self._parts.append((
+            np.array([_key(value) for value in lookup]),
+            np.bincount(codes, minlength=len(lookup)),
+            np.bincount(codes, weights=tiv, minlength=len(lookup)),
+        ))
+        if len(self._parts) >= COMPACT_EVERY:
+            self.compact()
+
+    def merge(self, other):
+        other.compact()
+        self._parts.append((other.keys, other.locations, other.tiv))
+        if len(self._parts) >= COMPACT_EVERY:
+            self.compact()
+
+    def compact(self):
+        if not self._parts:
+            return
+        parts = [(self.keys, self.locations, self.tiv)] + self._parts
+        self._parts = []
+        keys, inverse = np.unique(np.concatenate([part[0] for part in parts]), return_inverse=True)
+        self.keys = keys
+        self.locations = np.bincount(
+            inverse, weights=np.concatenate([part[1] for part in parts]), minlength=len(keys)
+        ).astype(np.int64)
+        self.tiv = np.bincount(inverse, weights=np.concatenate([part[2] for part in parts]), minlength=len(keys))
+
+
+class ExposureAccumulator:
+    """Running TIV concentration per flood zone, earthquake and wildfire level, state and ZIP.
+
+    Feed it scored profiles chunk by chunk with add_many(), passing the source
+    submissions too so State and ZIP come from their Location block; hazard
+    levels and Total TIV come from the profiles. Accumulators built on separate
+    workers can be combined with merge().
+
+        exposure = ExposureAccumulator()
+        exposure.add_many(profiles, submissions)
+        exposure.top("ZIP", 10)
+        exposure.export("output/exposure.csv")
+    """
+
+    def __init__(self, dimensions=DIMENSIONS):
+        self.dimensions = dict(dimensions)
+        self.locations = 0
+        self.total_tiv = 0.0
+        self._tallies = {dimension: _Tally() for dimension in self.dimensions}
+
+    def add_many(self, profiles, submissions=None):
+        profiles = list(profiles)
+        if not profiles:
+            return
+        locations = [_location(submission) for submission in submissions] if submissions is not None else None
+        # Read like the rule engine reads it, with missing or unparseable amounts counted as 0
+        tiv = np.nan_to_num(numeric_column(profiles, "Total TIV"), nan=0.0)
+        self.locations += len(profiles)
+        self.total_tiv += float(tiv.sum())
+        for dimension, field in self.dimensions.items():
+            values = [profile.get(field) for profile in profiles]
+            if locations is not None and dimension in LOCATION_KEYS:
+                values = [location.get(dimension, value) for location, value in zip(locations, values)]
+            self._tallies[dimension].add(values, tiv)
+
+    def merge(self, other):
+        """Fold another accumulator over the same dimensions into this one."""
+        if other.dimensions.keys() != self.dimensions.keys():
+            raise ValueError("cannot merge exposure accumulators over different dimensions")
+        self.locations += other.locations
+        self.total_tiv += other.total_tiv
+        for dimension, tally in other._tallies.items():
+            self._tallies[dimension].merge(tally)
+
+    def _tally(self, dimension):
+        try:
+            tally = self._tallies[dimension]
+        except KeyError:
+            raise ValueError(f"unknown exposure dimension {dimension!r}") from None
+        tally.compact()
+        return tally
+
+    def _rows(self, dimension, order):
+        tally = self._tally(dimension)
+        share = tally.tiv / self.total_tiv if self.total_tiv else np.zeros(len(tally.tiv))
+        return [
+            {"Dimension": dimension, "Value": key, "Locations": int(locations), "Total TIV": float(tiv),
+             "Share of TIV": float(fraction)}
+            for key, locations, tiv, fraction in zip(
+                tally.keys[order].tolist(), tally.locations[order], tally.tiv[order], share[order])
+        ]
+
+    def table(self, dimension):
+        """Every value of a dimension with its location count, TIV and share of the book's TIV, largest TIV first."""
+        tally = self._tally(dimension)
+        return self._rows(dimension, np.argsort(-tally.tiv, kind="stable"))
+
+    def top(self, dimension, n=10):
+        """The n largest TIV concentrations of a dimension, largest first."""
+        tally = self._tally(dimension)
+        if n < len(tally.tiv):
+            # Partition first so only the n winners are sorted on big dimensions like ZIP
+            candidates = np.argpartition(-tally.tiv, n)[:n]
+            order = candidates[np.lexsort((candidates, -tally.tiv[candidates]))]
+        else:
+            order = np.argsort(-tally.tiv, kind="stable")
+        return self._rows(dimension, order)
+
+    def rows(self):
+        for dimension in self.dimensions:
+            yield from self.table(dimension)
+
+    def export(self, path):
+        """Write every dimension's table to .csv, .jsonl or (anything else) a JSON array."""
+        if path.endswith(".csv"):
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, ["Dimension", "Value", "Locations", "Total TIV", "Share of TIV"])
+                writer.writeheader()
+                writer.writerows(self.rows())
+        else:
+            with open_record_writer(path, indent=2) as writer:
+                writer.write_many(self.rows())
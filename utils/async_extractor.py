@@ -0,0 +1,296 @@
+import asyncio
+import json
+import random
+import time
+
+from utils.extraction_cache import get_default_cache, make_cache_key
+from utils.instrumentation import annotate, span
+from utils.llm_extractor import MODEL, PROMPT_VERSION, build_batch_extraction_prompt, build_extraction_prompt
+from utils.pattern_extractor import merge_pattern_fields, split_confident
+
+MAX_COMPLETION_TOKENS = 1000
+# Batched mode: documents up to BATCH_ITEM_TOKENS share one request, each allowed
+# BATCH_COMPLETION_TOKENS_PER_ITEM of the reply (within the model's output limit)
+BATCH_ITEM_TOKENS = 750
+BATCH_COMPLETION_TOKENS_PER_ITEM = 400
+MAX_BATCH_COMPLETION_TOKENS = 4000
+
+
+def retryable_errors():
+    # Errors worth another attempt: 429s, 5xx responses, dropped connections and timeouts.
+    # openai is imported here rather than at module level to keep app start-up fast
+    import openai
+
+    return openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError
+
+
+def estimate_tokens(text):
+    # Rough OpenAI average of ~4 characters per token; only used for rate limiting
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """Async token bucket that refills `per_minute` tokens evenly over each minute."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        # A single request larger than the bucket waits for a full bucket instead of forever
+        amount = min(float(amount), self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0, retry_after=None):
+    # Full jitter keeps concurrent retries from hitting the API in lockstep
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass
+    return delay
+
+
+class _Limits:
+    def __init__(self, concurrency, requests_per_minute, tokens_per_minute, max_retries):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+
+
+async def _extract_one(client, text, fields, limits, cache, fast_path):
+    with span("extract_risk_profile_async"):
+        values, missing = split_confident(text, fields) if fast_path else ({}, fields)
+        annotate(pattern_fields=len(values))
+        if not missing:
+            annotate(llm_skipped=True)
+            return merge_pattern_fields(values, {}, fields)
+        result = await _extract_with_retries(client, text, missing, limits, cache)
+        if not isinstance(result, dict) or "error" in result:
+            return result
+        return merge_pattern_fields(values, result, fields)
+
+
+async def _extract_with_retries(client, text, fields, limits, cache):
+    cache_key = make_cache_key(text, fields, MODEL, PROMPT_VERSION)
+    if cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            annotate(cache_hit=True)
+            return cached
+    annotate(cache_hit=False)
+
+    content, error = await _complete(client, build_extraction_prompt(text, fields), limits, MAX_COMPLETION_TOKENS)
+    if error is not None:
+        return error
+    try:
+        result = json.loads(content)
+    except Exception as e:
+        print(f"LLM extraction error: {str(e)}")
+        return {"error": f"LLM extraction failed: {str(e)}"}
+    if cache:
+        cache.put(cache_key, result)
+    return result
+
+
+async def _complete(client, prompt, limits, max_tokens):
+    """Send one prompt under the rate limits, retrying transient errors; returns (content, error result)."""
+    retryable = retryable_errors()
+    error = None
+    async with limits.semaphore:
+        for attempt in range(limits.max_retries + 1):
+            if limits.requests:
+                await limits.requests.acquire(1)
+            if limits.tokens:
+                await limits.tokens.acquire(estimate_tokens(prompt) + max_tokens)
+            try:
+                response = await client.chat.completions.create(
+                    model=MODEL,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0,
+                    max_tokens=max_tokens,
+                )
+                annotate(attempts=attempt + 1)
+                if response.usage is not None:
+                    annotate(prompt_tokens=response.usage.prompt_tokens,
+                             completion_tokens=response.usage.completion_tokens)
+                return response.choices[0].message.content, None
+            except retryable as e:
+                error = e
+                response = getattr(e, "response", None)
+                retry_after = response.headers.get("retry-after") if response is not None else None
+                if attempt < limits.max_retries:
+                    await asyncio.sleep(backoff_delay(attempt, retry_after=retry_after))
+                continue
+            except Exception as e:
+                print(f"LLM extraction error: {str(e)}")
+                return None, {"error": f"LLM extraction failed: {str(e)}"}
+
+    print(f"LLM extraction error after {limits.max_retries + 1} attempts: {str(error)}")
+    return None, {"error": f"LLM extraction failed: {str(error)}"}
+
+
+def pack_batches(texts, batch_size, item_tokens=BATCH_ITEM_TOKENS):
+    """Split document indexes into batches of up to `batch_size` short documents, plus the long ones left over."""
+    batches, singles, current = [], [], []
+    for index, text in enumerate(texts):
+        if estimate_tokens(text) > item_tokens:
+            singles.append(index)
+            continue
+        current.append(index)
+        if len(current) == batch_size:
+            batches.append(current)
+            current = []
+    if len(current) > 1:
+        batches.append(current)
+    else:
+        singles.extend(current)
+    return batches, sorted(singles)
+
+
+def _parse_batch_reply(content, ids):
+    """Map item id -> answer for every well-formed item of a batch reply; anything else is left out."""
+    try:
+        reply = json.loads(content)
+    except (ValueError, TypeError):
+        # Not JSON, or no content at all (None)
+        return {}
+    # Accept {"results": [...]} and {"<id>": {...}} shapes as well as the requested array
+    if isinstance(reply, dict):
+        lists = [value for value in reply.values() if isinstance(value, list)]
+        if len(lists) == 1:
+            reply = lists[0]
+        else:
+            reply = [dict(value, id=key) for key, value in reply.items() if isinstance(value, dict)]
+    if not isinstance(reply, list):
+        return {}
+    answers = {}
+    for item in reply:
+        if not isinstance(item, dict):
+            continue
+        item_id = str(item.get("id", "")).strip()
+        # Nested values mean the model blended fields or items together; such items are retried alone
+        if item_id in ids and item_id not in answers and all(
+                value is None or isinstance(value, (str, int, float)) for key, value in item.items() if key != "id"):
+            answers[item_id] = item
+    return answers
+
+
+async def _extract_batch(client, items, fields, limits, cache, fast_path):
+    """Extract several short documents with one request; returns [(index, result)] for `items` [(index, text)]."""
+    with span("extract_risk_profile_batch", items=len(items)) as stage:
+        results = {}
+        pending = []
+        for index, text in items:
+            values, missing = split_confident(text, fields) if fast_path else ({}, fields)
+            if not missing:
+                results[index] = merge_pattern_fields(values, {}, fields)
+                continue
+            cache_key = make_cache_key(text, missing, MODEL, PROMPT_VERSION)
+            cached = cache.get(cache_key) if cache else None
+            if cached is not None:
+                results[index] = merge_pattern_fields(values, cached, fields)
+                continue
+            pending.append((index, text, values, missing, cache_key))
+
+        retry = pending if len(pending) == 1 else []
+        if len(pending) > 1:
+            # The batch asks for every field any of its items still needs; each item keeps only its own
+            needed = {field for _, _, _, missing, _ in pending for field in missing}
+            batch_fields = [field for field in fields if field in needed]
+            ids = {str(number): entry for number, entry in enumerate(pending, 1)}
+            prompt = build_batch_extraction_prompt([(item_id, entry[1]) for item_id, entry in ids.items()], batch_fields)
+            content, error = await _complete(client, prompt, limits, min(
+                MAX_BATCH_COMPLETION_TOKENS, BATCH_COMPLETION_TOKENS_PER_ITEM * len(pending)))
+            answers = _parse_batch_reply(content, ids) if error is None else {}
+            for item_id, (index, text, values, missing, cache_key) in ids.items():
+                answer = answers.get(item_id)
+                if error is not None:
+                    results[index] = error
+                elif answer is None:
+                    retry.append(ids[item_id])
+                else:
+                    result = {field: answer.get(field, "") for field in missing}
+                    if cache:
+                        cache.put(cache_key, result)
+                    results[index] = merge_pattern_fields(values, result, fields)
+        stage.set(llm_items=len(pending), retried=len(retry) if len(pending) > 1 else 0)
+
+        async def extract_alone(index, text, values, missing, _):
+            result = await _extract_with_retries(client, text, missing, limits, cache)
+            if not isinstance(result, dict) or "error" in result:
+                return index, result
+            return index, merge_pattern_fields(values, result, fields)
+
+        for index, result in await asyncio.gather(*(extract_alone(*entry) for entry in retry)):
+            results[index] = result
+        return [(index, results[index]) for index, _ in items]
+
+
+async def iter_risk_profile_extractions(texts, schema_fields, client=None, concurrency=4,
+                                        requests_per_minute=3500, tokens_per_minute=90_000,
+                                        max_retries=5, cache=None, fast_path=True, batch_size=1):
+    """Extract many documents concurrently, yielding (index, result) as each one finishes.
+
+    `index` is the document's position in `texts`. Pass an AsyncOpenAI `client`
+    (e.g. one built on an httpx.MockTransport) to control the transport;
+    pass cache=False to skip the extraction cache and fast_path=False to send
+    every field to the LLM instead of pattern-matching what it can first.
+    With batch_size > 1, documents of up to BATCH_ITEM_TOKENS are sent up to
+    batch_size per request and answered as one keyed JSON array; items missing
+    from or malformed in the reply are retried one by one.
+    """
+    texts = list(texts)
+    fields = [field for section in schema_fields.values() for field in section]
+    if client is None:
+        import openai
+
+        # Retries are handled here so they share the rate limiter
+        client = openai.AsyncOpenAI(max_retries=0)
+    if cache is None:
+        cache = get_default_cache()
+    limits = _Limits(concurrency, requests_per_minute, tokens_per_minute, max_retries)
+
+    async def run(index):
+        return [(index, await _extract_one(client, texts[index], fields, limits, cache, fast_path))]
+
+    async def run_batch(indexes):
+        return await _extract_batch(client, [(index, texts[index]) for index in indexes], fields, limits, cache, fast_path)
+
+    batches, singles = pack_batches(texts, batch_size) if batch_size > 1 else ([], range(len(texts)))
+    tasks = [asyncio.ensure_future(run_batch(batch)) for batch in batches]
+    tasks += [asyncio.ensure_future(run(index)) for index in singles]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            for item in await finished:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def extract_risk_profiles_async(texts, schema_fields, **options):
+    texts = list(texts)
+    results = [None] * len(texts)
+    async for index, result in iter_risk_profile_extractions(texts, schema_fields, **options):
+        results[index] = result
+    return results
+
+
+def extract_risk_profiles_from_texts(texts, schema_fields, **options):
+    """Blocking wrapper around extract_risk_profiles_async; results follow the order of `texts`."""
+    return asyncio.run(extract_risk_profiles_async(texts, schema_fields, **options))
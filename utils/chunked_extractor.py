@@ -0,0 +1,139 @@
+import re
+from collections import Counter
+
+from utils.async_extractor import estimate_tokens, extract_risk_profiles_from_texts
+
+# Documents longer than this go through the chunked path instead of a single prompt
+LONG_DOCUMENT_TOKENS = 3000
+DEFAULT_CHUNK_TOKENS = 2500
+
+# Pages mentioning none of these can't contribute to any schema field. Words that
+# boilerplate uses too ("state", "contents", "value", "area", "zone") only count
+# in the phrasing a submission gives them, and every term starts on a word
+# boundary so "history" or "statement" don't match "story" or "state"
+RELEVANT_RE = re.compile(
+    r"\baddress|\bzip\b|\bpostal\b|\bbuilt\b|\bconstruct(?:ion|ed)\b|\bframe\b"
+    r"|\bmasonry\b|\bjoisted\b|\broof|\bsq\.?\s*ft|\bsquare\s+f(?:ee|oo)t|\b(?:floor|building|gross)\s+area\b"
+    r"|\bstor(?:y|ey|ies)\b|\boccupan|\btenant|\bhazard|\bflammable|\bchemical|\blithium|\bsprinkler|\balarm"
+    r"|\bfire\s+(?:protection|suppression)\b|\bTIV\b|\binsured\s+value|\b(?:building|replacement)\s+value"
+    r"|\bcontents\s+(?:TIV|value|limit|coverage)\b|\bbusiness\s+interruption\b|\bextra\s+expense\b|\bclaims?\b"
+    r"|\bloss(?:es)?\b|\bflood|\bzone\s+(?:a|ae|ah|ao|v|ve|x|b|c|d)\b|\bwildfire|\bbrush\b|\bearthquake|\bseismic"
+    r"|\bshakemap",
+    re.IGNORECASE,
+)
+_PARAGRAPH_BREAK_RE = re.compile(r"\n\s*\n")
+# Answer of a Y/N field that carries the risk (and a red flag); "Yes" for fields not listed
+RISK_ANSWERS = {"Sprinkler System (Y/N)": "No", "Fire Alarm (Y/N)": "No", "No sprinklers": "Yes"}
+
+
+def split_pages(text):
+    # PDF text carries form feeds between pages; pasted text falls back to paragraphs
+    if isinstance(text, (list, tuple)):
+        return [page for page in text if page.strip()]
+    if "\f" in text:
+        parts = text.split("\f")
+    else:
+        parts = _PARAGRAPH_BREAK_RE.split(text)
+    return [part for part in parts if part.strip()]
+
+
+def is_relevant(page):
+    return RELEVANT_RE.search(page) is not None
+
+
+def build_chunks(pages, chunk_tokens=DEFAULT_CHUNK_TOKENS):
+    """Pack pages in order into chunks of at most `chunk_tokens` estimated tokens."""
+    max_chars = chunk_tokens * 4
+    chunks = []
+    current = []
+    current_tokens = 0
+    for page in pages:
+        # A single oversized page is cut into budget-sized pieces on line boundaries
+        pieces = [page] if estimate_tokens(page) <= chunk_tokens else _split_oversized(page, max_chars)
+        for piece in pieces:
+            tokens = estimate_tokens(piece)
+            if current and current_tokens + tokens > chunk_tokens:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _split_oversized(page, max_chars):
+    pieces = []
+    current = ""
+    for line in page.splitlines(keepends=True):
+        while len(line) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if len(current) + len(line) > max_chars:
+            pieces.append(current)
+            current = ""
+        current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def merge_extractions(results, fields):
+    """Merge per-chunk extractions into one profile, independent of completion order.
+
+    A chunk that never mentions a field reports it empty, so chunks answering a
+    Y/N field "Yes" and "No" genuinely disagree ("sprinklered" on one page,
+    "sprinkler system removed" on a later one); the conflict is printed and
+    resolved toward the answer that carries the risk (RISK_ANSWERS), so it
+    still raises its red flag. Every other field takes its most common
+    non-empty value (compared case- and whitespace-insensitively), ties going
+    to the earliest chunk.
+    """
+    merged = {}
+    for field in fields:
+        values = []
+        for result in results:
+            value = result.get(field, "")
+            if value is not None and str(value).strip():
+                values.append(value)
+        if not values:
+            merged[field] = ""
+        elif "(Y/N)" in field or field in RISK_ANSWERS:
+            answers = {str(value).strip().capitalize() for value in values} & {"Yes", "No"}
+            if len(answers) > 1:
+                risk = RISK_ANSWERS.get(field, "Yes")
+                print(f"Chunks disagree on {field!r}; using {risk!r}")
+                merged[field] = risk
+            else:
+                merged[field] = answers.pop() if answers else values[0]
+        else:
+            keys = [" ".join(str(value).lower().split()) for value in values]
+            counts = Counter(keys)
+            best = max(counts.values())
+            merged[field] = next(value for value, key in zip(values, keys) if counts[key] == best)
+    return merged
+
+
+def extract_risk_profile_chunked(text, schema_fields, chunk_tokens=DEFAULT_CHUNK_TOKENS, prefilter=True, **options):
+    """Extract a long document chunk by chunk, in parallel, and merge the results.
+
+    `text` is the document text or a list of page texts. With `prefilter`, pages
+    that mention no relevant keyword are dropped before chunking. Extra options
+    go to the async extraction pipeline (concurrency, rate limits, client, cache).
+    """
+    fields = [field for section in schema_fields.values() for field in section]
+    pages = split_pages(text)
+    if prefilter:
+        pages = [page for page in pages if is_relevant(page)] or pages
+    chunks = build_chunks(pages, chunk_tokens)
+    if not chunks:
+        return {field: "" for field in fields}
+
+    results = extract_risk_profiles_from_texts(chunks, schema_fields, **options)
+    extracted = [result for result in results if isinstance(result, dict) and "error" not in result]
+    if not extracted:
+        return results[0]
+    return merge_extractions(extracted, fields)
@@ -0,0 +1,180 @@
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_PATH = os.getenv("COPRIA_LLM_CACHE", "output/llm_cache.sqlite")
+# Memory hits refresh the disk rows' accessed_at in batches of this many keys
+ACCESS_FLUSH_EVERY = 64
+
+
+def normalize_text(text):
+    # Whitespace and line-wrapping differences between uploads of the same document don't matter
+    return " ".join((text or "").split())
+
+
+def make_cache_key(text, fields, model, prompt_version):
+    payload = json.dumps([normalize_text(text), list(fields), model, prompt_version])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(result):
+    # Never keep failed extractions around; the next attempt should hit the API again
+    return isinstance(result, dict) and "error" not in result
+
+
+class ExtractionCache:
+    """Two-tier cache of LLM extraction results: an in-memory LRU in front of a sqlite file.
+
+    Entries older than max_age_seconds are treated as misses and purged; each
+    tier evicts its least recently used entries once it holds more than its limit.
+    Hits served from memory still count as uses of the disk entry: their
+    accessed_at is written back in batches, and always before disk eviction.
+    Pass path=None for a memory-only cache.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_memory_entries=256, max_disk_entries=10_000,
+                 max_age_seconds=30 * 24 * 3600):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.max_age_seconds = max_age_seconds
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "memory_evictions": 0,
+                      "disk_evictions": 0}
+        self._memory = OrderedDict()
+        # key -> time of its latest memory hit, not yet written to the disk row
+        self._accessed = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS extractions ("
+                "key TEXT PRIMARY KEY, result TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS extractions_accessed ON extractions (accessed_at)")
+            self._db.commit()
+
+    @property
+    def hits(self):
+        return self.stats["memory_hits"] + self.stats["disk_hits"]
+
+    @property
+    def misses(self):
+        return self.stats["misses"]
+
+    @property
+    def evictions(self):
+        return self.stats["memory_evictions"] + self.stats["disk_evictions"]
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, result = entry
+                if now - created_at <= self.max_age_seconds:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    if self._db is not None:
+                        self._accessed[key] = now
+                        if len(self._accessed) >= ACCESS_FLUSH_EVERY:
+                            self._flush_accessed()
+                            self._db.commit()
+                    return copy.deepcopy(result)
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT result, created_at FROM extractions WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if now - row[1] <= self.max_age_seconds:
+                        self._db.execute("UPDATE extractions SET accessed_at = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        result = json.loads(row[0])
+                        self._remember(key, row[1], result)
+                        self.stats["disk_hits"] += 1
+                        return copy.deepcopy(result)
+                    self._db.execute("DELETE FROM extractions WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, result):
+        if not is_cacheable(result):
+            return False
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, copy.deepcopy(result))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO extractions (key, result, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(result), now, now),
+                )
+                self._accessed.pop(key, None)
+                self._flush_accessed()
+                self._evict_disk(now)
+                self._db.commit()
+            self.stats["stores"] += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._accessed.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM extractions")
+                self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._flush_accessed()
+                self._db.commit()
+            self._db.close()
+            self._db = None
+
+    def _remember(self, key, created_at, result):
+        self._memory[key] = (created_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.stats["memory_evictions"] += 1
+
+    def _flush_accessed(self):
+        if self._accessed:
+            self._db.executemany(
+                "UPDATE extractions SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._accessed.items()],
+            )
+            self._accessed.clear()
+
+    def _evict_disk(self, now):
+        expired = self._db.execute(
+            "DELETE FROM extractions WHERE created_at < ?", (now - self.max_age_seconds,)
+        ).rowcount
+        overflow = self._db.execute(
+            "DELETE FROM extractions WHERE key IN ("
+            "SELECT key FROM extractions ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        ).rowcount
+        self.stats["disk_evictions"] += expired + overflow
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ExtractionCache()
+    return _default_cache
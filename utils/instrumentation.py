@@ -0,0 +1,208 @@
+import json
+import threading
+import time
+from contextvars import ContextVar
+
+# Sinks registered for the whole process (e.g. a JSONL log for nightly runs)
+_global_sinks = []
+# Sinks registered for the current context only, e.g. one Streamlit script run
+_context_sinks = ContextVar("copria_context_sinks", default=())
+_current_span = ContextVar("copria_current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "attributes", "started_at", "_start", "_token")
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._start
+        _current_span.reset(self._token)
+        record = {"name": self.name, "started_at": self.started_at, "seconds": seconds}
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        record.update(self.attributes)
+        for sink in _active_sinks():
+            sink.emit(record)
+        return False
+
+
+class _NullSpan:
+    # Shared stand-in returned while nothing is listening
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _active_sinks():
+    return (*_global_sinks, *_context_sinks.get())
+
+
+def enabled():
+    return bool(_global_sinks or _context_sinks.get())
+
+
+def span(name, **attributes):
+    """Time a block as a named pipeline stage: `with span("stage") as s: ...; s.set(key=value)`."""
+    if not _global_sinks and not _context_sinks.get():
+        return _NULL_SPAN
+    return Span(name, attributes)
+
+
+def annotate(**attributes):
+    """Attach attributes to the innermost open span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def add_sink(sink):
+    _global_sinks.append(sink)
+
+
+def remove_sink(sink):
+    if sink in _global_sinks:
+        _global_sinks.remove(sink)
+
+
+def start_capture(sink=None):
+    """Send spans recorded in the current context (thread or task) to `sink`, an in-memory sink by default."""
+    sink = sink if sink is not None else InMemorySink()
+    _context_sinks.set((*_context_sinks.get(), sink))
+    return sink
+
+
+def stop_capture(sink):
+    _context_sinks.set(tuple(s for s in _context_sinks.get() if s is not sink))
+
+
+class InMemorySink:
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+
+
+class JsonlSink:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def emit(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class PrometheusSink:
+    """Aggregates spans into counters and renders them in the Prometheus text exposition format."""
+
+    def __init__(self, prefix="copria"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._seconds = {}
+        self._tokens = {}
+        self._cache_hits = {}
+        self._rule_seconds = {}
+
+    def emit(self, record):
+        stage = record["name"]
+        with self._lock:
+            self._calls[stage] = self._calls.get(stage, 0) + 1
+            self._seconds[stage] = self._seconds.get(stage, 0.0) + record["seconds"]
+            for kind in ("prompt", "completion"):
+                tokens = record.get(f"{kind}_tokens")
+                if tokens:
+                    self._tokens[(stage, kind)] = self._tokens.get((stage, kind), 0) + tokens
+            if record.get("cache_hit"):
+                self._cache_hits[stage] = self._cache_hits.get(stage, 0) + 1
+            for rule, seconds in (record.get("rule_seconds") or {}).items():
+                self._rule_seconds[rule] = self._rule_seconds.get(rule, 0.0) + seconds
+
+    def render(self):
+        p = self.prefix
+        with self._lock:
+            metrics = [
+                (f"{p}_stage_calls_total", "Pipeline stage invocations.",
+                 [({"stage": s}, v) for s, v in self._calls.items()]),
+                (f"{p}_stage_seconds_total", "Wall time spent per pipeline stage.",
+                 [({"stage": s}, v) for s, v in self._seconds.items()]),
+                (f"{p}_llm_tokens_total", "LLM tokens used per stage.",
+                 [({"stage": s, "kind": k}, v) for (s, k), v in self._tokens.items()]),
+                (f"{p}_cache_hits_total", "Stage calls served from cache.",
+                 [({"stage": s}, v) for s, v in self._cache_hits.items()]),
+                (f"{p}_rule_seconds_total", "Time spent evaluating each red flag rule.",
+                 [({"rule": r}, v) for r, v in self._rule_seconds.items()]),
+            ]
+        lines = []
+        for name, help_text, samples in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in samples:
+                rendered = ",".join(f'{key}="{_label(val)}"' for key, val in labels.items())
+                lines.append(f"{name}{{{rendered}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # For the node_exporter textfile collector
+        with open(path, "w") as f:
+            f.write(self.render())
+
+
+def summarize(records):
+    """Per-stage totals (calls, wall time, tokens, cache hits) and per-rule cost from span records."""
+    stages = {}
+    rules = {}
+    for record in records:
+        row = stages.setdefault(record["name"], {
+            "stage": record["name"], "calls": 0, "total_seconds": 0.0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cache_hits": 0,
+        })
+        row["calls"] += 1
+        row["total_seconds"] += record["seconds"]
+        row["prompt_tokens"] += record.get("prompt_tokens") or 0
+        row["completion_tokens"] += record.get("completion_tokens") or 0
+        row["cache_hits"] += 1 if record.get("cache_hit") else 0
+        for rule, seconds in (record.get("rule_seconds") or {}).items():
+            rules[rule] = rules.get(rule, 0.0) + seconds
+    for row in stages.values():
+        row["mean_ms"] = row["total_seconds"] / row["calls"] * 1000
+    rule_rows = [{"rule": rule, "total_seconds": seconds} for rule, seconds in
+                 sorted(rules.items(), key=lambda item: item[1], reverse=True)]
+    return list(stages.values()), rule_rows
@@ -0,0 +1,184 @@
+import codecs
+import json
+import os
+import re
+
+_WHITESPACE_RE = re.compile(r"\s*")
+# Characters that can still follow the digits a number was decoded from ("1" of "1.5e10")
+_NUMBER_TAIL_RE = re.compile(r"[\d.eE+-]*\Z")
+BLOCK_SIZE = 1 << 16
+
+
+def _iter_text_blocks(fp, block_size):
+    # Uploaded files yield bytes, opened text files yield str
+    decoder = None
+    while True:
+        block = fp.read(block_size)
+        if not block:
+            if decoder is not None:
+                tail = decoder.decode(b"", final=True)
+                if tail:
+                    yield tail
+            return
+        if isinstance(block, bytes):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder("utf-8-sig")()
+            block = decoder.decode(block)
+        yield block
+
+
+class _Reader:
+    def __init__(self, fp, block_size):
+        self.blocks = _iter_text_blocks(fp, block_size)
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        block = next(self.blocks, None)
+        if block is None:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + block
+        self.pos = 0
+        return True
+
+    def peek(self):
+        # Next non-whitespace character, or "" at end of input
+        while True:
+            self.pos = _WHITESPACE_RE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def value(self, decoder):
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+                # A number cut by the block edge decodes as its leading part ("1" of "1.5e10"), so
+                # one followed only by number characters up to the edge may continue in the next block
+                if self.eof or (end < len(self.buffer) and not (
+                        isinstance(value, (int, float)) and _NUMBER_TAIL_RE.match(self.buffer, end))):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def iter_json_records(fp, block_size=BLOCK_SIZE, allow_truncated=False):
+    """Yield records one at a time from a JSON array or from JSONL, reading `fp` incrementally.
+
+    Memory use is bounded by the largest single record, not the file. With
+    `allow_truncated`, a file cut off mid-array (e.g. output from a run that
+    crashed) yields every complete record instead of raising.
+    """
+    reader = _Reader(fp, block_size)
+    decoder = json.JSONDecoder()
+    if reader.peek() != "[":
+        # JSONL, or any whitespace-separated sequence of JSON values
+        while reader.peek():
+            try:
+                yield reader.value(decoder)
+            except json.JSONDecodeError:
+                if allow_truncated:
+                    return
+                raise
+        return
+
+    reader.pos += 1
+    if reader.peek() == "]":
+        return
+    while True:
+        try:
+            yield reader.value(decoder)
+        except json.JSONDecodeError:
+            if allow_truncated:
+                return
+            raise
+        separator = reader.peek()
+        if separator == ",":
+            reader.pos += 1
+        elif separator == "]":
+            return
+        elif separator == "" and allow_truncated:
+            return
+        else:
+            raise json.JSONDecodeError("Expecting ',' or ']'", reader.buffer, reader.pos)
+
+
+def iter_json_file(path, allow_truncated=False):
+    with open(path, encoding="utf-8") as f:
+        yield from iter_json_records(f, allow_truncated=allow_truncated)
+
+
+def _json_default(value):
+    # Lets writers take RiskProfile objects (or anything else with a dict view) as records
+    to_dict = getattr(value, "to_dict", None)
+    if to_dict is None:
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+    return to_dict()
+
+
+class JsonlWriter:
+    """Append records to a JSONL file as they are produced; every complete line survives a crash."""
+
+    def __init__(self, path, mode="w"):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.count = 0
+        self._file = open(path, mode, encoding="utf-8")
+
+    def write(self, record):
+        self._file.write(json.dumps(record, default=_json_default) + "\n")
+        self.count += 1
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JsonArrayWriter(JsonlWriter):
+    """Write records into a JSON array incrementally.
+
+    The closing bracket is only written on close; a file left open by a crash
+    can still be read back with iter_json_records(..., allow_truncated=True).
+    """
+
+    def __init__(self, path, indent=None):
+        super().__init__(path)
+        self.indent = indent
+        self._file.write("[")
+
+    def write(self, record):
+        self._file.write(",\n" if self.count else "\n")
+        self._file.write(json.dumps(record, indent=self.indent, default=_json_default))
+        self.count += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._file.write("\n]\n" if self.count else "]\n")
+        super().close()
+
+
+def open_record_writer(path, indent=None):
+    # .jsonl gets one record per line; anything else a JSON array
+    if path.endswith(".jsonl"):
+        return JsonlWriter(path)
+    return JsonArrayWriter(path, indent=indent)
@@ -1,21 +1,73 @@
-import openai
 import os
 import json
+from functools import lru_cache
 from dotenv import load_dotenv
+from utils.extraction_cache import get_default_cache, make_cache_key
+from utils.instrumentation import annotate, span
+from utils.pattern_extractor import merge_pattern_fields, split_confident
 
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 print("Loaded OpenAI Key:", os.getenv("OPENAI_API_KEY"))
 
-def extract_risk_profile_from_text(text, schema_fields):
-    # Flatten all fields from schema
-    fields = [field for section in schema_fields.values() for field in section]
+MODEL = "gpt-3.5-turbo"
+# Bump whenever the prompt wording changes so cached extractions are not reused
+PROMPT_VERSION = "1"
+
+
+def _openai():
+    # Imported on first use; the client library is a large share of app start-up time
+    import openai
+    if openai.api_key is None:
+        openai.api_key = os.getenv("OPENAI_API_KEY")
+    return openai
+
 
+def build_extraction_prompt(text, fields):
+    return _prompt_header(tuple(fields)) + text + "\n"
+
+
+def build_batch_extraction_prompt(items, fields):
+    """One prompt for several submissions; `items` is a list of (id, text) pairs."""
+    parts = [_batch_prompt_header(tuple(fields))]
+    for item_id, text in items:
+        parts.append(f"=== SUBMISSION {item_id} ===\n{text}\n=== END SUBMISSION {item_id} ===\n\n")
+    return "".join(parts)
+
+
+# Everything before the submission text depends only on the field list, so each header is built once per list
+@lru_cache(maxsize=64)
+def _prompt_header(fields):
     # Generate JSON example template
     json_template = {field: "" for field in fields}
     formatted_template = json.dumps(json_template, indent=2)
 
-    prompt = f"""
+    prompt = _instructions(fields) + f"""
+### Example JSON output:
+{formatted_template}
+
+### Submission Text:
+"""
+    return prompt
+
+
+@lru_cache(maxsize=64)
+def _batch_prompt_header(fields):
+    json_template = [{"id": "1", **{field: "" for field in fields}}]
+    formatted_template = json.dumps(json_template, indent=2)
+
+    return _instructions(fields) + f"""9. Several submissions follow, each between "=== SUBMISSION <id> ===" and "=== END SUBMISSION <id> ===". They are different properties: extract each one on its own and never carry information from one submission to another
+10. Return a JSON array with exactly one object per submission. Each object has an "id" key holding the submission's id, plus the fields above
+
+### Example JSON output:
+{formatted_template}
+
+### Submissions:
+"""
+
+
+def _instructions(fields):
+    fields = list(fields)
+    return f"""
 You are a commercial property insurance assistant. Extract risk-related information from the submission text and map it to the required fields.
 
 IMPORTANT: The text may use different terminology than the exact field names. Use your judgment to map the information correctly.
@@ -46,18 +98,47 @@ IMPORTANT: The text may use different terminology than the exact field names. Us
 6. For Y/N fields, use "Yes" or "No" based on the presence/absence of the feature
 7. For missing information, use empty string ""
 8. Return valid JSON format
+"""
 
-### Example JSON output:
-{formatted_template}
 
-### Submission Text:
-{text}
-"""
+def extract_risk_profile_from_text(text, schema_fields, cache=None, fast_path=True):
+    """Extract the schema fields from submission text.
+
+    With `fast_path`, fields stated in predictable phrasing are filled by pattern
+    matching first and the LLM is only asked for the rest (or not at all).
+    """
+    with span("extract_risk_profile_from_text"):
+        return _extract_risk_profile(text, schema_fields, cache, fast_path)
+
+
+def _extract_risk_profile(text, schema_fields, cache, fast_path):
+    # Flatten all fields from schema
+    fields = [field for section in schema_fields.values() for field in section]
+
+    values, missing = split_confident(text, fields) if fast_path else ({}, fields)
+    annotate(pattern_fields=len(values))
+    if not missing:
+        annotate(llm_skipped=True)
+        return merge_pattern_fields(values, {}, fields)
+
+    # Reuse the extraction for a document we've already sent with the same prompt;
+    # pass cache=False to always call the API
+    if cache is None:
+        cache = get_default_cache()
+    cache_key = make_cache_key(text, missing, MODEL, PROMPT_VERSION)
+    if cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            annotate(cache_hit=True)
+            return merge_pattern_fields(values, cached, fields)
+    annotate(cache_hit=False)
+
+    prompt = build_extraction_prompt(text, missing)
 
     try:
         # Use the new OpenAI API format
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
+        response = _openai().chat.completions.create(
+            model=MODEL,
             messages=[
                 {"role": "user", "content": prompt}
             ],
@@ -65,9 +146,14 @@ IMPORTANT: The text may use different terminology than the exact field names. Us
             max_tokens=1000,
         )
         extracted = response.choices[0].message.content
+        if response.usage is not None:
+            annotate(prompt_tokens=response.usage.prompt_tokens, completion_tokens=response.usage.completion_tokens)
 
         # Parse response into JSON
-        return json.loads(extracted)
+        result = json.loads(extracted)
+        if cache:
+            cache.put(cache_key, result)
+        return merge_pattern_fields(values, result, fields)
 
     except Exception as e:
         print(f"LLM extraction error: {str(e)}")
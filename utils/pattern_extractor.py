@@ -0,0 +1,289 @@
+import re
+
+# Fields at or above this confidence are trusted without asking the LLM
+MIN_CONFIDENCE = 0.8
+# Confidence that a field is empty because the text never mentions its subject
+ABSENT_CONFIDENCE = 0.9
+
+_FLAGS = re.IGNORECASE | re.MULTILINE
+_AMOUNT = r"(\$\s?[\d,]+(?:\.\d+)?(?:\s*(?:million|mm|m)\b)?)"
+_LEVEL = r"(low|moderate|medium|high|extreme)"
+_COUNT_WORDS = {
+    "zero": 0, "one": 1, "single": 1, "two": 2, "three": 3, "four": 4,
+    "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+# Counts that mean "some": "no"/"zero" claims are matched by the negative patterns instead
+_COUNT = r"(\d+|" + "|".join(word for word in _COUNT_WORDS if word != "zero") + r")"
+# A labelled Y/N answer: "Sprinkler System (Y/N): No", "Fire alarm: N", "Hazardous materials: none stored"
+_ANSWER = r"(?:[ \t]*\([ \t]*Y[ \t]*/[ \t]*N[ \t]*\))?[ \t]*[:\-][ \t]*(yes|y|true|no|n/?a|none|n|false)(?![\w/])"
+_ANSWERS = {"yes": "Yes", "y": "Yes", "true": "Yes", "no": "No", "n": "No", "none": "No", "n/a": "No", "na": "No",
+            "false": "No"}
+_NOT_INSTALLED = (r"\s+(?:(?:is|are|was|were)\s+)?not\s+(?:installed|present|provided)\b"
+                  r"|\s+(?:(?:was|were|has\s+been|have\s+been)\s+)(?:removed|disabled|decommissioned|disconnected)\b")
+# Confidence of a bare mention of the subject ("the sprinkler system ..."), which says
+# nothing about the answer on its own: below MIN_CONFIDENCE, so the LLM decides
+_MENTION = 0.7
+# A subject word that isn't the tail of "non-flammable" and the like
+_SUBJECT = r"(?<![\w-])"
+_STATES = {
+    "AL", "AK", "AZ", "AR", "CA", "CO", "CT", "DE", "DC", "FL", "GA", "HI", "ID", "IL", "IN", "IA", "KS",
+    "KY", "LA", "ME", "MD", "MA", "MI", "MN", "MS", "MO", "MT", "NE", "NV", "NH", "NJ", "NM", "NY", "NC",
+    "ND", "OH", "OK", "OR", "PA", "PR", "RI", "SC", "SD", "TN", "TX", "UT", "VT", "VA", "WA", "WV", "WI", "WY",
+}
+
+
+def _count(value):
+    value = value.lower()
+    return str(_COUNT_WORDS[value]) if value in _COUNT_WORDS else value
+
+
+def _answer(value):
+    return _ANSWERS[value.lower()]
+
+
+def _level(value):
+    value = value.lower()
+    return "Moderate" if value == "medium" else value.title()
+
+
+def _state(value):
+    value = value.upper()
+    return value if value in _STATES else None
+
+
+def _text(value):
+    return value.strip().rstrip(".") or None
+
+
+def _amount(value):
+    return " ".join(value.split())
+
+
+def _pattern(regex, convert=_text, confidence=0.95):
+    return re.compile(regex, _FLAGS), convert, confidence
+
+
+def _constant(regex, value, confidence=0.9):
+    return _pattern(regex, lambda _: value, confidence)
+
+
+# field -> patterns, earlier ones taking precedence over later ones where their matches
+# overlap ("no sprinkler system" is a No, not also a Yes); see _match. Labelled
+# "Field: value" lines are trusted most, free-text phrasings less.
+FIELD_PATTERNS = {
+    "Property Address": [
+        _pattern(r"^[ \t]*(?:property\s+)?address[ \t]*[:\-][ \t]*(\S.*)$"),
+    ],
+    "Zip Code": [
+        _pattern(r"\b(?:zip(?:\s+code)?|postal\s+code)[ \t]*[:#\-]?[ \t]*(\d{5}(?:-\d{4})?)\b"),
+        _pattern(r"\b[A-Z]{2}[ \t]+(\d{5}(?:-\d{4})?)[ \t]*$", confidence=0.85),
+    ],
+    "State": [
+        _pattern(r"^[ \t]*state[ \t]*[:\-][ \t]*([A-Za-z]{2})\b", _state),
+        _pattern(r",[ \t]*([A-Z]{2})(?:[ \t]+\d{5}(?:-\d{4})?)?[ \t]*$", _state, 0.85),
+    ],
+    "Property Name": [
+        _pattern(r"^[ \t]*property\s+name[ \t]*[:\-][ \t]*(\S.*)$"),
+    ],
+    "Year Built": [
+        _pattern(r"\b(?:year\s+built|built\s+in|constructed\s+in|built\s+circa|completed\s+in)"
+                 r"[ \t]*[:\-]?[ \t]*((?:18|19|20)\d{2})\b"),
+    ],
+    "Construction Type": [
+        _pattern(r"^[ \t]*construction(?:\s+type)?[ \t]*[:\-][ \t]*(\S.*)$", confidence=0.9),
+        _pattern(r"\b(?:using|built\s+(?:of|with)|constructed\s+(?:of|with))\s+"
+                 r"((?:reinforced\s+|tilt-up\s+)?concrete|(?:joisted\s+)?masonry|(?:steel|metal|wood)\s+frame)\b",
+                 lambda value: value.lower().capitalize(), 0.85),
+    ],
+    "Roof Type & Age": [
+        _pattern(r"^[ \t]*roof(?:\s+type)?(?:\s*(?:&|and)\s*age)?[ \t]*[:\-][ \t]*(\S.*)$", confidence=0.9),
+    ],
+    "Building Area (sq ft)": [
+        _pattern(r"\b(\d{1,3}(?:,\d{3})+|\d+)\s*(?:sq\.?\s*ft\.?|square\s+feet|sf)\b", confidence=0.9),
+    ],
+    "Number of Stories": [
+        _pattern(r"\b(?:number\s+of\s+)?stor(?:ies|eys)[ \t]*[:\-][ \t]*" + _COUNT + r"\b", _count),
+        # "Two-story warehouse" usually describes the building, but "a 2-story garage" doesn't
+        _pattern(r"\b" + _COUNT + r"[- ]stor(?:y|ey|ies)\b", _count, _MENTION),
+    ],
+    "Occupancy Type": [
+        _pattern(r"^[ \t]*occupancy(?:\s+type)?[ \t]*[:\-][ \t]*(\S.*)$", confidence=0.9),
+    ],
+    "% Occupied": [
+        _pattern(r"\b(\d{1,3}(?:\.\d+)?\s?%)\s+(?:occupied|leased)\b", lambda value: value.replace(" ", ""), 0.9),
+        _pattern(r"\boccupancy\s+rate[ \t]*(?:of|is|:)?[ \t]*(\d{1,3}(?:\.\d+)?\s?%)",
+                 lambda value: value.replace(" ", ""), 0.9),
+    ],
+    # Y/N fields: a labelled answer first, then stated absence or presence; a bare mention
+    # of the subject only gets _MENTION confidence
+    "Hazardous Materials (Y/N)": [
+        _pattern(r"\b(?:hazardous|flammable|dangerous)\s+(?:materials|substances|goods|chemicals)" + _ANSWER, _answer),
+        _constant(r"\b(?:no|without)\s+(?:hazardous|flammable|dangerous)\s+(?:materials|substances|goods|chemicals)\b",
+                  "No", 0.85),
+        _constant(r"\b(?:stor(?:es|ed|ing|age\s+of)|handl(?:es|ed|ing)|us(?:es|ed|ing)|contains?)\s+(?:\w+,?\s+){0,3}?"
+                  r"(?:flammable|hazardous|dangerous|combustible|lithium)\b", "Yes", 0.85),
+        _constant(_SUBJECT + r"(?:flammable|hazardous\s+(?:materials|chemicals|substances|goods)|dangerous\s+substances"
+                  r"|combustible\s+(?:materials|liquids)|lithium\s+batteries)\b", "Yes", _MENTION),
+    ],
+    "Sprinkler System (Y/N)": [
+        _pattern(r"\bsprinkler(?:s|ed|\s+(?:system|coverage|protection))?" + _ANSWER, _answer),
+        # The negation has to govern the sprinklers themselves, not some other noun nearby
+        _constant(r"\b(?:no|without|lacks?)\s+(?:(?:automatic|fire|wet|dry|working)\s+)?sprinklers?\b"
+                  r"|\bnot\s+sprinklered\b|\bunsprinklered\b"
+                  r"|\bsprinklers?(?:\s+(?:system|coverage|protection))?(?:" + _NOT_INSTALLED + ")",
+                  "No", 0.85),
+        _constant(_SUBJECT + r"(?:full|partial|automatic|wet|dry)\s+sprinkler\s+(?:system|coverage|protection)\b"
+                  r"|" + _SUBJECT + r"sprinklered\b"
+                  r"|" + _SUBJECT + r"sprinklers?(?:\s+systems?)?\s+(?:(?:are|is)\s+installed|throughout)\b", "Yes", 0.85),
+        _constant(_SUBJECT + r"sprinkler\s+(?:system|coverage|protection)\b", "Yes", _MENTION),
+    ],
+    "Fire Alarm (Y/N)": [
+        _pattern(r"\b(?:fire\s+)?alarms?(?:\s+systems?)?" + _ANSWER, _answer),
+        _constant(r"\b(?:no|without|lacks?)\s+(?:(?:fire|smoke|monitored)\s+)?alarms?\b"
+                  r"|\b(?:fire\s+)?alarms?(?:\s+systems?)?(?:" + _NOT_INSTALLED + ")", "No", 0.85),
+        _constant(r"\b(?:monitored|central[- ]station|addressable)\s+(?:fire\s+)?alarms?\b"
+                  r"|\b(?:fire\s+)?alarms?(?:\s+systems?)?\s+(?:is|are)\s+(?:installed|monitored|in\s+place)\b",
+                  "Yes", 0.85),
+        _constant(r"\bfire\s+alarms?\b|\balarm\s+systems?\b", "Yes", _MENTION),
+    ],
+    "Building TIV": [
+        _pattern(r"\bbuilding\s+(?:TIV|value|limit)[ \t]*(?:of|is|:|-)?[ \t]*" + _AMOUNT, _amount, 0.9),
+    ],
+    "Contents TIV": [
+        _pattern(r"\bcontents\s+(?:TIV|value|limit)[ \t]*(?:of|is|:|-)?[ \t]*" + _AMOUNT, _amount, 0.9),
+    ],
+    "BI/EE": [
+        _pattern(r"\b(?:BI/EE|business\s+interruption(?:\s*(?:/|and)\s*extra\s+expense)?)"
+                 r"[ \t]*(?:of|is|:|-)?[ \t]*" + _AMOUNT, _amount, 0.9),
+    ],
+    "Total TIV": [
+        _pattern(r"\b(?:total\s+insured\s+value|total\s+TIV|^[ \t]*TIV)(?:\s*\(USD\))?[ \t]*(?:is|of|:|-)?[ \t]*" + _AMOUNT,
+                 _amount),
+    ],
+    "Prior Claims (Y/N)": [
+        _constant(r"\b(?:no|zero)\s+(?:prior\s+|previous\s+|insurance\s+)*(?:claims|losses)\b"
+                  r"|\b(?:claims|loss)[- ]free\b", "No", 0.85),
+        _constant(r"\b" + _COUNT + r"\s+(?:\w+\s+){0,2}(?:claims?|losses)\b", "Yes", 0.85),
+    ],
+    "Number of Claims": [
+        _constant(r"\b(?:no|zero)\s+(?:prior\s+|previous\s+|insurance\s+)*(?:claims|losses)\b"
+                  r"|\b(?:claims|loss)[- ]free\b", "0", 0.85),
+        _pattern(r"\b" + _COUNT + r"\s+(?:\w+\s+){0,2}(?:claims?|losses)\b", _count, 0.85),
+    ],
+    "Total Loss Amount": [
+        _pattern(r"\b(?:total\s+loss(?:es)?(?:\s+amount)?|loss(?:es)?\s+amounting\s+to|totall?ing|incurred)"
+                 r"[ \t]*(?:of|:|-)?[ \t]*" + _AMOUNT, _amount, 0.9),
+    ],
+    "Flood Zone (e.g., Zone X, AE)": [
+        # The zone letter is case-sensitive, so "zone a short drive away" is not Zone A
+        _pattern(r"\b(?:flood\s+)?zone[ \t]*:?[ \t]*((?-i:A[EOHR]?|A99|VE?|X|B|C|D))\b",
+                 lambda value: f"Zone {value}", 0.9),
+    ],
+    "Wildfire Risk (Low/Moderate/High or ISO Class)": [
+        _pattern(r"\b" + _LEVEL + r"(?:[- ]level)?\s+wildfire\b", _level, 0.9),
+        _pattern(r"\bwildfire\s+(?:risk|exposure|hazard)[ \t]*(?:is|:|-)?[ \t]*" + _LEVEL + r"\b", _level, 0.9),
+    ],
+    "Earthquake Exposure (Low/Moderate/High or ShakeMap Zone)": [
+        _pattern(r"\b" + _LEVEL + r"(?:[- ]level)?\s+(?:earthquake|seismic)\b", _level, 0.9),
+        _pattern(r"\b(?:earthquake|seismic)\s+(?:risk|exposure|hazard|activity)[ \t]*(?:is|:|-)?[ \t]*" + _LEVEL + r"\b",
+                 _level, 0.9),
+    ],
+}
+
+# field -> words the text must contain for the field to have a value at all
+FIELD_MENTIONS = {
+    field: re.compile(regex, re.IGNORECASE) for field, regex in {
+        "Zip Code": r"\bzip\b|\bpostal\b|\b\d{5}\b",
+        "Roof Type & Age": r"\broof",
+        "Building Area (sq ft)": r"\bsq\.?\s*ft|\bsquare\s+f|\bsf\b|\b(?:floor|building|gross)\s+area\b",
+        "Number of Stories": r"\bstor(?:y|ey|ies)\b|\bfloors?\b",
+        "Occupancy Type": r"\boccup|\bused\s+(?:as|for)\b|\btenant",
+        "% Occupied": r"%|\bpercent|\boccupied\b|\bvacan",
+        "Hazardous Materials (Y/N)": r"\bhazard|\bflammable|\bchemical|\bcombustible|\blithium|\bdangerous",
+        "Sprinkler System (Y/N)": r"\bsprinkler",
+        "Fire Alarm (Y/N)": r"\balarm",
+        "Building TIV": r"\bbuilding\s+(?:TIV|value|limit)",
+        "Contents TIV": r"\bcontents\b",
+        "BI/EE": r"\bBI\b|\binterruption\b|\bextra\s+expense",
+        "Total TIV": r"\bTIV\b|\binsured\s+value",
+        "Prior Claims (Y/N)": r"\bclaim|\bloss",
+        "Number of Claims": r"\bclaim|\bloss",
+        "Total Loss Amount": r"\bloss|\bclaim|\bpaid\b",
+        "Flood Zone (e.g., Zone X, AE)": r"\bflood|\bzone\b",
+        "Wildfire Risk (Low/Moderate/High or ISO Class)": r"\bwildfire|\bbrush\b|\bISO\b",
+        "Earthquake Exposure (Low/Moderate/High or ShakeMap Zone)": r"\bearthquake|\bseismic|\bshakemap|\bfault\b",
+        "Roof > 20 yrs": r"\broof",
+        "No sprinklers": r"\bsprinkler",
+        "Flood Zone AE": r"\bflood|\bzone\b",
+        "Next to high-hazard operations": r"\badjacent|\bnext\s+to\b|\bnear\b|\bneighbo",
+    }.items()
+}
+
+
+def _match(field, text):
+    # Every match counts, not just the first: a match overlapping one from an earlier
+    # pattern is dropped, and if what's left still disagrees ("two claims in 2019; no
+    # claims since") the field is ambiguous and left to the LLM. Low-confidence
+    # mentions only decide the value when nothing better matched
+    values = {}
+    taken = []
+    for regex, convert, confidence in FIELD_PATTERNS.get(field, ()):
+        spans = []
+        for match in regex.finditer(text):
+            start, end = match.span()
+            if any(start < taken_end and taken_start < end for taken_start, taken_end in taken):
+                continue
+            value = convert(match.group(1) if regex.groups else match.group(0))
+            if value is not None:
+                spans.append((start, end))
+                values.setdefault(value, confidence)
+        taken.extend(spans)
+    if any(confidence >= MIN_CONFIDENCE for confidence in values.values()):
+        # A bare mention says nothing against a stated answer elsewhere in the text
+        values = {value: confidence for value, confidence in values.items() if confidence >= MIN_CONFIDENCE}
+    if len(values) == 1:
+        return next(iter(values.items()))
+    if values:
+        return None
+    mention = FIELD_MENTIONS.get(field)
+    if mention is not None and not mention.search(text):
+        return "", ABSENT_CONFIDENCE
+    return None
+
+
+def extract_fields_with_patterns(text, fields):
+    """Fill schema fields from predictable phrasing, returning {field: (value, confidence)}.
+
+    Fields with no pattern match are left out, except those whose subject the text
+    never mentions (no "roof" anywhere, say), which come back empty with
+    ABSENT_CONFIDENCE since the LLM would have nothing to extract either.
+    """
+    found = {}
+    for field in fields:
+        result = _match(field, text)
+        if result is not None:
+            found[field] = result
+
+    # The schema's derived Red Flags columns follow from the fields above
+    sprinklers = found.get("Sprinkler System (Y/N)") or _match("Sprinkler System (Y/N)", text)
+    if "No sprinklers" in fields and sprinklers and sprinklers[0]:
+        found["No sprinklers"] = ("Yes" if sprinklers[0] == "No" else "No", sprinklers[1])
+    flood_zone = found.get("Flood Zone (e.g., Zone X, AE)") or _match("Flood Zone (e.g., Zone X, AE)", text)
+    if "Flood Zone AE" in fields and flood_zone and flood_zone[0]:
+        found["Flood Zone AE"] = ("Yes" if flood_zone[0] == "Zone AE" else "No", flood_zone[1])
+    return found
+
+
+def split_confident(text, fields, min_confidence=MIN_CONFIDENCE):
+    """Return ({field: value} filled with at least `min_confidence`, [fields still missing])."""
+    found = extract_fields_with_patterns(text, fields)
+    values = {field: value for field, (value, confidence) in found.items() if confidence >= min_confidence}
+    missing = [field for field in fields if field not in values]
+    return values, missing
+
+
+def merge_pattern_fields(values, extracted, fields):
+    """Combine pattern-filled `values` with the LLM's answer for the remaining fields, in schema order."""
+    if not values:
+        return extracted
+    return {field: values[field] if field in values else extracted.get(field, "") for field in fields}
@@ -1,9 +1,116 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 
-import fitz  # PyMuPDF
+from utils.instrumentation import annotate, span
 
-def extract_text_from_pdf(uploaded_file):
-    with fitz.open(stream=uploaded_file.read(), filetype="pdf") as doc:
-        text = ""
-        for page in doc:
-            text += page.get_text()
-    return text
+PAGE_CACHE_DIR = os.getenv("COPRIA_PAGE_CACHE", "output/page_cache")
+# Below this many pages, starting worker processes costs more than it saves
+PARALLEL_MIN_PAGES = 50
+PAGES_PER_TASK = 25
+_HASH_BLOCK_SIZE = 1 << 20
+
+
+def _load_source(source):
+    # Paths stay on disk so PyMuPDF can read pages on demand; uploads are already in memory
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source), None
+    if isinstance(source, (bytes, bytearray)):
+        return None, bytes(source)
+    if hasattr(source, "getvalue"):
+        return None, source.getvalue()
+    return None, source.read()
+
+
+def _digest(path, data):
+    sha = hashlib.sha256()
+    if data is not None:
+        sha.update(data)
+    else:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+                sha.update(block)
+    return sha.hexdigest()
+
+
+def _open(path, data):
+    # Imported on first use so the app starts without loading PyMuPDF
+    import fitz  # PyMuPDF
+
+    return fitz.open(path) if path is not None else fitz.open(stream=data, filetype="pdf")
+
+
+_worker_document = None
+
+
+def _init_worker(path, data):
+    global _worker_document
+    _worker_document = _open(path, data)
+
+
+def _extract_range(page_range):
+    start, stop = page_range
+    return [_worker_document[number].get_text() for number in range(start, stop)]
+
+
+def _iter_document_pages(path, data, workers):
+    with _open(path, data) as doc:
+        page_count = doc.page_count
+        if not workers or workers < 2 or page_count < PARALLEL_MIN_PAGES:
+            for page in doc:
+                yield page.get_text()
+            return
+
+    ranges = [(start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(path, data)) as pool:
+        for pages in pool.map(_extract_range, ranges):
+            yield from pages
+
+
+def _iter_cached_pages(cache_path):
+    with open(cache_path, encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def iter_pdf_pages(source, workers=None, cache_dir=PAGE_CACHE_DIR):
+    """Yield the text of each page of a PDF lazily, in page order.
+
+    `source` is a path, raw bytes or an uploaded file object. With `workers`,
+    large documents are split into page ranges across that many processes.
+    Page text is cached under `cache_dir` by file hash, so reopening the same
+    document skips PyMuPDF; pass cache_dir=None to disable the cache.
+    """
+    path, data = _load_source(source)
+    if not cache_dir:
+        yield from _iter_document_pages(path, data, workers)
+        return
+
+    cache_path = os.path.join(cache_dir, _digest(path, data) + ".jsonl")
+    if os.path.exists(cache_path):
+        annotate(cache_hit=True)
+        yield from _iter_cached_pages(cache_path)
+        return
+    annotate(cache_hit=False)
+
+    # Written under a temporary name so an interrupted read never leaves a partial cache entry
+    os.makedirs(cache_dir, exist_ok=True)
+    partial_path = f"{cache_path}.{os.getpid()}.partial"
+    try:
+        with open(partial_path, "w", encoding="utf-8") as cache_file:
+            for text in _iter_document_pages(path, data, workers):
+                cache_file.write(json.dumps(text) + "\n")
+                yield text
+        os.replace(partial_path, cache_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+
+def extract_text_from_pdf(uploaded_file, workers=None, cache_dir=PAGE_CACHE_DIR):
+    with span("extract_text_from_pdf") as stage:
+        pages = list(iter_pdf_pages(uploaded_file, workers=workers, cache_dir=cache_dir))
+        stage.set(pages=len(pages))
+    # Pages are separated by form feeds so downstream chunking can split on them
+    return "\f".join(pages)
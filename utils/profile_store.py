@@ -0,0 +1,290 @@
+import json
+import os
+import sqlite3
+import time
+
+from utils.red_flag_engine import compile_rules
+from utils.risk_profile import RiskProfile
+
+DEFAULT_STORE_PATH = os.getenv("COPRIA_PROFILE_STORE", "output/profile_store.sqlite")
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def store_rows(profiles, documents=None):
+    """The store's row for each scored profile, ready for RunWriter.write_rows().
+
+    Building rows needs nothing from the database, so scoring workers can do it
+    next to the profiles and leave the writer only the inserts. `documents` can
+    pass each profile's JSON text when the caller already has it, so it isn't
+    encoded a second time.
+    """
+    profiles = list(profiles)
+    if documents is None:
+        documents = (json.dumps(profile.to_dict() if isinstance(profile, RiskProfile) else profile)
+                     for profile in profiles)
+    return [
+        (profile.get("Property Name"), profile.get("State"), profile.get("Construction Type"),
+         profile.get("Occupancy Type"), _number(profile.get("Total TIV")), tuple(profile.get("Red Flags") or ()),
+         document)
+        for profile, document in zip(profiles, documents)
+    ]
+
+
+class ProfileStore:
+    """Scored profiles from every run, indexed for portfolio queries.
+
+    Each run's profiles are stored with their state, construction, Total TIV and
+    flags in indexed columns. Per-run aggregates (flag counts by state and
+    category, TIV at risk per flag) are computed once when the run is finished,
+    so summaries never scan the profiles. Earlier runs are kept until prune().
+
+        with ProfileStore() as store:
+            with store.start_run(rules, source="book.jsonl") as run:
+                run.write_many(profiles)
+            store.query(state="TX", min_tiv=10_000_000, flag="No sprinkler protection")
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source TEXT,
+                started_at REAL NOT NULL,
+                finished_at REAL,
+                profiles INTEGER NOT NULL DEFAULT 0,
+                flagged_profiles INTEGER NOT NULL DEFAULT 0,
+                total_flags INTEGER NOT NULL DEFAULT 0,
+                total_tiv REAL NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS run_rules (
+                run_id INTEGER NOT NULL, flag TEXT NOT NULL, category TEXT, PRIMARY KEY (run_id, flag)
+            );
+            CREATE TABLE IF NOT EXISTS profiles (
+                run_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                property_name TEXT,
+                state TEXT,
+                construction TEXT,
+                occupancy TEXT,
+                total_tiv REAL,
+                flag_count INTEGER NOT NULL,
+                profile TEXT NOT NULL,
+                PRIMARY KEY (run_id, position)
+            );
+            CREATE INDEX IF NOT EXISTS profiles_state ON profiles (run_id, state);
+            CREATE INDEX IF NOT EXISTS profiles_construction ON profiles (run_id, construction);
+            CREATE INDEX IF NOT EXISTS profiles_tiv ON profiles (run_id, total_tiv);
+            CREATE TABLE IF NOT EXISTS profile_flags (
+                run_id INTEGER NOT NULL, flag TEXT NOT NULL, position INTEGER NOT NULL,
+                PRIMARY KEY (run_id, flag, position)
+            );
+            CREATE TABLE IF NOT EXISTS flag_aggregates (
+                run_id INTEGER NOT NULL,
+                state TEXT,
+                category TEXT,
+                flag TEXT NOT NULL,
+                profiles INTEGER NOT NULL,
+                total_tiv REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS flag_aggregates_run ON flag_aggregates (run_id);
+            """
+        )
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start_run(self, rules, source=None):
+        """Open a new run; write profiles with its write_many() and finish() it (or use it as a context manager)."""
+        compiled = compile_rules(rules)
+        with self._db:
+            run_id = self._db.execute(
+                "INSERT INTO runs (source, started_at) VALUES (?, ?)", (source, time.time())
+            ).lastrowid
+            self._db.executemany(
+                "INSERT OR IGNORE INTO run_rules (run_id, flag, category) VALUES (?, ?, ?)",
+                [(run_id, rule.message, rule.category) for rule in compiled],
+            )
+        return RunWriter(self._db, run_id)
+
+    def latest_run(self):
+        row = self._db.execute("SELECT MAX(run_id) FROM runs WHERE finished_at IS NOT NULL").fetchone()
+        return row[0]
+
+    def runs(self):
+        cursor = self._db.execute(
+            "SELECT run_id, source, started_at, finished_at, profiles, flagged_profiles, total_flags, total_tiv "
+            "FROM runs ORDER BY run_id"
+        )
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def run_summary(self, run_id=None):
+        run_id = run_id if run_id is not None else self.latest_run()
+        return next((run for run in self.runs() if run["run_id"] == run_id), None)
+
+    def _where(self, run_id, state, construction, occupancy, min_tiv, max_tiv, flag):
+        run_id = run_id if run_id is not None else self.latest_run()
+        clauses, params = ["p.run_id = ?"], [run_id]
+        if state is not None:
+            clauses.append("p.state = ?")
+            params.append(state)
+        if construction is not None:
+            clauses.append("p.construction = ?")
+            params.append(construction)
+        if occupancy is not None:
+            # Free text, so a substring match; narrow with an indexed filter first on big books
+            clauses.append("p.occupancy LIKE ?")
+            params.append(f"%{occupancy}%")
+        if min_tiv is not None:
+            clauses.append("p.total_tiv >= ?")
+            params.append(min_tiv)
+        if max_tiv is not None:
+            clauses.append("p.total_tiv < ?")
+            params.append(max_tiv)
+        if flag is not None:
+            clauses.append("p.position IN (SELECT position FROM profile_flags WHERE run_id = ? AND flag = ?)")
+            params.extend([run_id, flag])
+        return " AND ".join(clauses), params
+
+    def query(self, run_id=None, state=None, construction=None, occupancy=None, min_tiv=None, max_tiv=None,
+              flag=None, order_by="position", descending=False, limit=None, offset=0):
+        """Profiles of a run (the latest by default) matching every given filter, as RiskProfiles.
+
+        `min_tiv` is inclusive and `max_tiv` exclusive; `occupancy` is a case-insensitive
+        substring match. order_by is "position", "total_tiv", "flag_count", "state" or
+        "property_name".
+        """
+        if order_by not in ("position", "total_tiv", "flag_count", "state", "property_name"):
+            raise ValueError(f"cannot order profiles by {order_by!r}")
+        where, params = self._where(run_id, state, construction, occupancy, min_tiv, max_tiv, flag)
+        sql = f"SELECT profile FROM profiles p WHERE {where} ORDER BY p.{order_by} {'DESC' if descending else 'ASC'}"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([limit, offset])
+        return [RiskProfile(json.loads(profile)) for profile, in self._db.execute(sql, params)]
+
+    def profile(self, position, run_id=None):
+        """The profile written at `position` (0-based) in a run, or None."""
+        run_id = run_id if run_id is not None else self.latest_run()
+        row = self._db.execute(
+            "SELECT profile FROM profiles WHERE run_id = ? AND position = ?", (run_id, position)
+        ).fetchone()
+        return RiskProfile(json.loads(row[0])) if row else None
+
+    def count(self, run_id=None, state=None, construction=None, occupancy=None, min_tiv=None, max_tiv=None, flag=None):
+        """(profiles, summed Total TIV) matching the same filters as query()."""
+        where, params = self._where(run_id, state, construction, occupancy, min_tiv, max_tiv, flag)
+        count, tiv = self._db.execute(f"SELECT COUNT(*), TOTAL(p.total_tiv) FROM profiles p WHERE {where}", params).fetchone()
+        return count, tiv
+
+    def flag_counts(self, run_id=None, by=None):
+        """Precomputed flag counts for a run: {flag: profiles}, or {(state or category, flag): profiles} with `by`."""
+        if by not in (None, "state", "category"):
+            raise ValueError(f"cannot group flag counts by {by!r}")
+        run_id = run_id if run_id is not None else self.latest_run()
+        group = f"{by}, flag" if by else "flag"
+        rows = self._db.execute(
+            f"SELECT {group}, SUM(profiles) FROM flag_aggregates WHERE run_id = ? GROUP BY {group} "
+            "ORDER BY SUM(profiles) DESC", (run_id,)
+        )
+        if by is None:
+            return {flag: count for flag, count in rows}
+        return {(key, flag): count for key, flag, count in rows}
+
+    def tiv_at_risk(self, run_id=None):
+        """{flag: summed Total TIV of the profiles carrying it} for a run, from the precomputed aggregates."""
+        run_id = run_id if run_id is not None else self.latest_run()
+        rows = self._db.execute(
+            "SELECT flag, SUM(total_tiv) FROM flag_aggregates WHERE run_id = ? GROUP BY flag "
+            "ORDER BY SUM(total_tiv) DESC", (run_id,)
+        )
+        return dict(rows)
+
+    def prune(self, keep=10):
+        """Delete all but the newest `keep` runs."""
+        with self._db:
+            stale = [row[0] for row in self._db.execute(
+                "SELECT run_id FROM runs ORDER BY run_id DESC LIMIT -1 OFFSET ?", (keep,))]
+            for table in ("profiles", "profile_flags", "flag_aggregates", "run_rules", "runs"):
+                self._db.executemany(f"DELETE FROM {table} WHERE run_id = ?", [(run_id,) for run_id in stale])
+        return len(stale)
+
+
+class RunWriter:
+    """Writes one run's scored profiles, one transaction per write_many() call."""
+
+    def __init__(self, db, run_id):
+        self._db = db
+        self.run_id = run_id
+        self.count = 0
+
+    def write_many(self, profiles, documents=None):
+        """Store scored profiles (RiskProfiles or their to_dict() form); see store_rows() for `documents`."""
+        self.write_rows(store_rows(profiles, documents))
+
+    def write_rows(self, rows):
+        """Store rows built by store_rows(), numbering them after the profiles already written."""
+        records, flags = [], []
+        for name, state, construction, occupancy, tiv, red_flags, document in rows:
+            position = self.count
+            self.count += 1
+            records.append((self.run_id, position, name, state, construction, occupancy, tiv, len(red_flags), document))
+            flags.extend((self.run_id, flag, position) for flag in set(red_flags))
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO profiles (run_id, position, property_name, state, construction, occupancy, total_tiv, "
+                "flag_count, profile) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                records,
+            )
+            self._db.executemany("INSERT INTO profile_flags (run_id, flag, position) VALUES (?, ?, ?)", flags)
+
+    def write(self, profile):
+        self.write_many([profile])
+
+    def finish(self):
+        """Compute the run's aggregates and mark it finished."""
+        with self._db:
+            self._db.execute(
+                "INSERT INTO flag_aggregates (run_id, state, category, flag, profiles, total_tiv) "
+                "SELECT f.run_id, p.state, r.category, f.flag, COUNT(*), TOTAL(p.total_tiv) "
+                "FROM profile_flags f "
+                "JOIN profiles p ON p.run_id = f.run_id AND p.position = f.position "
+                "LEFT JOIN run_rules r ON r.run_id = f.run_id AND r.flag = f.flag "
+                "WHERE f.run_id = ? GROUP BY p.state, r.category, f.flag",
+                (self.run_id,),
+            )
+            # Totals are read first and written back as parameters: UPDATE ... FROM needs SQLite 3.33+
+            totals = self._db.execute(
+                "SELECT COUNT(*), COUNT(NULLIF(flag_count, 0)), TOTAL(flag_count), TOTAL(total_tiv) "
+                "FROM profiles WHERE run_id = ?", (self.run_id,)
+            ).fetchone()
+            self._db.execute(
+                "UPDATE runs SET finished_at = ?, profiles = ?, flagged_profiles = ?, total_flags = ?, total_tiv = ? "
+                "WHERE run_id = ?",
+                (time.time(), *totals, self.run_id),
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # An interrupted run keeps its profiles but never becomes the latest finished run
+        if exc_type is None:
+            self.finish()
@@ -1,100 +1,411 @@
+import json
+import re
+import time
+from functools import lru_cache
 
-def apply_red_flag_rules(profile, rules):
-    red_flags = []
-    for rule in rules:
+import numpy as np
+
+from utils import instrumentation
+
+# Condition grammar (keywords are case-insensitive):
+#   expr   := term ("or" term)*
+#   term   := factor ("and" factor)*
+#   factor := [field] OP value
+#           | [field] "contains" STRING ("or" STRING)*
+# A factor without a field name applies to the rule's own "field".
+_TOKEN_RE = re.compile(r"""\s*(?:'([^']*)'|"([^"]*)"|(==|!=|>=|<=|>|<)|([^\s'"=!<>]+))""")
+_NUMERIC_OPS = {
+    ">": lambda a, b: a > b,
+    "<": lambda a, b: a < b,
+    ">=": lambda a, b: a >= b,
+    "<=": lambda a, b: a <= b,
+}
+# "not" is reserved so it can't silently become part of a field name
+_KEYWORDS = {"and", "or", "contains", "not"}
+_DIGITS_RE = re.compile(r"\d+")
+
+
+class RuleSyntaxError(ValueError):
+    pass
+
+
+def _to_number(field, value):
+    # RiskProfile values are already numbers; only raw dict profiles still need parsing
+    if isinstance(value, (int, float)):
+        return value
+    # Handle non-numeric values for Number of Stories like "Single-story", "Two-story"
+    if field == "Number of Stories" and isinstance(value, str):
+        numbers = _DIGITS_RE.findall(value)
+        if numbers:
+            return float(numbers[0])
+        return 1 if "single" in value.lower() else 0
+    return float(value)
+
+
+def _as_text(value):
+    # Empty numeric fields of a RiskProfile are None, which compares like the old ""
+    return "" if value is None else str(value)
+
+
+def _to_number_or_nan(field, value):
+    try:
+        return _to_number(field, value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def numeric_column(profiles, field):
+    """One float per profile for a numeric field; values that cannot be coerced become NaN."""
+    values = [profile.get(field, 0) for profile in profiles]
+    if not any(isinstance(value, str) for value in values):
+        # Normalized RiskProfile columns convert in one step, None becoming NaN
+        try:
+            return np.array(values, dtype=float)
+        except (TypeError, ValueError):
+            pass
+    return np.fromiter((_to_number_or_nan(field, value) for value in values), dtype=float, count=len(values))
+
+
+class _Columns:
+    """Column views over a list of profiles, built once per field on first use."""
+
+    def __init__(self, profiles):
+        self.profiles = profiles
+        self._numeric = {}
+        self._categorical = {}
+
+    def numeric(self, field):
+        # NaN fails every comparison, so unparseable values never match a numeric condition
+        column = self._numeric.get(field)
+        if column is None:
+            column = numeric_column(self.profiles, field)
+            self._numeric[field] = column
+        return column
+
+    def categorical(self, field):
+        # Distinct string values plus one code per profile, so text predicates
+        # run once per distinct value instead of once per profile
+        column = self._categorical.get(field)
+        if column is None:
+            lookup = {}
+            codes = np.fromiter(
+                (lookup.setdefault(_as_text(profile.get(field, "")), len(lookup)) for profile in self.profiles),
+                dtype=np.intp,
+                count=len(self.profiles),
+            )
+            column = (list(lookup), codes)
+            self._categorical[field] = column
+        return column
+
+
+def _category_mask(columns, field, test):
+    categories, codes = columns.categorical(field)
+    return np.fromiter(map(test, categories), dtype=bool, count=len(categories))[codes]
+
+
+class Compare:
+    def __init__(self, field, op, literal):
+        self.field = field
+        self.op = op
+        self.literal = literal
+        if op in _NUMERIC_OPS:
+            self.threshold = float(literal)
+            self._compare = _NUMERIC_OPS[op]
+        else:
+            self.expected = literal.lower()
+
+    def evaluate(self, profile):
+        if self.op in _NUMERIC_OPS:
+            try:
+                value = _to_number(self.field, profile.get(self.field, 0))
+            except (TypeError, ValueError):
+                return False
+            return self._compare(value, self.threshold)
+        matched = _as_text(profile.get(self.field, "")).strip().lower() == self.expected
+        return matched if self.op == "==" else not matched
+
+    def mask(self, columns):
+        if self.op in _NUMERIC_OPS:
+            return self._compare(columns.numeric(self.field), self.threshold)
+        matched = _category_mask(columns, self.field, lambda value: value.strip().lower() == self.expected)
+        return matched if self.op == "==" else ~matched
+
+    def fields(self):
+        return {self.field}
+
+
+class Contains:
+    def __init__(self, field, needles):
+        self.field = field
+        self.needles = tuple(needle.lower() for needle in needles)
+
+    def evaluate(self, profile):
+        value = _as_text(profile.get(self.field, "")).lower()
+        return any(needle in value for needle in self.needles)
+
+    def mask(self, columns):
+        return _category_mask(columns, self.field, lambda value: any(needle in value.lower() for needle in self.needles))
+
+    def fields(self):
+        return {self.field}
+
+
+class AllOf:
+    def __init__(self, terms):
+        self.terms = tuple(terms)
+
+    def evaluate(self, profile):
+        return all(term.evaluate(profile) for term in self.terms)
+
+    def mask(self, columns):
+        return np.logical_and.reduce([term.mask(columns) for term in self.terms])
+
+    def fields(self):
+        return set().union(*(term.fields() for term in self.terms))
+
+
+class AnyOf(AllOf):
+    def evaluate(self, profile):
+        return any(term.evaluate(profile) for term in self.terms)
+
+    def mask(self, columns):
+        return np.logical_or.reduce([term.mask(columns) for term in self.terms])
+
+
+class CompiledRule:
+    __slots__ = ("category", "field", "condition", "message", "predicate")
+
+    def __init__(self, category, field, condition, message, predicate):
+        self.category = category
+        self.field = field
+        self.condition = condition
+        self.message = message
+        self.predicate = predicate
+
+    def matches(self, profile):
+        return self.predicate.evaluate(profile)
+
+    def fields(self):
+        return self.predicate.fields()
+
+
+def _tokenize(condition):
+    tokens = []
+    pos = 0
+    condition = condition.rstrip()
+    while pos < len(condition):
+        match = _TOKEN_RE.match(condition, pos)
+        if not match or match.end() == pos:
+            raise RuleSyntaxError(f"unexpected character at {pos}: {condition[pos:]!r}")
+        single, double, op, word = match.groups()
+        if single is not None or double is not None:
+            tokens.append(("string", single if single is not None else double))
+        elif op:
+            tokens.append(("op", op))
+        elif word.lower() in _KEYWORDS:
+            tokens.append((word.lower(), word))
+        else:
+            tokens.append(("word", word))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    def __init__(self, condition, default_field):
+        self.tokens = _tokenize(condition)
+        self.pos = 0
+        self.default_field = default_field
+
+    def peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def take(self, kind):
+        if self.peek() != kind:
+            found = self.tokens[self.pos][1] if self.pos < len(self.tokens) else "end of condition"
+            raise RuleSyntaxError(f"expected {kind}, found {found!r}")
+        token = self.tokens[self.pos][1]
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise RuleSyntaxError("empty condition")
+        node = self.expr()
+        if self.peek() is not None:
+            raise RuleSyntaxError(f"unexpected {self.tokens[self.pos][1]!r}")
+        return node
+
+    def expr(self):
+        terms = [self.term()]
+        while self.peek() == "or":
+            self.pos += 1
+            terms.append(self.term())
+        return terms[0] if len(terms) == 1 else AnyOf(terms)
+
+    def term(self):
+        factors = [self.factor()]
+        while self.peek() == "and":
+            self.pos += 1
+            factors.append(self.factor())
+        return factors[0] if len(factors) == 1 else AllOf(factors)
+
+    def factor(self):
+        if self.peek() == "not":
+            raise RuleSyntaxError("'not' is not supported; use != or a separate rule")
+        words = []
+        while self.peek() == "word":
+            words.append(self.take("word"))
+        field = " ".join(words) or self.default_field
+        if self.peek() == "contains":
+            self.pos += 1
+            needles = [self.take("string")]
+            # "contains 'AE' or 'VE'" lists alternatives rather than new factors
+            while self.peek() == "or" and self.pos + 1 < len(self.tokens) and self.tokens[self.pos + 1][0] == "string":
+                self.pos += 1
+                needles.append(self.take("string"))
+            return Contains(field, needles)
+        op = self.take("op")
+        kind = self.peek()
+        if kind not in ("string", "word"):
+            self.take("value")
+        literal = self.take(kind)
+        if op in _NUMERIC_OPS:
+            if kind == "string":
+                raise RuleSyntaxError(f"{op} needs a number, found {literal!r}")
+            try:
+                float(literal)
+            except ValueError:
+                raise RuleSyntaxError(f"{op} needs a number, found {literal!r}") from None
+        return Compare(field, op, literal)
+
+
+def compile_rule(rule):
+    if not isinstance(rule, dict) or "field" not in rule or "condition" not in rule:
+        raise RuleSyntaxError("rule must define 'field' and 'condition'")
+    field = rule["field"]
+    condition = rule["condition"]
+    try:
+        predicate = _Parser(condition, field).parse()
+    except RuleSyntaxError as e:
+        raise RuleSyntaxError(f"cannot parse condition {condition!r} for {field!r}: {e}") from None
+    # Use 'description' instead of 'message' to match the JSON structure
+    message = rule.get("description", rule.get("message", "Red flag detected"))
+    return CompiledRule(rule.get("category", ""), field, condition, message, predicate)
+
+
+def _compile_all(rules):
+    compiled = []
+    for index, rule in enumerate(rules):
         try:
-            field = rule["field"]
-            condition = rule["condition"]
-            # Use 'description' instead of 'message' to match the JSON structure
-            message = rule.get("description", rule.get("message", "Red flag detected"))
-            
-            # Handle different condition types
-            if ">" in condition and " and " not in condition:
-                threshold = float(condition.split(">")[-1])
-                field_value = profile.get(field, 0)
-                # Handle non-numeric values for Number of Stories
-                if field == "Number of Stories" and isinstance(field_value, str):
-                    # Extract numeric value from strings like "Single-story", "Two-story", etc.
-                    import re
-                    numbers = re.findall(r'\d+', field_value)
-                    if numbers:
-                        field_value = float(numbers[0])
-                    else:
-                        # Map common text values to numbers
-                        field_value = 1 if "single" in field_value.lower() else 0
-                
-                if float(field_value) > threshold:
-                    red_flags.append(message)
-            elif "<" in condition and " and " not in condition:
-                threshold = float(condition.split("<")[-1])
-                field_value = profile.get(field, 0)
-                # Handle non-numeric values for Number of Stories
-                if field == "Number of Stories" and isinstance(field_value, str):
-                    import re
-                    numbers = re.findall(r'\d+', field_value)
-                    if numbers:
-                        field_value = float(numbers[0])
-                    else:
-                        field_value = 1 if "single" in field_value.lower() else 0
-                
-                if float(field_value) < threshold:
-                    red_flags.append(message)
-            elif "==" in condition and " and " not in condition:
-                # Fix the parsing to properly extract the expected value
-                parts = condition.split("==")
-                if len(parts) == 2:
-                    expected = parts[1].strip().strip('"').strip("'")
-                    profile_value = str(profile.get(field, "")).strip()
-                    
-                    if profile_value.lower() == expected.lower():
-                        red_flags.append(message)
-            elif "contains" in condition.lower():
-                # Handle contains conditions like "contains 'AE' or 'VE' or 'A'"
-                contains_parts = condition.lower().split("contains")[-1].strip()
-                # Extract quoted strings
-                import re
-                quoted_values = re.findall(r"'([^']*)'", contains_parts)
-                field_value = str(profile.get(field, "")).lower()
-                if any(value.lower() in field_value for value in quoted_values):
-                    red_flags.append(message)
-            elif " and " in condition.lower():
-                # Handle compound conditions like "Prior Claims == 'Yes' and Total Loss Amount > 100000"
-                parts = condition.lower().split(" and ")
-                all_conditions_met = True
-                for part in parts:
-                    part = part.strip()
-                    if "==" in part:
-                        # Extract field name and expected value
-                        field_name = part.split("==")[0].strip()
-                        expected = part.split("==")[-1].strip('"').strip("'")
-                        if str(profile.get(field_name, "")).strip().lower() != expected.lower():
-                            all_conditions_met = False
-                            break
-                    elif ">" in part:
-                        # Extract field name and threshold
-                        field_name = part.split(">")[0].strip()
-                        threshold_str = part.split(">")[-1].strip()
-                        try:
-                            threshold = float(threshold_str)
-                            field_value = profile.get(field_name, 0)
-                            # Handle non-numeric values for Number of Stories
-                            if field_name == "Number of Stories" and isinstance(field_value, str):
-                                import re
-                                numbers = re.findall(r'\d+', field_value)
-                                if numbers:
-                                    field_value = float(numbers[0])
-                                else:
-                                    field_value = 1 if "single" in field_value.lower() else 0
-                            
-                            if float(field_value) <= threshold:
-                                all_conditions_met = False
-                                break
-                        except ValueError:
-                            all_conditions_met = False
-                            break
-                if all_conditions_met:
-                    red_flags.append(message)
-        except Exception as e:
-            print(f"Rule error for {field}: {e}")
+            compiled.append(compile_rule(rule))
+        except RuleSyntaxError as e:
+            raise RuleSyntaxError(f"rule {index}: {e}") from None
+    return tuple(compiled)
+
+
+@lru_cache(maxsize=32)
+def _compile_rules_cached(rules_key):
+    return _compile_all(json.loads(rules_key))
+
+
+# Rule text (each rule's items) -> compiled rules. Callers scoring profile by profile pass
+# the same rules every time, and that key is far cheaper to build than JSON
+_compiled = {}
+
+
+def compile_rules(rules):
+    """Compile rule dicts into predicates, reusing earlier compilations of the same rules."""
+    if isinstance(rules, tuple) and all(isinstance(rule, CompiledRule) for rule in rules):
+        return rules
+    if not isinstance(rules, list):
+        raise RuleSyntaxError("red flag rules must be a JSON list")
+    try:
+        key = tuple(map(tuple, map(dict.items, rules)))
+        compiled = _compiled.get(key)
+    except TypeError:
+        # Rules that aren't dicts, or have nested (unhashable) values: key on their JSON instead
+        return _compile_rules_cached(json.dumps(rules, sort_keys=True))
+    if compiled is None:
+        compiled = _compile_all(rules)
+        if len(_compiled) >= 32:
+            _compiled.clear()
+        _compiled[key] = compiled
+    return compiled
+
+
+def rule_fields(rules):
+    """The profile fields a rule set reads, in rule order; all a screening run needs mapped."""
+    fields = {}
+    for rule in compile_rules(rules):
+        fields.update(dict.fromkeys(sorted(rule.fields())))
+    return list(fields)
+
+
+def load_rules(path):
+    with open(path) as f:
+        return compile_rules(json.load(f))
+
+
+def apply_red_flag_rules(profile, rules):
+    compiled = compile_rules(rules)
+    if not instrumentation.enabled():
+        profile["Red Flags"] = [rule.message for rule in compiled if rule.matches(profile)]
+        return profile
+
+    with instrumentation.span("apply_red_flag_rules", rules=len(compiled)) as stage:
+        red_flags = []
+        rule_seconds = {}
+        for rule in compiled:
+            start = time.perf_counter()
+            if rule.matches(profile):
+                red_flags.append(rule.message)
+            rule_seconds[rule.message] = time.perf_counter() - start
+        stage.set(flags=len(red_flags), rule_seconds=rule_seconds)
     profile["Red Flags"] = red_flags
     return profile
+
+
+def evaluate_rules_batch(profiles, rules):
+    """Return a (profiles x rules) boolean matrix of which rules match which profiles."""
+    compiled = compile_rules(rules)
+    columns = _Columns(profiles)
+    matrix = np.zeros((len(profiles), len(compiled)), dtype=bool)
+    if not instrumentation.enabled():
+        for index, rule in enumerate(compiled):
+            matrix[:, index] = rule.predicate.mask(columns)
+        return matrix
+
+    with instrumentation.span("evaluate_rules_batch", profiles=len(profiles), rules=len(compiled)) as stage:
+        rule_seconds = {}
+        for index, rule in enumerate(compiled):
+            start = time.perf_counter()
+            matrix[:, index] = rule.predicate.mask(columns)
+            rule_seconds[rule.message] = time.perf_counter() - start
+        stage.set(rule_seconds=rule_seconds)
+    return matrix
+
+
+def apply_red_flag_rules_batch(profiles, rules):
+    """Evaluate every rule as one vectorized mask over a whole portfolio.
+
+    Sets "Red Flags" on each profile exactly as apply_red_flag_rules would and
+    returns (per-profile flag lists, {flag message: number of profiles flagged}).
+    """
+    compiled = compile_rules(rules)
+    profiles = list(profiles)
+    matrix = evaluate_rules_batch(profiles, compiled)
+
+    messages = [rule.message for rule in compiled]
+    flag_lists = [[] for _ in profiles]
+    # nonzero walks the matrix row by row, so flags keep their rule order
+    rows, cols = np.nonzero(matrix)
+    for row, col in zip(rows.tolist(), cols.tolist()):
+        flag_lists[row].append(messages[col])
+    for profile, flags in zip(profiles, flag_lists):
+        profile["Red Flags"] = flags
+
+    flag_counts = {}
+    for message, count in zip(messages, matrix.sum(axis=0).tolist()):
+        if count:
+            flag_counts[message] = flag_counts.get(message, 0) + count
+    return flag_lists, flag_counts
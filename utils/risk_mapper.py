@@ -1,130 +1,195 @@
+from utils.instrumentation import span
+from utils.risk_profile import RiskProfile
 
-def generate_risk_profile(submission, schema):
-    profile = {}
-
-    # Initialize all fields from schema with default values
-    for section_fields in schema.values():
-        for field in section_fields:
-            profile[field] = ""
-
-    # Helper function to extract nested values
-    def get_nested_value(data, key_path):
-        """Extract value from nested dictionary using dot notation or direct key"""
-        if key_path in data:
-            return data[key_path]
-        
-        # Try to find in nested structures
-        for key, value in data.items():
-            if isinstance(value, dict):
-                if key_path in value:
-                    return value[key_path]
-                # Recursively search nested dicts
-                nested_result = get_nested_value(value, key_path)
-                if nested_result is not None:
-                    return nested_result
-        return None
-
-    # Map submission data to profile - PRIORITIZE LLM EXTRACTION
-    for section_fields in schema.values():
-        for field in section_fields:
-            value = submission.get(field) or get_nested_value(submission, field)
-            if value is not None and value != "":
-                profile[field] = value
-
-    # Only apply risk mapper logic if LLM didn't extract the value
-    year_built = int(submission.get("Year Built", 0))
-    if not profile.get("Roof > 20 yrs"):
-        profile["Roof > 20 yrs"] = "Yes" if year_built and 2025 - year_built > 20 else "No"
+
+def build_field_index(data):
+    """Flatten a nested submission into a key -> value index in one pass.
+
+    index.get(key) returns exactly what a depth-first search for key would:
+    keys on the submission itself win, then children are searched in order,
+    with a child's own keys taking priority over anything nested below it.
+    """
+    index = {}
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        for key, nested_value in build_field_index(value).items():
+            if key in index:
+                continue
+            # A null found directly on the child ends the search; a null
+            # from deeper down lets the search move on to the next child
+            if key in value or nested_value is not None:
+                index[key] = nested_value
+    index.update(data)
+    return index
+
+
+def generate_risk_profile(submission, schema, fields=None, lazy=False):
+    """Map a submission onto the schema fields as a RiskProfile.
+
+    By default every field is derived up front. With `lazy`, each field is
+    derived on first access instead. Passing `fields` (e.g. rule_fields(rules))
+    derives just those now and leaves the rest to be derived on demand, so a
+    screening run only pays for the fields its rules read.
+    """
+    with span("generate_risk_profile"):
+        return _map_submission(submission, schema, fields, lazy)
+
+
+def _hazard_text(submission, lookup):
+    return (submission.get("Natural Hazard Exposure", "") or 
+            lookup("Natural Hazard Exposure") or "").lower()
+
+
+def _fire_protection_text(submission, lookup):
+    fire_prot = (submission.get("Fire Protection", "") or 
+                 lookup("Fire Protection") or "").lower()
     
+    # Also check COPE.Protection if available
+    cope_protection = lookup("Protection")
+    if cope_protection:
+        fire_prot += " " + cope_protection.lower()
+    return fire_prot
+
+
+def _roof_over_20_years(submission, lookup):
+    year_built = int(submission.get("Year Built", 0))
+    return "Yes" if year_built and 2025 - year_built > 20 else "No"
+
+
+def _total_tiv(submission, lookup):
     # Handle Total TIV from various possible sources
-    if not profile.get("Total TIV"):
-        total_tiv = (submission.get("Total Insured Value (USD)") or 
-                     submission.get("Total TIV") or 
-                     get_nested_value(submission, "Total Insured Value (USD)"))
-        profile["Total TIV"] = str(total_tiv) if total_tiv else ""
-
-    # Handle fire protection logic ONLY if LLM didn't extract these values
-    if not profile.get("Sprinkler System (Y/N)"):
-        fire_prot = (submission.get("Fire Protection", "") or 
-                     get_nested_value(submission, "Fire Protection") or "").lower()
-        
-        # Also check COPE.Protection if available
-        cope_protection = get_nested_value(submission, "Protection")
-        if cope_protection:
-            fire_prot += " " + cope_protection.lower()
-        
-        profile["Sprinkler System (Y/N)"] = "Yes" if "sprinkler" in fire_prot else "No"
-
-    if not profile.get("Fire Alarm (Y/N)"):
-        fire_prot = (submission.get("Fire Protection", "") or 
-                     get_nested_value(submission, "Fire Protection") or "").lower()
-        
-        cope_protection = get_nested_value(submission, "Protection")
-        if cope_protection:
-            fire_prot += " " + cope_protection.lower()
-        
-        profile["Fire Alarm (Y/N)"] = "Yes" if "alarm" in fire_prot or "fire alarm" in fire_prot else "No"
-
-    # Handle natural hazard exposure ONLY if LLM didn't extract
-    if not profile.get("Flood Zone (e.g., Zone X, AE)"):
-        hazard = (submission.get("Natural Hazard Exposure", "") or 
-                  get_nested_value(submission, "Natural Hazard Exposure") or "").lower()
-        
-        if "zone ae" in hazard:
-            profile["Flood Zone (e.g., Zone X, AE)"] = "AE"
-        elif "zone x" in hazard:
-            profile["Flood Zone (e.g., Zone X, AE)"] = "X"
-        else:
-            profile["Flood Zone (e.g., Zone X, AE)"] = "Unknown"
-
-    # Handle earthquake exposure ONLY if LLM didn't extract
-    if not profile.get("Earthquake Exposure (Low/Moderate/High or ShakeMap Zone)"):
-        hazard = (submission.get("Natural Hazard Exposure", "") or 
-                  get_nested_value(submission, "Natural Hazard Exposure") or "").lower()
-        
-        if "earthquake" in hazard and "high" in hazard:
-            profile["Earthquake Exposure (Low/Moderate/High or ShakeMap Zone)"] = "High"
-        elif "earthquake" in hazard and "moderate" in hazard:
-            profile["Earthquake Exposure (Low/Moderate/High or ShakeMap Zone)"] = "Moderate"
-        else:
-            profile["Earthquake Exposure (Low/Moderate/High or ShakeMap Zone)"] = "Low"
-
-    # Handle wildfire risk ONLY if LLM didn't extract
-    if not profile.get("Wildfire Risk (Low/Moderate/High or ISO Class)"):
-        hazard = (submission.get("Natural Hazard Exposure", "") or 
-                  get_nested_value(submission, "Natural Hazard Exposure") or "").lower()
-        
-        if "wildfire" in hazard and "high" in hazard:
-            profile["Wildfire Risk (Low/Moderate/High or ISO Class)"] = "High"
-        elif "wildfire" in hazard and "moderate" in hazard:
-            profile["Wildfire Risk (Low/Moderate/High or ISO Class)"] = "Moderate"
-        else:
-            profile["Wildfire Risk (Low/Moderate/High or ISO Class)"] = "Low"
+    total_tiv = (submission.get("Total Insured Value (USD)") or 
+                 submission.get("Total TIV") or 
+                 lookup("Total Insured Value (USD)"))
+    return str(total_tiv) if total_tiv else ""
 
-    # Set default values for required fields if not present
-    if not profile.get("Prior Claims (Y/N)"):
-        profile["Prior Claims (Y/N)"] = submission.get("Prior Claims (Y/N)", "No")
-    if not profile.get("Total Loss Amount"):
-        profile["Total Loss Amount"] = submission.get("Total Loss Amount", "0")
-    if not profile.get("Number of Stories"):
-        profile["Number of Stories"] = submission.get("Number of Stories", "1")
-    
+
+def _sprinkler_system(submission, lookup):
+    return "Yes" if "sprinkler" in _fire_protection_text(submission, lookup) else "No"
+
+
+def _fire_alarm(submission, lookup):
+    fire_prot = _fire_protection_text(submission, lookup)
+    return "Yes" if "alarm" in fire_prot or "fire alarm" in fire_prot else "No"
+
+
+def _flood_zone(submission, lookup):
+    hazard = _hazard_text(submission, lookup)
+    if "zone ae" in hazard:
+        return "AE"
+    elif "zone x" in hazard:
+        return "X"
+    return "Unknown"
+
+
+def _earthquake_exposure(submission, lookup):
+    hazard = _hazard_text(submission, lookup)
+    if "earthquake" in hazard and "high" in hazard:
+        return "High"
+    elif "earthquake" in hazard and "moderate" in hazard:
+        return "Moderate"
+    return "Low"
+
+
+def _wildfire_risk(submission, lookup):
+    hazard = _hazard_text(submission, lookup)
+    if "wildfire" in hazard and "high" in hazard:
+        return "High"
+    elif "wildfire" in hazard and "moderate" in hazard:
+        return "Moderate"
+    return "Low"
+
+
+def _construction_type(submission, lookup):
     # Handle construction type from various sources
-    if not profile.get("Construction Type"):
-        construction = (submission.get("Construction Type") or 
-                       get_nested_value(submission, "Construction") or 
-                       submission.get("COPE", {}).get("Construction") or "")
-        profile["Construction Type"] = construction
-
-    # Handle occupancy type
-    if not profile.get("Occupancy Type"):
-        occupancy = (submission.get("Occupancy Type") or 
-                     get_nested_value(submission, "Occupancy") or "")
-        profile["Occupancy Type"] = occupancy
-
-    # Handle hazardous materials ONLY if LLM didn't extract
-    if not profile.get("Hazardous Materials (Y/N)"):
-        risk_factors = submission.get("Risk Factors", "").lower()
-        profile["Hazardous Materials (Y/N)"] = "Yes" if "hazardous" in risk_factors or "lithium" in risk_factors else "No"
-
-    return profile
+    return (submission.get("Construction Type") or 
+            lookup("Construction") or 
+            submission.get("COPE", {}).get("Construction") or "")
+
+
+def _occupancy_type(submission, lookup):
+    return (submission.get("Occupancy Type") or 
+            lookup("Occupancy") or "")
+
+
+def _hazardous_materials(submission, lookup):
+    risk_factors = submission.get("Risk Factors", "").lower()
+    return "Yes" if "hazardous" in risk_factors or "lithium" in risk_factors else "No"
+
+
+# Fallbacks for fields the submission doesn't state (LLM extraction takes priority);
+# each only runs when its field is empty and, on a lazy profile, first read
+DERIVED_FIELDS = {
+    "Roof > 20 yrs": _roof_over_20_years,
+    "Total TIV": _total_tiv,
+    "Sprinkler System (Y/N)": _sprinkler_system,
+    "Fire Alarm (Y/N)": _fire_alarm,
+    "Flood Zone (e.g., Zone X, AE)": _flood_zone,
+    "Earthquake Exposure (Low/Moderate/High or ShakeMap Zone)": _earthquake_exposure,
+    "Wildfire Risk (Low/Moderate/High or ISO Class)": _wildfire_risk,
+    # Set default values for required fields if not present
+    "Prior Claims (Y/N)": lambda submission, lookup: submission.get("Prior Claims (Y/N)", "No"),
+    "Total Loss Amount": lambda submission, lookup: submission.get("Total Loss Amount", "0"),
+    "Number of Stories": lambda submission, lookup: submission.get("Number of Stories", "1"),
+    "Construction Type": _construction_type,
+    "Occupancy Type": _occupancy_type,
+    "Hazardous Materials (Y/N)": _hazardous_materials,
+}
+
+
+class _FieldResolver:
+    """Derives one profile field at a time from a submission."""
+
+    __slots__ = ("submission", "schema_fields", "lookup")
+
+    def __init__(self, submission, schema_fields):
+        self.submission = submission
+        self.schema_fields = schema_fields
+        # Every field lookup goes through this index instead of re-walking the submission
+        self.lookup = build_field_index(submission).get
+
+    def __call__(self, field):
+        value = ""
+        # Map submission data to profile - PRIORITIZE LLM EXTRACTION
+        if field in self.schema_fields:
+            found = self.lookup(field)
+            if found is not None and found != "":
+                value = found
+        derive = DERIVED_FIELDS.get(field)
+        if derive is not None and not value:
+            value = derive(self.submission, self.lookup)
+        return value
+
+
+# (id(schema), fields) -> (schema, plan); holding the schema keeps its id from being reused
+_plans = {}
+
+
+def _plan(schema, fields):
+    """(schema fields, fields to derive now, fields to leave pending) for a schema and field selection."""
+    key = (id(schema), tuple(fields) if fields is not None else None)
+    cached = _plans.get(key)
+    if cached is not None:
+        return cached[1]
+    # Schema fields in order, then the derived fields the schema doesn't list
+    schema_fields = frozenset(field for section_fields in schema.values() for field in section_fields)
+    profile_fields = list({**{field: None for section_fields in schema.values() for field in section_fields},
+                           **DERIVED_FIELDS})
+    wanted = set(fields) if fields is not None else profile_fields
+    plan = (
+        schema_fields,
+        tuple(field for field in profile_fields if field in wanted),
+        tuple(field for field in profile_fields if field not in wanted),
+    )
+    if len(_plans) >= 64:
+        _plans.clear()
+    _plans[key] = (schema, plan)
+    return plan
+
+
+def _map_submission(submission, schema, fields=None, lazy=False):
+    schema_fields, now, pending = _plan(schema, () if lazy and fields is None else fields)
+    resolve = _FieldResolver(submission, schema_fields)
+    # Values are normalized once here, so nothing downstream re-parses them
+    return RiskProfile([(field, resolve(field)) for field in now], pending=pending, resolve=resolve)
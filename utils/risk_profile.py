@@ -0,0 +1,246 @@
+import json
+import re
+import sys
+from collections.abc import Mapping
+from functools import lru_cache
+
+_UNSET = object()
+
+YES = "Yes"
+NO = "No"
+_YES_NO = {"yes": YES, "y": YES, "true": YES, "no": NO, "n": NO, "false": NO}
+_LEVELS = {"low": "Low", "moderate": "Moderate", "medium": "Moderate", "high": "High", "extreme": "Extreme"}
+_WORD_NUMBERS = {
+    "single": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+_WORD_NUMBER_RE = re.compile(r"\b(" + "|".join(_WORD_NUMBERS) + r")\b", re.IGNORECASE)
+_DIGITS_RE = re.compile(r"\d+")
+_AMOUNT_RE = re.compile(r"^\$?\s*(-?[\d,]*\.?\d+)\s*(k|thousand|m|mm|million|b|bn|billion)?$", re.IGNORECASE)
+_AMOUNT_SCALE = {
+    "k": 1e3, "thousand": 1e3, "m": 1e6, "mm": 1e6, "million": 1e6, "b": 1e9, "bn": 1e9, "billion": 1e9,
+}
+
+
+def _memoized(normalize, limit=10_000):
+    # Books repeat the same strings ("Yes", "Zone AE", "$5,000,000") across many profiles,
+    # so each distinct one is parsed once; the limit bounds memory for free text
+    seen = {}
+
+    def cached(value):
+        if type(value) is not str:
+            return normalize(value)
+        result = seen.get(value, _UNSET)
+        if result is _UNSET:
+            result = normalize(value)
+            if len(seen) < limit:
+                seen[value] = result
+        return result
+
+    return cached
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _whole(number):
+    return int(number) if isinstance(number, float) and number.is_integer() else number
+
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else value
+
+
+def _category(value):
+    # Interned so a million profiles share one copy of each distinct value
+    return sys.intern(value.strip()) if isinstance(value, str) else value
+
+
+def _yes_no(value):
+    if isinstance(value, bool):
+        return YES if value else NO
+    if isinstance(value, str):
+        return _YES_NO.get(value.strip().lower()) or _category(value)
+    return value
+
+
+def _level(value):
+    if isinstance(value, str):
+        return _LEVELS.get(value.strip().lower()) or _category(value)
+    return value
+
+
+def _amount(value):
+    # "$18,000,000", "18000000" and "2.1 million" all become numbers; anything else is kept as written
+    if _blank(value):
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return _whole(value)
+    match = _AMOUNT_RE.match(str(value).strip())
+    if match is None:
+        return _text(value)
+    number = float(match.group(1).replace(",", ""))
+    if match.group(2):
+        number *= _AMOUNT_SCALE[match.group(2).lower()]
+    return _whole(number)
+
+
+def _percent(value):
+    return _amount(value.strip().rstrip("%") if isinstance(value, str) else value)
+
+
+def _count(value):
+    # The first number in the text, falling back to spelled-out counts like "Single-story"
+    # or "Two-story". The rule engine's old string parsing only knew "single" and read
+    # other spelled-out counts as 0, so "more than N stories" rules now see them
+    if _blank(value):
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return _whole(value)
+    numbers = _DIGITS_RE.findall(str(value))
+    if numbers:
+        return int(numbers[0])
+    word = _WORD_NUMBER_RE.search(str(value))
+    if word:
+        return _WORD_NUMBERS[word.group(1).lower()]
+    return _text(value)
+
+
+# (schema field, attribute, normalizer) for every field of data/mvp_risk_profile_schema.json
+FIELDS = (
+    ("Property Address", "property_address", _text),
+    ("Zip Code", "zip_code", _category),
+    ("State", "state", _category),
+    ("Property Name", "property_name", _text),
+    ("Year Built", "year_built", _count),
+    ("Construction Type", "construction_type", _category),
+    ("Roof Type & Age", "roof_type_age", _text),
+    ("Building Area (sq ft)", "building_area", _amount),
+    ("Number of Stories", "stories", _count),
+    ("Occupancy Type", "occupancy_type", _category),
+    ("% Occupied", "percent_occupied", _percent),
+    ("Hazardous Materials (Y/N)", "hazardous_materials", _yes_no),
+    ("Sprinkler System (Y/N)", "sprinkler_system", _yes_no),
+    ("Fire Alarm (Y/N)", "fire_alarm", _yes_no),
+    ("Building TIV", "building_tiv", _amount),
+    ("Contents TIV", "contents_tiv", _amount),
+    ("BI/EE", "bi_ee", _amount),
+    ("Total TIV", "total_tiv", _amount),
+    ("Prior Claims (Y/N)", "prior_claims", _yes_no),
+    ("Number of Claims", "number_of_claims", _count),
+    ("Total Loss Amount", "total_loss_amount", _amount),
+    ("Flood Zone (e.g., Zone X, AE)", "flood_zone", _category),
+    ("Wildfire Risk (Low/Moderate/High or ISO Class)", "wildfire_risk", _level),
+    ("Earthquake Exposure (Low/Moderate/High or ShakeMap Zone)", "earthquake_exposure", _level),
+    ("Roof > 20 yrs", "roof_over_20_years", _yes_no),
+    ("No sprinklers", "no_sprinklers", _yes_no),
+    ("Next to high-hazard operations", "next_to_high_hazard", _yes_no),
+    ("Flood Zone AE", "flood_zone_ae", _yes_no),
+)
+RED_FLAGS = "Red Flags"
+_ATTRIBUTES = {field: attribute for field, attribute, _ in FIELDS}
+_SETTERS = {field: (attribute, _memoized(normalize)) for field, attribute, normalize in FIELDS}
+
+
+@lru_cache(maxsize=64)
+def _pending_attributes(fields):
+    pending = {_ATTRIBUTES[field]: field for field in fields if field in _ATTRIBUTES}
+    return pending, tuple(field for field in fields if field not in _ATTRIBUTES)
+
+
+class RiskProfile(Mapping):
+    """A mapped risk profile with one slot per schema field, normalized once when set.
+
+    TIV and loss amounts, areas and counts hold numbers (None when empty), Y/N
+    fields hold "Yes"/"No" and hazard levels "Low"/"Moderate"/"High"; a value
+    that doesn't parse is kept as written. Fields outside FIELDS go to `extra`.
+    It reads like the old dict (profile["Total TIV"], profile.get(...)), and
+    to_dict()/to_json() give the JSON view, where empty numbers show as "".
+
+    `pending` fields are only computed, with resolve(field), the first time
+    they are read; iterating or to_dict() computes whatever is left.
+    """
+
+    __slots__ = tuple(attribute for _, attribute, _ in FIELDS) + ("red_flags", "extra", "_pending", "_resolve")
+
+    def __init__(self, values=(), pending=(), resolve=None):
+        self.extra = None
+        self._pending = None
+        for field, value in (values.items() if isinstance(values, Mapping) else values):
+            setter = _SETTERS.get(field)
+            if setter is not None:
+                setattr(self, setter[0], setter[1](value))
+            else:
+                self[field] = value
+        if pending:
+            # Shared by every profile with the same pending fields; a field counts
+            # as derived once its slot is set, so nothing here is per-profile
+            self._pending, extras = _pending_attributes(tuple(pending))
+            self._resolve = resolve
+            for field in extras:
+                # Extra fields live in a dict, so they are resolved straight away
+                self[field] = resolve(field)
+
+    def __getattr__(self, attribute):
+        # Only reached for unset slots: absent fields, or pending ones not derived yet
+        if attribute.startswith("_") or not self._pending or attribute not in self._pending:
+            raise AttributeError(attribute)
+        field = self._pending[attribute]
+        value = _SETTERS[field][1](self._resolve(field))
+        setattr(self, attribute, value)
+        return value
+
+    def __setitem__(self, field, value):
+        setter = _SETTERS.get(field)
+        if setter is not None:
+            setattr(self, setter[0], setter[1](value))
+        elif field == RED_FLAGS:
+            self.red_flags = value
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[field] = value
+
+    def __getitem__(self, field):
+        value = self.get(field, _UNSET)
+        if value is _UNSET:
+            raise KeyError(field)
+        return value
+
+    def get(self, field, default=None):
+        attribute = _ATTRIBUTES.get(field)
+        if attribute is not None:
+            return getattr(self, attribute, default)
+        if field == RED_FLAGS:
+            return getattr(self, "red_flags", default)
+        return self.extra.get(field, default) if self.extra else default
+
+    def __contains__(self, field):
+        return self.get(field, _UNSET) is not _UNSET
+
+    def __iter__(self):
+        for field, attribute, _ in FIELDS:
+            if hasattr(self, attribute):
+                yield field
+        if self.extra:
+            yield from self.extra
+        if hasattr(self, "red_flags"):
+            yield RED_FLAGS
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"RiskProfile({self.to_dict()!r})"
+
+    def to_dict(self, fields=None):
+        """The JSON view of every field, or of just `fields` (in that order) when given."""
+        if fields is not None:
+            items = ((field, self.get(field)) for field in fields if field in self)
+        else:
+            items = self.items()
+        return {field: "" if value is None else value for field, value in items}
+
+    def to_json(self, fields=None, **kwargs):
+        return json.dumps(self.to_dict(fields), **kwargs)
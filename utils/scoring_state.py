@@ -0,0 +1,291 @@
+import hashlib
+import json
+import os
+import sqlite3
+from collections import Counter
+from functools import lru_cache
+from itertools import islice
+
+from utils import red_flag_engine, risk_mapper, risk_profile
+from utils.red_flag_engine import compile_rules, evaluate_rules_batch
+from utils.risk_mapper import generate_risk_profile
+from utils.risk_profile import RiskProfile
+
+DEFAULT_STATE_PATH = "output/scoring_state.sqlite"
+CHUNK_SIZE = 1000
+
+
+def content_hash(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=1)
+def code_fingerprint():
+    # Stored results are only valid for the mapper and engine code that produced them
+    digest = hashlib.sha256()
+    for module in (risk_mapper, risk_profile, red_flag_engine):
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def rule_id(rule):
+    # Rewording a description doesn't change which profiles a rule matches
+    return content_hash([rule.field, rule.condition])[:16]
+
+
+def submission_key(submission):
+    # Without an ID the property's name and address identify it, so inserting or
+    # reordering submissions doesn't change any other submission's key; failing
+    # those, only an unchanged submission can be recognised, by its content
+    for field in ("Submission ID", "id"):
+        if submission.get(field) not in (None, ""):
+            return str(submission[field])
+    name = submission.get("Property Name")
+    address = submission.get("Property Address") or submission.get("Location")
+    if isinstance(address, dict):
+        address = ", ".join(str(value) for value in address.values() if value not in (None, ""))
+    if name not in (None, "") and address not in (None, ""):
+        return f"{name} | {address}"
+    return f"sha256:{content_hash(submission)[:16]}"
+
+
+def _unique_keys(submissions):
+    # A repeated key (the same property listed twice) gets its occurrence number
+    seen = Counter()
+    for submission in submissions:
+        key = submission_key(submission)
+        seen[key] += 1
+        yield (key if seen[key] == 1 else f"{key} #{seen[key]}"), submission
+
+
+class RescoreReport:
+    def __init__(self):
+        self.new_submissions = 0
+        self.changed_submissions = 0
+        self.unchanged_submissions = 0
+        self.removed_submissions = 0
+        self.rules_added = []
+        self.rules_removed = []
+        self.rules_changed = []
+        self.pairs_evaluated = 0
+        self.pairs_total = 0
+        # submission key -> (flags added, flags removed)
+        self.flag_changes = {}
+
+    def summary(self):
+        lines = [
+            f"Submissions: {self.new_submissions} new, {self.changed_submissions} changed, "
+            f"{self.unchanged_submissions} unchanged, {self.removed_submissions} removed",
+            f"Rules: {len(self.rules_added)} added, {len(self.rules_removed)} removed, "
+            f"{len(self.rules_changed)} changed",
+            f"Evaluated {self.pairs_evaluated:,} of {self.pairs_total:,} (submission, rule) pairs",
+            f"Flags changed on {len(self.flag_changes)} submissions",
+        ]
+        for field in self.rules_changed:
+            lines.append(f"  rule changed: {field}")
+        return "\n".join(lines)
+
+
+class ScoringState:
+    """Scoring results persisted between runs so only changed submissions and rules are re-evaluated.
+
+    Stores each submission's content hash, mapped profile and matched rule ids
+    (space-separated), keyed by submission key, alongside the rule set and
+    schema they were scored with. Each row also keeps its position in the book
+    of the latest full run, so rules-only passes write profiles in book order.
+    A different schema or mapper/engine code (code_fingerprint()) than the
+    stored results were made with re-maps and re-scores every submission.
+    """
+
+    def __init__(self, path=DEFAULT_STATE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS rules (
+                rule_id TEXT PRIMARY KEY, position INTEGER NOT NULL, field TEXT NOT NULL, message TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS submissions (
+                submission_key TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                profile TEXT NOT NULL,
+                matched TEXT NOT NULL,
+                run INTEGER NOT NULL,
+                position INTEGER
+            );
+            """
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(submissions)")}
+        if "position" not in columns:
+            # State files from before positions were kept fall back to insertion order
+            with self._db:
+                self._db.execute("ALTER TABLE submissions ADD COLUMN position INTEGER")
+                self._db.execute("UPDATE submissions SET position = rowid")
+        self._db.execute("CREATE INDEX IF NOT EXISTS submissions_position ON submissions (position)")
+
+    def _meta(self, key, default=None):
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def close(self):
+        self._db.close()
+
+    def rescore(self, submissions, schema, rules, writer=None):
+        """Bring the stored results up to date and return a RescoreReport.
+
+        `submissions` is an iterable of submission dicts; submissions missing from
+        it are dropped from the state. Pass None to re-apply an edited rule set to
+        the stored profiles without re-reading the book. Scored profiles (with
+        "Red Flags") are passed to `writer.write_many` if a writer is given.
+        """
+        compiled = compile_rules(rules)
+        ids = [rule_id(rule) for rule in compiled]
+        messages = {rid: rule.message for rid, rule in zip(ids, compiled)}
+        old_rules = {row[0]: (row[1], row[2]) for row in self._db.execute("SELECT rule_id, field, message FROM rules")}
+
+        report = RescoreReport()
+        added = [rid for rid in ids if rid not in old_rules]
+        removed = [rid for rid in old_rules if rid not in messages]
+        report.rules_added = [messages[rid] for rid in added]
+        report.rules_removed = [old_rules[rid][1] for rid in removed]
+        added_fields = {compiled[ids.index(rid)].field for rid in added}
+        report.rules_changed = sorted(added_fields & {old_rules[rid][0] for rid in removed})
+        added_rules = tuple(rule for rid, rule in zip(ids, compiled) if rid in set(added))
+
+        schema_hash = content_hash(schema)
+        code_hash = code_fingerprint()
+        stored_schema_hash = self._meta("schema_hash")
+        # State files from before the code fingerprint was kept count as stale too
+        remap = stored_schema_hash is not None and (
+            stored_schema_hash != schema_hash or self._meta("code_hash") != code_hash)
+        run = int(self._meta("run", 0)) + 1
+        if submissions is None and remap:
+            raise ValueError(
+                "schema or scoring code changed since the last run; pass the submissions so they can be re-mapped")
+
+        old_messages = {rid: message for rid, (_, message) in old_rules.items()}
+        # Row run numbers mark which submissions the latest full run saw; a
+        # rules-only pass leaves them alone
+        row_run = run if submissions is not None else None
+        context = (compiled, ids, messages, old_messages, added_rules, schema, remap, row_run)
+        with self._db:
+            if submissions is None:
+                # Paged by book position rather than one open cursor, since each page is rewritten as it goes
+                last_position = -1
+                while True:
+                    batch = self._db.execute(
+                        "SELECT submission_key, content_hash, profile, matched, run, position FROM submissions "
+                        "WHERE position > ? ORDER BY position LIMIT ?", (last_position, CHUNK_SIZE)
+                    ).fetchall()
+                    if not batch:
+                        break
+                    last_position = batch[-1][5]
+                    items = [(key, None, content, position) for key, content, _, _, _, position in batch]
+                    stored = {row[0]: row[1:] for row in batch}
+                    self._score_chunk(items, stored, context, report, writer)
+            else:
+                numbered = ((key, submission, position)
+                            for position, (key, submission) in enumerate(_unique_keys(submissions)))
+                while True:
+                    chunk = list(islice(numbered, CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    keys = [key for key, _, _ in chunk]
+                    placeholders = ",".join("?" * len(keys))
+                    stored = {
+                        row[0]: row[1:] for row in self._db.execute(
+                            "SELECT submission_key, content_hash, profile, matched, run, position FROM submissions "
+                            f"WHERE submission_key IN ({placeholders})", keys)
+                    }
+                    items = [(key, submission, content_hash(submission), position)
+                             for key, submission, position in chunk]
+                    self._score_chunk(items, stored, context, report, writer)
+                report.removed_submissions = self._db.execute(
+                    "DELETE FROM submissions WHERE run != ?", (run,)
+                ).rowcount
+
+            self._db.execute("DELETE FROM rules")
+            self._db.executemany(
+                "INSERT INTO rules (rule_id, position, field, message) VALUES (?, ?, ?, ?)",
+                [(rid, position, rule.field, rule.message) for position, (rid, rule) in enumerate(zip(ids, compiled))],
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [("schema_hash", schema_hash), ("code_hash", code_hash), ("run", str(run))],
+            )
+        return report
+
+    def _score_chunk(self, items, stored, context, report, writer):
+        compiled, ids, messages, old_messages, added_rules, schema, remap, row_run = context
+        fresh, reused = [], []
+        profiles = {}
+        positions = {}
+        for key, submission, digest, position in items:
+            positions[key] = position
+            previous = stored.get(key)
+            if previous is not None and previous[0] == digest and not remap:
+                reused.append((key, digest, previous[1], set(previous[2].split())))
+                report.unchanged_submissions += 1
+            else:
+                profiles[key] = generate_risk_profile(submission, schema)
+                fresh.append((key, digest, profiles[key].to_json(), set()))
+                if previous is None:
+                    report.new_submissions += 1
+                else:
+                    report.changed_submissions += 1
+
+        # Stored profiles are only decoded when a new rule or the writer needs them
+        if writer is not None or added_rules:
+            for key, _, profile_json, _ in reused:
+                profiles[key] = RiskProfile(json.loads(profile_json))
+
+        # Changed submissions get every rule, unchanged ones only the rules that are new
+        for entries, rules in ((fresh, compiled), (reused, added_rules)):
+            if not entries or not rules:
+                continue
+            matrix = evaluate_rules_batch([profiles[key] for key, _, _, _ in entries], rules)
+            rule_ids = [rule_id(rule) for rule in rules]
+            for (_, _, _, matched), row in zip(entries, matrix.tolist()):
+                matched.update(rid for rid, hit in zip(rule_ids, row) if hit)
+            report.pairs_evaluated += matrix.size
+        report.pairs_total += len(items) * len(compiled)
+
+        inserts, updates, scored = [], [], []
+        for entries, is_fresh in ((fresh, True), (reused, False)):
+            for key, digest, profile_json, matched in entries:
+                flags = [messages[rid] for rid in ids if rid in matched]
+                previous = stored.get(key)
+                old_matched = previous[2].split() if previous is not None else []
+                old_flags = [old_messages[rid] for rid in old_matched if rid in old_messages]
+                if set(flags) != set(old_flags):
+                    report.flag_changes[key] = (
+                        [flag for flag in flags if flag not in old_flags],
+                        [flag for flag in old_flags if flag not in flags],
+                    )
+                matched_ids = " ".join(rid for rid in ids if rid in matched)
+                position = positions[key]
+                if is_fresh:
+                    inserts.append((key, digest, profile_json, matched_ids, row_run, position))
+                elif row_run is None:
+                    if matched_ids != previous[2]:
+                        updates.append((matched_ids, previous[3], position, key))
+                elif matched_ids != previous[2] or previous[3] != row_run or previous[4] != position:
+                    updates.append((matched_ids, row_run, position, key))
+                if writer is not None:
+                    profiles[key]["Red Flags"] = flags
+                    scored.append(profiles[key])
+        self._db.executemany(
+            "INSERT OR REPLACE INTO submissions (submission_key, content_hash, profile, matched, run, position) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            inserts,
+        )
+        self._db.executemany(
+            "UPDATE submissions SET matched = ?, run = ?, position = ? WHERE submission_key = ?", updates
+        )
+        if writer is not None:
+            writer.write_many(scored)